@@ -6,30 +6,174 @@ Simulating akinetopsia by disrupting motion perception.
 Libraries required:
     - OpenCV (cv2)
     - NumPy
-    - TensorFlow
+    - TensorFlow (optional, only for markov_chain_update_tf)
 
 Ensure you have installed these via:
-    pip install opencv-python numpy tensorflow
+    pip install opencv-python numpy
+
+Usage:
+    python markov.py                          # interactive preview of input_video.mp4
+    python markov.py in.mp4 -o out.mp4        # headless: write the flow video
+    python markov.py a.mp4 b.mp4 -o out_dir --processes 2 --threads 4
 """
 
+import argparse
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import cv2
 import numpy as np
-import tensorflow as tf  # For an alternative MCMC (Markov chain) state update
+
+# Transition matrix [from_state][to_state]:
+# State 0: Normal optical flow processing.
+# State 1: Disrupted processing (simulate akinetopsia).
+# When in normal state, 90% chance to remain normal, 10% to disrupt.
+# In disrupted state, a 60% chance to return to normal, 40% to remain disrupted.
+DEFAULT_TRANSITION_MATRIX = [[0.9, 0.1],
+                             [0.6, 0.4]]
+
+# Saccadic masking: optical flow is computed only every N frames.
+DEFAULT_FLOW_INTERVAL = 5
 
 # ---------------------------
 # Markov Chain state update
 # ---------------------------
 
-def markov_chain_update_numpy(state, transition_matrix):
+def _as_transition_matrix(transition_matrix):
+    """
+    Validate an N x N row-stochastic transition matrix.
+    transition_matrix: nested lists or array, row i = P(next state | state i).
+    Returns the matrix as a float array.
+    """
+    matrix = np.asarray(transition_matrix, dtype=np.float64)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"Expected a square transition matrix, got shape {matrix.shape}")
+    if np.any(matrix < 0) or not np.allclose(matrix.sum(axis=1), 1.0):
+        raise ValueError("Transition matrix rows must be probabilities summing to 1")
+    return matrix
+
+def _cumulative_rows(matrix):
+    """Cumulative transition rows, with the last column pinned to exactly 1."""
+    cumulative = np.cumsum(matrix, axis=1)
+    cumulative[:, -1] = 1.0
+    return cumulative
+
+def sample_trajectory(transition_matrix, n_steps, initial_state=0, rng=None):
+    """
+    Sample a whole state trajectory in one vectorized pass.
+    transition_matrix: N x N row-stochastic matrix.
+    n_steps: number of transitions to sample.
+    initial_state: state before the first transition.
+    rng: np.random.Generator or seed (None for a fresh generator).
+    Returns an int array with the states after each of the n_steps transitions.
+
+    All uniforms are drawn at once and turned into one "next state" table per
+    step (for every possible current state) by searching the cumulative rows.
+    Composing those tables is associative, so the state after every step comes
+    from a parallel prefix scan of log2(n_steps) fancy-indexing passes instead
+    of a Python loop over frames.
+    """
+    matrix = _as_transition_matrix(transition_matrix)
+    rng = np.random.default_rng(rng)
+    n_states = matrix.shape[0]
+    if not 0 <= initial_state < n_states:
+        raise ValueError(f"initial_state must be in [0, {n_states}), got {initial_state}")
+    if n_steps <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    cumulative = _cumulative_rows(matrix)
+    uniforms = rng.random(n_steps)
+    # steps[t, s]: state after step t when in state s before it.
+    steps = np.empty((n_steps, n_states), dtype=np.intp)
+    for state in range(n_states):
+        steps[:, state] = np.searchsorted(cumulative[state], uniforms, side="right")
+
+    # Inclusive scan: after the pass with stride d, steps[t] maps the state
+    # before step max(t - 2d + 1, 0) to the state after step t.
+    stride = 1
+    while stride < n_steps:
+        steps[stride:] = np.take_along_axis(steps[stride:], steps[:-stride], axis=1)
+        stride *= 2
+    return steps[:, initial_state]
+
+def iter_trajectory(transition_matrix, block_size=1024, initial_state=0, rng=None):
+    """
+    Endlessly yield blocks of a state trajectory, for streams of unknown length.
+    Each block continues the chain from the last state of the previous one.
+    Arguments are checked here, before the first block is drawn.
+    """
+    if block_size < 1:
+        raise ValueError(f"block_size must be at least 1, got {block_size}")
+    matrix = _as_transition_matrix(transition_matrix)
+    return _trajectory_blocks(matrix, block_size, initial_state, np.random.default_rng(rng))
+
+def _trajectory_blocks(matrix, block_size, state, rng):
+    """Generator behind iter_trajectory."""
+    while True:
+        block = sample_trajectory(matrix, block_size, state, rng)
+        state = int(block[-1])
+        yield block
+
+def stationary_distribution(transition_matrix):
+    """
+    Stationary distribution pi of the chain, with pi P = pi and sum(pi) = 1.
+    Returns a length-N array (the least-squares solution if it is not unique).
+    """
+    matrix = _as_transition_matrix(transition_matrix)
+    n_states = matrix.shape[0]
+    system = np.vstack([matrix.T - np.eye(n_states), np.ones(n_states)])
+    target = np.zeros(n_states + 1)
+    target[-1] = 1.0
+    pi = np.linalg.lstsq(system, target, rcond=None)[0]
+    pi = np.clip(pi, 0.0, None)
+    return pi / pi.sum()
+
+def dwell_times(transition_matrix):
     """
-    Update the current state using NumPy-based random choice.
+    Expected number of consecutive frames spent in each state per visit,
+    1 / (1 - P[i, i]) (infinite for absorbing states).
+    """
+    stay = np.diag(_as_transition_matrix(transition_matrix))
+    with np.errstate(divide="ignore"):
+        return 1.0 / (1.0 - stay)
+
+def run_lengths(trajectory):
+    """
+    Split a trajectory into runs of a repeated state.
+    Returns (states, lengths): the state and length of every run, in order.
+    """
+    trajectory = np.asarray(trajectory)
+    if trajectory.size == 0:
+        return trajectory[:0], np.empty(0, dtype=np.intp)
+    starts = np.flatnonzero(np.diff(trajectory)) + 1
+    starts = np.concatenate([[0], starts])
+    lengths = np.diff(np.concatenate([starts, [trajectory.size]]))
+    return trajectory[starts], lengths
+
+def frame_states(transition_matrix, initial_state=0, rng=None, block_size=1024):
+    """
+    Yield the chain state of each frame, from trajectory blocks sampled ahead.
+    """
+    for block in iter_trajectory(transition_matrix, block_size, initial_state, rng):
+        yield from block.tolist()
+
+def markov_chain_update_numpy(state, transition_matrix, rng=None):
+    """
+    Update the current state with a single draw.
     state: current state index (0: normal, 1: disrupted)
     transition_matrix: list of lists with row [P(normal), P(disrupted)]
+    rng: optional np.random.Generator.
     Returns the next state.
+
+    Prefer sample_trajectory for whole runs; this is for one-off updates.
     """
-    probabilities = transition_matrix[state]
-    next_state = np.random.choice([0, 1], p=probabilities)
-    return next_state
+    rng = np.random.default_rng(rng)
+    cumulative = np.cumsum(transition_matrix[state])
+    next_state = int(np.searchsorted(cumulative, rng.random() * cumulative[-1], side="right"))
+    return min(next_state, len(cumulative) - 1)
 
 def markov_chain_update_tf(state, transition_matrix):
     """
@@ -37,7 +181,12 @@ def markov_chain_update_tf(state, transition_matrix):
     state: current state (0 or 1)
     transition_matrix: list of lists with row [P(normal), P(disrupted)]
     Returns the next state (as int).
+
+    TensorFlow is imported here rather than at module load, since it is only
+    needed for this alternative and adds seconds of startup.
     """
+    import tensorflow as tf
+
     # Convert the probability row to a tensor and take the log
     probs = tf.constant(transition_matrix[state], dtype=tf.float32)
     # tf.random.categorical expects a 2D tensor; sample 1 value.
@@ -83,13 +232,258 @@ def flow_to_rgb(flow):
     rgb = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
     return rgb
 
+# ---------------------------
+# Stateful Flow Engine
+# ---------------------------
+
+class FlowEngine:
+    """
+    Optical flow and its colour visualization with preallocated buffers.
+
+    Farneback flow is computed at `scale` times the frame resolution and
+    upsampled to full resolution, and is warm-started from the previous flow
+    with OPTFLOW_USE_INITIAL_FLOW. The colour mapping of flow_to_rgb writes
+    into a preallocated HSV image whose saturation plane is filled once.
+    Returned arrays are internal buffers, overwritten by the next call; an
+    engine is therefore not thread-safe, and callers that keep results must
+    copy them (or pass `out`).
+    """
+
+    def __init__(self, shape, scale=1.0, warm_start=True, pyr_scale=0.5, levels=3,
+                 winsize=15, iterations=3, poly_n=5, poly_sigma=1.2):
+        height, width = shape[:2]
+        if not 0 < scale <= 1:
+            raise ValueError(f"scale must be in (0, 1], got {scale}")
+        self.shape = (height, width)
+        self.scale = scale
+        self.warm_start = warm_start
+        self.params = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+        small = (max(1, int(round(height * scale))), max(1, int(round(width * scale))))
+        self._resize = small != self.shape
+        self._small_size = (small[1], small[0])  # cv2 sizes are (width, height)
+        self._prev_small = np.empty(small, dtype=np.uint8)
+        self._curr_small = np.empty(small, dtype=np.uint8)
+        self._last_curr = None
+        self._small_flow = np.zeros(small + (2,), dtype=np.float32)
+        self._has_flow = False
+        self._flow = np.zeros((height, width, 2), dtype=np.float32)
+        self.zero_flow = np.zeros((height, width, 2), dtype=np.float32)
+        self.zero_flow.setflags(write=False)
+        # Colour mapping buffers.
+        self._fx = np.empty((height, width), dtype=np.float32)
+        self._fy = np.empty((height, width), dtype=np.float32)
+        self._magnitude = np.empty((height, width), dtype=np.float32)
+        self._angle = np.empty((height, width), dtype=np.float32)
+        self._hue = np.empty((height, width), dtype=np.uint8)
+        self._saturation = np.full((height, width), 255, dtype=np.uint8)
+        self._value = np.empty((height, width), dtype=np.uint8)
+        self._hsv = np.empty((height, width, 3), dtype=np.uint8)
+        self._bgr = np.empty((height, width, 3), dtype=np.uint8)
+
+    def reset(self):
+        """Forget the previous flow and frame (e.g. after a scene cut)."""
+        self._has_flow = False
+        self._last_curr = None
+
+    def _downscale(self, gray, dst):
+        if not self._resize:
+            np.copyto(dst, gray)
+        else:
+            cv2.resize(gray, self._small_size, dst=dst, interpolation=cv2.INTER_AREA)
+
+    def compute(self, prev_gray, curr_gray):
+        """
+        Dense Farneback flow from prev_gray to curr_gray at full resolution.
+        When prev_gray is the curr_gray of the previous call, its downscaled
+        copy is reused.
+        """
+        if prev_gray is self._last_curr:
+            self._prev_small, self._curr_small = self._curr_small, self._prev_small
+        else:
+            self._downscale(prev_gray, self._prev_small)
+        self._downscale(curr_gray, self._curr_small)
+        self._last_curr = curr_gray
+
+        flags = cv2.OPTFLOW_USE_INITIAL_FLOW if self.warm_start and self._has_flow else 0
+        cv2.calcOpticalFlowFarneback(self._prev_small, self._curr_small, self._small_flow,
+                                     *self.params, flags)
+        self._has_flow = True
+        if not self._resize:
+            np.copyto(self._flow, self._small_flow)
+        else:
+            cv2.resize(self._small_flow, (self.shape[1], self.shape[0]), dst=self._flow,
+                       interpolation=cv2.INTER_LINEAR)
+            # Displacements are in pixels of the downscaled frame.
+            np.multiply(self._flow, 1.0 / self.scale, out=self._flow)
+        return self._flow
+
+    def to_bgr(self, flow, out=None):
+        """
+        Colour visualization of a flow field, matching flow_to_rgb: hue
+        encodes direction and value the min-max normalized magnitude.
+        """
+        cv2.split(flow, [self._fx, self._fy])
+        cv2.cartToPolar(self._fx, self._fy, self._magnitude, self._angle, angleInDegrees=True)
+        cv2.normalize(self._magnitude, self._magnitude, 0, 255, cv2.NORM_MINMAX)
+        # convertScaleAbs rounds; the -0.5 offset truncates instead, as
+        # assigning floats to the uint8 HSV image in flow_to_rgb does.
+        cv2.convertScaleAbs(self._angle, self._hue, 0.5, -0.5)
+        cv2.convertScaleAbs(self._magnitude, self._value, 1.0, -0.5)
+        cv2.merge([self._hue, self._saturation, self._value], self._hsv)
+        out = self._bgr if out is None else out
+        return cv2.cvtColor(self._hsv, cv2.COLOR_HSV2BGR, out)
+
+# ---------------------------
+# Headless Video Pipeline
+# ---------------------------
+
+def render_flow_frame(prev_gray, curr_gray, state, engine=None):
+    """
+    Flow visualization of one keyframe: Farneback flow in the normal state,
+    zero flow (no motion perceived) in the disrupted state.
+    engine: optional FlowEngine whose buffers and settings are used.
+    Returns a new BGR image to write to the output video.
+    """
+    if engine is None:
+        if state == 0:
+            flow = compute_optical_flow(prev_gray, curr_gray)
+        else:
+            flow = np.zeros(curr_gray.shape + (2,), dtype=np.float32)
+        return flow_to_rgb(flow)
+    flow = engine.compute(prev_gray, curr_gray) if state == 0 else engine.zero_flow
+    return engine.to_bgr(flow, out=np.empty(curr_gray.shape + (3,), dtype=np.uint8))
+
+def _decode_frames(cap, frames, pool, render, transition_matrix, interval, seed, stop):
+    """
+    Decoder stage: read and convert frames, and submit keyframe render jobs
+    to the thread pool. Puts one future per output frame on the bounded queue
+    (frames between keyframes reuse the keyframe's future), then None.
+    """
+    try:
+        ret, frame = cap.read()
+        if not ret:
+            raise IOError("Unable to read the first frame")
+        prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        states = frame_states(transition_matrix, rng=seed)
+        frame_count = 0
+        job = None
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            curr_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            state = next(states)
+            if frame_count % interval == 0:
+                job = pool.submit(render, prev_gray, curr_gray, state)
+            frames.put(job)
+            prev_gray = curr_gray
+            frame_count += 1
+    except Exception as error:
+        frames.put(error)
+    finally:
+        frames.put(None)
+
+def process_video(input_path, output_path, threads=None, interval=DEFAULT_FLOW_INTERVAL,
+                  transition_matrix=DEFAULT_TRANSITION_MATRIX, seed=None,
+                  queue_size=64, fourcc="mp4v", scale=1.0):
+    """
+    Simulate akinetopsia on a video file without a display.
+    Decoding runs in its own thread, Farneback flow and colourization of the
+    keyframes run across a thread pool (OpenCV releases the GIL), and frames
+    are encoded with cv2.VideoWriter in frame order. The stages are connected
+    by a bounded queue, so memory stays flat on long videos. Each flow
+    thread has its own FlowEngine at the given scale; flow is warm-started
+    only with a single thread, where keyframes are processed in order and
+    the output is reproducible.
+    Returns a dict with the input and output paths, frames written, seconds
+    and frames per second.
+    """
+    threads = threads or os.cpu_count() or 1
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {input_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    engines = threading.local()
+
+    def render(prev_gray, curr_gray, state):
+        engine = getattr(engines, "engine", None)
+        if engine is None:
+            engine = engines.engine = FlowEngine(curr_gray.shape, scale=scale,
+                                                 warm_start=threads == 1)
+        return render_flow_frame(prev_gray, curr_gray, state, engine)
+
+    writer = None
+    n_frames = 0
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        decoder = threading.Thread(
+            target=_decode_frames,
+            args=(cap, frames, pool, render, transition_matrix, interval, seed, stop),
+            daemon=True,
+        )
+        decoder.start()
+        try:
+            while True:
+                job = frames.get()
+                if job is None:
+                    break
+                if isinstance(job, Exception):
+                    raise job
+                image = job.result()
+                if writer is None:
+                    height, width = image.shape[:2]
+                    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc),
+                                             fps, (width, height))
+                    if not writer.isOpened():
+                        raise IOError(f"Could not open video writer: {output_path}")
+                writer.write(image)
+                n_frames += 1
+        finally:
+            # Unblock the decoder if the writer stopped early.
+            stop.set()
+            while decoder.is_alive():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            cap.release()
+            if writer is not None:
+                writer.release()
+
+    seconds = time.perf_counter() - start
+    return {"input": input_path, "output": output_path, "frames": n_frames,
+            "seconds": seconds, "fps": n_frames / seconds if seconds > 0 else 0.0}
+
+def _process_video_job(args):
+    input_path, output_path, kwargs = args
+    return process_video(input_path, output_path, **kwargs)
+
+def process_videos(input_paths, output_paths, processes=1, **kwargs):
+    """
+    Batch-process many videos, one video per worker process.
+    kwargs are passed to process_video (threads is per process, and by
+    default the cores are shared out between the worker processes).
+    Returns the process_video results in input order.
+    """
+    jobs = [(i, o, kwargs) for i, o in zip(input_paths, output_paths)]
+    if processes <= 1 or len(jobs) <= 1:
+        return [_process_video_job(job) for job in jobs]
+    processes = min(processes, len(jobs))
+    if kwargs.get("threads") is None:
+        threads = max(1, (os.cpu_count() or 1) // processes)
+        jobs = [(i, o, dict(kwargs, threads=threads)) for i, o, _ in jobs]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_process_video_job, jobs))
+
 # ---------------------------
 # Main Processing Loop
 # ---------------------------
 
-def main():
-    # Video input file (update with your video source)
-    video_path = 'input_video.mp4'
+def main(video_path='input_video.mp4', seed=None, scale=1.0):
+    # Interactive preview; use the command line options for headless output.
     cap = cv2.VideoCapture(video_path)
     
     if not cap.isOpened():
@@ -103,25 +497,22 @@ def main():
 
     # Convert the first frame to grayscale
     prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    engine = FlowEngine(prev_gray.shape, scale=scale)
 
-    # Initialize Markov chain parameters:
-    # State 0: Normal optical flow processing.
-    # State 1: Disrupted processing (simulate akinetopsia).
-    current_state = 0
-    # Transition matrix [from_state][to_state]:
-    # For example, when in normal state, 90% chance to remain normal, 10% to disrupt.
-    # In disrupted state, a 60% chance to return to normal, 40% to remain disrupted.
-    transition_matrix = [[0.9, 0.1],
-                         [0.6, 0.4]]
-
-    # Saccadic masking: Compute optical flow only every N frames.
-    optical_flow_interval = 5
-    last_flow = None
+    # Initialize Markov chain parameters (see DEFAULT_TRANSITION_MATRIX).
+    transition_matrix = DEFAULT_TRANSITION_MATRIX
+    optical_flow_interval = DEFAULT_FLOW_INTERVAL
+    rgb_flow = None
     frame_count = 0
 
-    # Choose which state update function to use:
-    use_tensorflow_update = False  # Set True to use TensorFlow-based update.
-    
+    # Pre-sample the state trajectory in blocks; the frame count of a stream
+    # is not known up front, so each block continues from the previous one.
+    states = frame_states(transition_matrix, rng=seed)
+    print("Stationary distribution (normal, disrupted):",
+          stationary_distribution(transition_matrix))
+    print("Expected dwell times in frames (normal, disrupted):",
+          dwell_times(transition_matrix))
+
     print("Processing video for simulated akinetopsia...")
     while cap.isOpened():
         ret, frame = cap.read()
@@ -131,33 +522,24 @@ def main():
         # Convert current frame to grayscale
         curr_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
-        # Update state using Markov chain.
-        if use_tensorflow_update:
-            current_state = markov_chain_update_tf(current_state, transition_matrix)
-        else:
-            current_state = markov_chain_update_numpy(current_state, transition_matrix)
+        # Look up this frame's state in the precomputed Markov trajectory.
+        current_state = next(states)
         
         # Determine if optical flow is computed on this frame (saccadic masking)
         if frame_count % optical_flow_interval == 0:
             if current_state == 0:
                 # Normal: compute optical flow normally.
-                flow = compute_optical_flow(prev_gray, curr_gray)
+                flow = engine.compute(prev_gray, curr_gray)
             else:
                 # Disrupted: simulate a breakdown.
                 # Option 1: set the flow to zeros (i.e. no motion detected).
-                flow = np.zeros((curr_gray.shape[0], curr_gray.shape[1], 2), dtype=np.float32)
-                # Option 2: Alternatively, you could use the previous valid flow:
-                # flow = last_flow if last_flow is not None else compute_optical_flow(prev_gray, curr_gray)
+                flow = engine.zero_flow
+                # Option 2: Alternatively, you could keep the previous valid flow.
                 # Option 3: Or add noise to simulate erratic motion perception.
-        else:
-            # Between intervals, re-use the last computed flow (simulating saccadic masking)
-            flow = last_flow if last_flow is not None else compute_optical_flow(prev_gray, curr_gray)
-
-        # Store the last computed flow for reuse.
-        last_flow = flow
-
-        # Visualize the flow
-        rgb_flow = flow_to_rgb(flow)
+            # Visualize the flow
+            rgb_flow = engine.to_bgr(flow)
+        # Between intervals, the last visualization is shown again
+        # (simulating saccadic masking).
         cv2.imshow('Simulated Optical Flow', rgb_flow)
 
         # Exit if 'q' is pressed.
@@ -171,5 +553,50 @@ def main():
     cap.release()
     cv2.destroyAllWindows()
 
+def _output_paths(inputs, output):
+    """Output file per input: output itself for one input, else files in output/."""
+    if len(inputs) == 1 and not os.path.isdir(output):
+        return [output]
+    os.makedirs(output, exist_ok=True)
+    return [os.path.join(output, os.path.splitext(os.path.basename(path))[0] + "_akinetopsia.mp4")
+            for path in inputs]
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate akinetopsia on videos.")
+    parser.add_argument("inputs", nargs="*",
+                        help="input videos (none: interactive preview of input_video.mp4)")
+    parser.add_argument("-o", "--output", help="output video, or directory for several inputs")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="flow threads per video (default: cores divided by --processes)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="videos processed in parallel (default: 1)")
+    parser.add_argument("--interval", type=int, default=DEFAULT_FLOW_INTERVAL,
+                        help="compute optical flow every N frames")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="resolution factor for optical flow, e.g. 0.25 for 1080p")
+    parser.add_argument("--queue-size", type=int, default=64,
+                        help="frames buffered between stages")
+    parser.add_argument("--seed", type=int, default=None, help="Markov chain seed")
+    args = parser.parse_args(argv)
+
+    if not args.inputs:
+        main(seed=args.seed, scale=args.scale)
+        return
+    if args.output is None:
+        parser.error("--output is required in headless mode")
+
+    start = time.perf_counter()
+    results = process_videos(
+        args.inputs, _output_paths(args.inputs, args.output), processes=args.processes,
+        threads=args.threads, interval=args.interval, seed=args.seed,
+        queue_size=args.queue_size, scale=args.scale,
+    )
+    for result in results:
+        print(f"{result['input']} -> {result['output']}: {result['frames']} frames "
+              f"in {result['seconds']:.2f} s ({result['fps']:.1f} fps)")
+    seconds = time.perf_counter() - start
+    total = sum(result["frames"] for result in results)
+    print(f"Total: {total} frames in {seconds:.2f} s ({total / seconds:.1f} fps)")
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -4,3 +4,78 @@ Analysis subpackage for cognitive neuroscience tools.
 This module provides utilities for neuroimaging data analysis, statistical methods,
 and machine learning approaches commonly used in cognitive neuroscience.
 """
+
+from .covariance import ledoit_wolf, partial_correlation, rank_data, tangent_space
+from .functional_connectivity import (
+    GroupConnectivity,
+    StreamingConnectivity,
+    atlas_index,
+    batch_correlation,
+    compute_correlation_matrix,
+    extract_roi_timeseries,
+    fisher_z,
+    iter_batch_correlation,
+    load_atlas,
+    n_windows,
+    pack_upper,
+    plot_matrix,
+    sliding_window_correlation,
+    unpack_upper,
+)
+from .graph import (
+    GraphMetrics,
+    clustering_coefficient,
+    degree,
+    global_efficiency,
+    graph_metrics,
+    local_efficiency,
+    modularity,
+    shortest_paths,
+    strength,
+    threshold_matrices,
+)
+from .group_comparison import NBSResult, edge_ttest, network_based_statistic
+from .voxelwise import (
+    ConnectivityMaps,
+    SparseConnectivity,
+    seed_to_voxel,
+    voxelwise_connectivity,
+)
+
+__all__ = [
+    "ConnectivityMaps",
+    "GraphMetrics",
+    "GroupConnectivity",
+    "NBSResult",
+    "SparseConnectivity",
+    "StreamingConnectivity",
+    "atlas_index",
+    "batch_correlation",
+    "clustering_coefficient",
+    "compute_correlation_matrix",
+    "degree",
+    "edge_ttest",
+    "extract_roi_timeseries",
+    "fisher_z",
+    "global_efficiency",
+    "graph_metrics",
+    "iter_batch_correlation",
+    "ledoit_wolf",
+    "load_atlas",
+    "local_efficiency",
+    "modularity",
+    "n_windows",
+    "network_based_statistic",
+    "pack_upper",
+    "partial_correlation",
+    "plot_matrix",
+    "rank_data",
+    "seed_to_voxel",
+    "shortest_paths",
+    "sliding_window_correlation",
+    "strength",
+    "tangent_space",
+    "threshold_matrices",
+    "unpack_upper",
+    "voxelwise_connectivity",
+]
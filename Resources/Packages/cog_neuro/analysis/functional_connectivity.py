@@ -5,14 +5,767 @@ This module provides functions for computing and visualizing functional
 connectivity in the brain, including correlation matrices and network analysis.
 """
 
+import hashlib
+import os
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import Optional, Union, Dict, Any, List, Tuple
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Union, Dict, Any, Iterable, Iterator, List, NamedTuple, Tuple
+
+from ..imaging.nifti import NiftiImage, is_nifti_path
+from ..utils.masked import MaskedTimeSeries
+from .covariance import partial_correlation, rank_data, tangent_space
+
+
+# Number of label volumes whose voxel indices are kept in memory.
+_ATLAS_CACHE_SIZE = 8
+
+# Volumes per block when averaging ROI time series.
+_ROI_BLOCK_SIZE = 64
+
+# Subjects per batched matrix multiply in batch_correlation.
+_SUBJECTS_PER_CHUNK = 32
+
+# Tapered windows computed per batched matrix multiply.
+_WINDOWS_PER_CHUNK = 64
+
+# Largest matrix plotted with per-cell grid lines and per-ROI labels.
+_DETAIL_LIMIT = 100
+
+# Fixed axes and colorbar positions (figure fractions) for PNG rendering.
+_AXES_RECT = (0.12, 0.12, 0.7, 0.78)
+_COLORBAR_RECT = (0.85, 0.12, 0.03, 0.78)
+
+_atlas_cache: "OrderedDict[str, AtlasIndex]" = OrderedDict()
+
+
+class AtlasIndex(NamedTuple):
+    """Voxel indices of every region in a label volume, grouped by label."""
+
+    labels: np.ndarray
+    order: np.ndarray
+    starts: np.ndarray
+    counts: np.ndarray
+    shape: Tuple[int, ...]
+    flat_order: str
+
+
+def _build_atlas_index(labels: np.ndarray, flat_order: str) -> AtlasIndex:
+    flat = labels.ravel(order=flat_order)
+    foreground = np.flatnonzero(flat)
+    values = flat[foreground]
+    # A stable sort groups each region's voxels in increasing voxel order.
+    sort = np.argsort(values, kind="stable")
+    region_labels, starts, counts = np.unique(
+        values[sort], return_index=True, return_counts=True
+    )
+    return AtlasIndex(
+        labels=region_labels,
+        order=foreground[sort],
+        starts=starts,
+        counts=counts,
+        shape=labels.shape,
+        flat_order=flat_order,
+    )
+
+
+def atlas_index(labels: np.ndarray, flat_order: str = "C") -> AtlasIndex:
+    """
+    Precompute the voxel indices of each region in a label volume.
+
+    Results are cached by the content of the label volume, so repeated calls
+    with the same atlas (e.g. once per subject) do the work only once.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        Integer label volume; 0 is background.
+    flat_order : str, optional
+        Memory order (``"C"`` or ``"F"``) the voxel indices refer to, by
+        default "C".
+
+    Returns
+    -------
+    AtlasIndex
+        Sorted region labels, and for each region the start and length of
+        its run of flat voxel indices in ``order``.
+    """
+    labels = np.asarray(labels)
+    if not np.issubdtype(labels.dtype, np.integer):
+        rounded = np.rint(labels)
+        if not np.array_equal(rounded, labels):
+            raise ValueError("Atlas labels must be integers")
+        labels = rounded.astype(np.int64)
+
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((labels.shape, labels.dtype.str, flat_order)).encode())
+    digest.update(np.ascontiguousarray(labels).data)
+    key = digest.hexdigest()
+
+    index = _atlas_cache.get(key)
+    if index is None:
+        index = _build_atlas_index(labels, flat_order)
+        _atlas_cache[key] = index
+        if len(_atlas_cache) > _ATLAS_CACHE_SIZE:
+            _atlas_cache.popitem(last=False)
+    else:
+        _atlas_cache.move_to_end(key)
+    return index
+
+
+def load_atlas(atlas: Union[str, np.ndarray]) -> np.ndarray:
+    """
+    Resolve an atlas argument to a 3D integer label volume.
+
+    Parameters
+    ----------
+    atlas : Union[str, np.ndarray]
+        A label volume, or the path to a NIfTI label image.
+
+    Returns
+    -------
+    np.ndarray
+        The label volume.
+
+    Raises
+    ------
+    ValueError
+        If ``atlas`` is neither a 3D array nor a path to a NIfTI file.
+    """
+    if isinstance(atlas, (str, os.PathLike)):
+        atlas = os.fspath(atlas)
+        if not (is_nifti_path(atlas) and os.path.exists(atlas)):
+            raise ValueError(
+                f"Unknown atlas: {atlas!r}. Pass a label volume or the path "
+                "to a NIfTI label image."
+            )
+        with NiftiImage(atlas) as img:
+            atlas = img.to_array()
+        if atlas.ndim == 4 and atlas.shape[-1] == 1:
+            atlas = atlas[..., 0]
+    atlas = np.asarray(atlas)
+    if atlas.ndim != 3:
+        raise ValueError(f"Atlas must be a 3D label volume, got {atlas.ndim}D")
+    return atlas
+
+
+def _bounding_box(labels: np.ndarray) -> Tuple[slice, ...]:
+    """Smallest box of slices containing every non-zero label."""
+    box = []
+    for axis in range(labels.ndim):
+        other = tuple(a for a in range(labels.ndim) if a != axis)
+        present = np.flatnonzero(np.any(labels != 0, axis=other))
+        box.append(slice(present[0], present[-1] + 1) if len(present) else slice(0, 0))
+    return tuple(box)
+
+
+def extract_roi_timeseries(
+    data: Union[np.ndarray, MaskedTimeSeries],
+    atlas: Union[str, np.ndarray],
+    block_size: int = _ROI_BLOCK_SIZE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Average 4D data within each region of a label atlas.
+
+    All regions are reduced together: the voxel indices are sorted by label
+    once per atlas, and each block of volumes is gathered in that order and
+    summed per region with a single ``np.add.reduceat``. The cost is
+    therefore linear in the number of voxels, whatever the number of
+    regions.
+
+    Parameters
+    ----------
+    data : Union[np.ndarray, MaskedTimeSeries]
+        Array with shape (x, y, z, time), which may be a memmap or a lazily
+        loaded :class:`~cog_neuro.utils.ChunkedArray` (read only within the
+        bounding box of the regions), or masked time series. For the
+        latter, only the atlas voxels inside the mask contribute, and
+        regions entirely outside it are omitted.
+    atlas : Union[str, np.ndarray]
+        Label volume with shape (x, y, z), or the path to a NIfTI label
+        image. Label 0 is background.
+    block_size : int, optional
+        Number of volumes reduced at a time, by default 64.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The ROI time series with shape (roi, time), and the label of each
+        row.
+
+    Raises
+    ------
+    ValueError
+        If the atlas is invalid or does not match the data.
+    """
+    labels = load_atlas(atlas)
+    if data.ndim != 4:
+        raise ValueError(f"Expected 4D data, got {data.ndim}D")
+    if labels.shape != data.shape[:3]:
+        raise ValueError(
+            f"Atlas shape {labels.shape} does not match data shape {data.shape[:3]}"
+        )
+
+    if isinstance(data, MaskedTimeSeries):
+        # The rows of the buffer are the mask's voxels in C order, so the
+        # atlas restricted to the mask indexes them directly.
+        index = atlas_index(labels[data.mask])
+
+        def read(block: slice) -> np.ndarray:
+            return data.series[:, block]
+
+    elif isinstance(data, np.ndarray):
+        # Flatten voxels in the data's own memory order so no copy is needed.
+        flat_order = "F" if data.flags.f_contiguous and not data.flags.c_contiguous else "C"
+        index = atlas_index(labels, flat_order)
+        matrix = data.reshape(-1, data.shape[-1], order=flat_order)
+
+        def read(block: slice) -> np.ndarray:
+            return matrix[:, block]
+
+    else:
+        # Lazily loaded arrays (e.g. chunked stores) are read only within
+        # the bounding box of the regions.
+        box = _bounding_box(labels)
+        index = atlas_index(labels[box])
+
+        def read(block: slice) -> np.ndarray:
+            values = np.asarray(data[box + (block,)])
+            return values.reshape(-1, values.shape[-1])
+
+    n_timepoints = data.shape[-1]
+
+    dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+    roi_data = np.empty((len(index.labels), n_timepoints), dtype=dtype)
+    if len(index.labels) == 0:
+        return roi_data, index.labels
+    for start in range(0, n_timepoints, block_size):
+        block = slice(start, min(start + block_size, n_timepoints))
+        gathered = np.asarray(read(block), dtype=np.float64)[index.order]
+        sums = np.add.reduceat(gathered, index.starts, axis=0)
+        roi_data[:, block] = sums / index.counts[:, None]
+    return roi_data, index.labels
+
+
+class StreamingConnectivity:
+    """
+    Accumulate a correlation matrix over time series that arrive in blocks.
+
+    Only the running mean and the matrix of centered cross-products are
+    kept, so memory is O(roi^2) whatever the length of the series. Blocks
+    are combined with the pairwise update of Chan et al., a block-wise form
+    of Welford's algorithm that avoids the cancellation of raw sums of
+    squares. Accumulators built on separate runs or sessions can be merged.
+
+    Parameters
+    ----------
+    atlas : Optional[Union[str, np.ndarray]], optional
+        Label atlas used to reduce 4D blocks to ROI time series, by default
+        None, in which case blocks must already be (roi, time).
+
+    Examples
+    --------
+    >>> acc = StreamingConnectivity()
+    >>> for block in blocks:
+    ...     acc.update(block)
+    >>> fc_matrix = acc.correlation()
+    """
+
+    def __init__(self, atlas: Optional[Union[str, np.ndarray]] = None):
+        self.atlas = None if atlas is None else load_atlas(atlas)
+        self.n_samples = 0
+        self.mean: Optional[np.ndarray] = None
+        self.comoment: Optional[np.ndarray] = None
+
+    @property
+    def n_rois(self) -> Optional[int]:
+        """Number of ROIs, or None before the first update."""
+        return None if self.mean is None else len(self.mean)
+
+    def _combine(self, n: int, mean: np.ndarray, comoment: np.ndarray) -> None:
+        if self.mean is None:
+            self.n_samples, self.mean, self.comoment = n, mean, comoment
+            return
+        if len(mean) != len(self.mean):
+            raise ValueError(
+                f"Expected {len(self.mean)} ROIs, got {len(mean)}"
+            )
+        total = self.n_samples + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.comoment += comoment + np.outer(delta, delta) * (self.n_samples * n / total)
+        self.n_samples = total
+
+    def update(self, block: np.ndarray) -> "StreamingConnectivity":
+        """
+        Add a block of time points.
+
+        Parameters
+        ----------
+        block : np.ndarray
+            Time series with shape (roi, time), a single sample with shape
+            (roi,), or a 4D block (x, y, z, time) or
+            :class:`~cog_neuro.utils.MaskedTimeSeries` when an atlas was
+            given.
+
+        Returns
+        -------
+        StreamingConnectivity
+            This accumulator.
+        """
+        if not isinstance(block, MaskedTimeSeries):
+            block = np.asarray(block)
+        if block.ndim == 4:
+            if self.atlas is None:
+                raise ValueError("4D blocks require an atlas")
+            block, _ = extract_roi_timeseries(block, self.atlas)
+        elif block.ndim == 1:
+            block = block[:, None]
+        elif block.ndim != 2:
+            raise ValueError(f"Expected a 1D, 2D or 4D block, got {block.ndim}D")
+        n = block.shape[1]
+        if n == 0:
+            return self
+
+        block = np.asarray(block, dtype=np.float64)
+        mean = block.mean(axis=1)
+        centered = block - mean[:, None]
+        self._combine(n, mean, centered @ centered.T)
+        return self
+
+    def merge(self, other: "StreamingConnectivity") -> "StreamingConnectivity":
+        """
+        Fold another accumulator, e.g. from another run, into this one.
+
+        Returns
+        -------
+        StreamingConnectivity
+            This accumulator.
+        """
+        if other.mean is not None:
+            self._combine(other.n_samples, other.mean.copy(), other.comoment.copy())
+        return self
+
+    def covariance(self, ddof: int = 1) -> np.ndarray:
+        """Current covariance matrix, with shape (roi, roi)."""
+        if self.mean is None:
+            raise ValueError("No samples have been added")
+        return self.comoment / max(self.n_samples - ddof, 1)
+
+    def correlation(self) -> np.ndarray:
+        """
+        Current correlation matrix, with shape (roi, roi).
+
+        Matches ``np.corrcoef`` on the concatenated series; ROIs with zero
+        variance give NaN.
+        """
+        if self.mean is None:
+            raise ValueError("No samples have been added")
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            matrix = self.comoment / np.outer(std, std)
+        return np.clip(matrix, -1.0, 1.0, out=matrix)
+
+
+@lru_cache(maxsize=16)
+def _upper_indices(n_rois: int) -> Tuple[np.ndarray, np.ndarray]:
+    rows, cols = np.triu_indices(n_rois, k=1)
+    rows.setflags(write=False)
+    cols.setflags(write=False)
+    return rows, cols
+
+
+def pack_upper(matrices: np.ndarray) -> np.ndarray:
+    """
+    Pack the strict upper triangle of symmetric matrices into vectors.
+
+    Parameters
+    ----------
+    matrices : np.ndarray
+        Array with shape (..., roi, roi).
+
+    Returns
+    -------
+    np.ndarray
+        Array with shape (..., roi * (roi - 1) // 2), in row-major order of
+        the upper triangle.
+    """
+    rows, cols = _upper_indices(matrices.shape[-1])
+    return matrices[..., rows, cols]
+
+
+def unpack_upper(packed: np.ndarray, diagonal: float = 1.0) -> np.ndarray:
+    """
+    Expand vectors produced by :func:`pack_upper` into symmetric matrices.
+
+    Parameters
+    ----------
+    packed : np.ndarray
+        Array with shape (..., roi * (roi - 1) // 2).
+    diagonal : float, optional
+        Value to fill the diagonal with, by default 1.0.
+
+    Returns
+    -------
+    np.ndarray
+        Array with shape (..., roi, roi).
+    """
+    n_pairs = packed.shape[-1]
+    n_rois = int(round((1 + np.sqrt(1 + 8 * n_pairs)) / 2))
+    if n_rois * (n_rois - 1) // 2 != n_pairs:
+        raise ValueError(f"{n_pairs} is not a triangular number of ROI pairs")
+    rows, cols = _upper_indices(n_rois)
+    matrices = np.empty(packed.shape[:-1] + (n_rois, n_rois), dtype=packed.dtype)
+    matrices[..., rows, cols] = packed
+    matrices[..., cols, rows] = packed
+    idx = np.arange(n_rois)
+    matrices[..., idx, idx] = diagonal
+    return matrices
+
+
+def fisher_z(r: np.ndarray) -> np.ndarray:
+    """
+    Fisher z-transform correlations, clipping +/-1 to stay finite.
+
+    Parameters
+    ----------
+    r : np.ndarray
+        Correlation coefficients.
+
+    Returns
+    -------
+    np.ndarray
+        ``arctanh(r)``, in the floating dtype of ``r``.
+    """
+    r = np.asarray(r)
+    if not np.issubdtype(r.dtype, np.floating):
+        r = r.astype(np.float64)
+    limit = 1.0 - np.finfo(r.dtype).eps
+    return np.arctanh(np.clip(r, -limit, limit))
+
+
+def iter_batch_correlation(
+    subjects: Union[np.ndarray, Iterable[np.ndarray]],
+    chunk_size: int = _SUBJECTS_PER_CHUNK,
+    packed: bool = True,
+    dtype: Any = np.float32,
+) -> Iterator[np.ndarray]:
+    """
+    Compute correlation matrices for chunks of subjects.
+
+    Each chunk is centered and normalized in place and all its matrices
+    come from a single batched matrix multiply, instead of one
+    ``np.corrcoef`` call per subject.
+
+    Parameters
+    ----------
+    subjects : Union[np.ndarray, Iterable[np.ndarray]]
+        A stacked (subject, roi, time) array, or an iterable of (roi, time)
+        arrays with the same number of ROIs (time may differ between
+        subjects).
+    chunk_size : int, optional
+        Subjects per batched multiply, by default 32.
+    packed : bool, optional
+        Whether to yield upper triangles (see :func:`pack_upper`) rather than
+        full matrices, by default True.
+    dtype : Any, optional
+        Working and result dtype, by default float32, which roughly halves
+        the cost of the matrix multiplies compared to float64.
+
+    Yields
+    ------
+    np.ndarray
+        Correlations for the next chunk of subjects, with shape
+        (chunk, roi * (roi - 1) // 2) if ``packed``, else (chunk, roi, roi).
+        ROIs with zero variance give NaN.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+    def chunks() -> Iterator[List[np.ndarray]]:
+        if isinstance(subjects, np.ndarray):
+            if subjects.ndim != 3:
+                raise ValueError(
+                    f"Expected a (subject, roi, time) array, got {subjects.ndim}D"
+                )
+            for start in range(0, len(subjects), chunk_size):
+                yield [subjects[start:start + chunk_size]]
+            return
+        chunk: List[np.ndarray] = []
+        for subject in subjects:
+            chunk.append(np.asarray(subject)[np.newaxis])
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    for chunk in chunks():
+        lengths = {part.shape[-1] for part in chunk}
+        if len(lengths) == 1:
+            groups = [np.concatenate(chunk)] if len(chunk) > 1 else chunk
+        else:
+            groups = chunk
+        results = []
+        for group in groups:
+            # One working copy per chunk, standardized in place.
+            group = np.array(group, dtype=dtype)
+            group -= group.mean(axis=-1, keepdims=True)
+            norms = np.sqrt(np.einsum("srt,srt->sr", group, group))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                group *= (1.0 / norms)[..., np.newaxis]
+            matrices = np.matmul(group, group.transpose(0, 2, 1))
+            result = pack_upper(matrices) if packed else matrices
+            results.append(np.clip(result, -1.0, 1.0, out=result))
+        yield np.concatenate(results)
+
+
+def batch_correlation(
+    subjects: Union[np.ndarray, Iterable[np.ndarray]],
+    chunk_size: int = _SUBJECTS_PER_CHUNK,
+    packed: bool = True,
+    dtype: Any = np.float32,
+) -> np.ndarray:
+    """
+    Compute the correlation matrix of every subject.
+
+    See :func:`iter_batch_correlation` for the parameters.
+
+    Returns
+    -------
+    np.ndarray
+        Correlations with shape (subject, roi * (roi - 1) // 2) if
+        ``packed``, else (subject, roi, roi).
+    """
+    return np.concatenate(
+        list(iter_batch_correlation(subjects, chunk_size, packed, dtype))
+    )
+
+
+class GroupConnectivity:
+    """
+    Streaming group mean and variance of connectivity in Fisher-z space.
+
+    Subjects are added in batches and combined with the pairwise
+    (Chan/Welford) update, so the group statistics of any number of
+    subjects need memory for only one batch.
+
+    Examples
+    --------
+    >>> group = GroupConnectivity()
+    >>> for chunk in iter_batch_correlation(subjects):
+    ...     group.update(chunk)
+    >>> mean_r = group.mean_correlation()
+    """
+
+    def __init__(self):
+        self.n_subjects = 0
+        self.mean: Optional[np.ndarray] = None
+        self.m2: Optional[np.ndarray] = None
+
+    def _combine(self, n: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        if self.mean is None:
+            self.n_subjects, self.mean, self.m2 = n, mean, m2
+            return
+        if mean.shape != self.mean.shape:
+            raise ValueError(
+                f"Expected connectivity of shape {self.mean.shape}, got {mean.shape}"
+            )
+        total = self.n_subjects + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.n_subjects * n / total)
+        self.n_subjects = total
+
+    def update(self, correlations: np.ndarray) -> "GroupConnectivity":
+        """
+        Add a batch of subjects' correlations (not yet Fisher-transformed).
+
+        Parameters
+        ----------
+        correlations : np.ndarray
+            Array with subjects on the first axis, packed or full matrices.
+
+        Returns
+        -------
+        GroupConnectivity
+            This accumulator.
+        """
+        if len(correlations) == 0:
+            return self
+        z = fisher_z(np.asarray(correlations, dtype=np.float64))
+        mean = z.mean(axis=0)
+        self._combine(len(z), mean, ((z - mean) ** 2).sum(axis=0))
+        return self
+
+    def merge(self, other: "GroupConnectivity") -> "GroupConnectivity":
+        """Fold another accumulator into this one and return this one."""
+        if other.mean is not None:
+            self._combine(other.n_subjects, other.mean.copy(), other.m2.copy())
+        return self
+
+    def variance(self, ddof: int = 1) -> np.ndarray:
+        """Variance of Fisher-z connectivity across subjects."""
+        if self.mean is None:
+            raise ValueError("No subjects have been added")
+        return self.m2 / max(self.n_subjects - ddof, 1)
+
+    def mean_correlation(self) -> np.ndarray:
+        """Group mean connectivity, back-transformed from Fisher-z to r."""
+        if self.mean is None:
+            raise ValueError("No subjects have been added")
+        return np.tanh(self.mean)
+
+
+def n_windows(n_timepoints: int, window: int, step: int = 1) -> int:
+    """Number of sliding windows of ``window`` samples every ``step`` samples."""
+    if window < 2 or window > n_timepoints:
+        raise ValueError(
+            f"window must be between 2 and {n_timepoints} samples, got {window}"
+        )
+    if step < 1:
+        raise ValueError(f"step must be positive, got {step}")
+    return (n_timepoints - window) // step + 1
+
+
+def _taper_weights(taper: Union[str, np.ndarray], window: int) -> np.ndarray:
+    if isinstance(taper, str):
+        if taper == "hamming":
+            weights = np.hamming(window)
+        elif taper == "hann":
+            # Drop the zero end points so every sample contributes.
+            weights = np.hanning(window + 2)[1:-1]
+        elif taper == "gaussian":
+            # Gaussian with sigma of a sixth of the window, as in common
+            # tapered sliding-window dFC pipelines.
+            t = np.arange(window) - (window - 1) / 2.0
+            weights = np.exp(-0.5 * (t / (window / 6.0)) ** 2)
+        else:
+            raise ValueError(f"Unknown taper: {taper}")
+    else:
+        weights = np.asarray(taper, dtype=np.float64)
+        if weights.shape != (window,) or np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError(
+                f"Taper weights must be {window} non-negative values with a positive sum"
+            )
+    return weights / weights.sum()
+
+
+def _packed_correlation(
+    cov: np.ndarray, rows: np.ndarray, cols: np.ndarray
+) -> np.ndarray:
+    """Packed upper-triangle correlations from one or more covariance matrices."""
+    var = np.diagonal(cov, axis1=-2, axis2=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov[..., rows, cols] / np.sqrt(var[..., rows] * var[..., cols])
+    return np.clip(corr, -1.0, 1.0, out=corr)
+
+
+def sliding_window_correlation(
+    roi_data: np.ndarray,
+    window: int,
+    step: int = 1,
+    taper: Optional[Union[str, np.ndarray]] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Compute time-resolved (sliding-window) functional connectivity.
+
+    With a rectangular window, the sums and cross-products of every window are
+    obtained as differences of running (cumulative) sums, so each window costs
+    O(roi^2) rather than the O(roi^2 * window) of a fresh ``np.corrcoef``.
+    Tapered windows weight samples unequally and cannot be updated that way;
+    they are computed as weighted correlations, a chunk of windows per batched
+    matrix multiply.
+
+    Parameters
+    ----------
+    roi_data : np.ndarray
+        ROI time series with shape (roi, time).
+    window : int
+        Window length in samples.
+    step : int, optional
+        Samples between window starts, by default 1.
+    taper : Optional[Union[str, np.ndarray]], optional
+        ``"hamming"``, ``"hann"``, ``"gaussian"``, or an array of
+        ``window`` non-negative weights, by default None (rectangular).
+    out : Optional[np.ndarray], optional
+        Array, e.g. a memmap, with shape (n_windows, roi * (roi - 1) // 2)
+        to write into, by default a new float32 array.
+
+    Returns
+    -------
+    np.ndarray
+        Packed upper-triangle correlations (see :func:`pack_upper`), one row
+        per window. ROIs that are constant within a window give NaN.
+    """
+    roi_data = np.asarray(roi_data)
+    if roi_data.ndim != 2:
+        raise ValueError(f"Expected (roi, time) data, got {roi_data.ndim}D")
+    n_rois, n_timepoints = roi_data.shape
+    count = n_windows(n_timepoints, window, step)
+    rows, cols = _upper_indices(n_rois)
+
+    if out is None:
+        out = np.empty((count, len(rows)), dtype=np.float32)
+    elif out.shape != (count, len(rows)):
+        raise ValueError(
+            f"Output buffer has shape {out.shape}, expected {(count, len(rows))}"
+        )
+
+    # Time-major and globally centered, which keeps the running sums small.
+    samples = np.asarray(roi_data.T, dtype=np.float64)
+    samples = samples - samples.mean(axis=0)
+
+    if taper is not None:
+        weights = _taper_weights(taper, window)
+        windows = np.lib.stride_tricks.sliding_window_view(samples, window, axis=0)[::step]
+        for start in range(0, count, _WINDOWS_PER_CHUNK):
+            chunk = windows[start:start + _WINDOWS_PER_CHUNK]
+            mean = chunk @ weights
+            centered = (chunk - mean[..., np.newaxis]) * np.sqrt(weights)
+            cov = np.matmul(centered, centered.transpose(0, 2, 1))
+            out[start:start + len(chunk)] = _packed_correlation(cov, rows, cols)
+        return out
+
+    # Windowed sums are differences of cumulative sums along time, so each
+    # window costs O(roi^2) however long it is. Edges are processed one row
+    # of the upper triangle at a time, which keeps every operand a
+    # contiguous slice and the working memory at O(time * roi).
+    cumulative = np.zeros((n_timepoints + 1, n_rois))
+
+    def window_sums(sums: np.ndarray) -> np.ndarray:
+        return sums[window::step][:count] - sums[0:count * step:step]
+
+    np.cumsum(samples, axis=0, out=cumulative[1:])
+    mean = window_sums(cumulative) / window
+    np.cumsum(samples ** 2, axis=0, out=cumulative[1:])
+    var = window_sums(cumulative) / window - mean ** 2
+    # Windows where an ROI is constant leave only rounding error.
+    var[var <= 1e-10 * samples.var(axis=0)] = np.nan
+    inv_std = 1.0 / np.sqrt(var)
+
+    offset = 0
+    for i in range(n_rois - 1):
+        n = n_rois - i - 1
+        sums = cumulative[:, :n]
+        np.multiply(samples[:, i, np.newaxis], samples[:, i + 1:], out=sums[1:])
+        np.cumsum(sums[1:], axis=0, out=sums[1:])
+        corr = window_sums(sums)
+        corr /= window
+        corr -= mean[:, i, np.newaxis] * mean[:, i + 1:]
+        corr *= inv_std[:, i, np.newaxis] * inv_std[:, i + 1:]
+        out[:, offset:offset + n] = np.clip(corr, -1.0, 1.0, out=corr)
+        offset += n
+    return out
 
 
 def compute_correlation_matrix(
-    data: np.ndarray, 
-    atlas: str = "harvard_oxford", 
+    data: Union[np.ndarray, MaskedTimeSeries],
+    atlas: Union[str, np.ndarray] = "harvard_oxford",
     method: str = "pearson",
     **kwargs: Any
 ) -> np.ndarray:
@@ -21,41 +774,104 @@ def compute_correlation_matrix(
 
     Parameters
     ----------
-    data : np.ndarray
-        The input neuroimaging data, with shape (x, y, z, time) or (roi, time).
-    atlas : str, optional
-        The brain atlas to use for defining regions of interest, by default "harvard_oxford".
+    data : Union[np.ndarray, MaskedTimeSeries]
+        The input neuroimaging data, with shape (x, y, z, time), (roi, time),
+        or (subject, roi, time) for a batch of subjects, or masked voxel
+        time series.
+    atlas : Union[str, np.ndarray], optional
+        Label volume, or path to a NIfTI label image, defining the regions of
+        interest for 4D data, by default "harvard_oxford". Named atlases are
+        not bundled, so 4D data needs an explicit label volume or path.
     method : str, optional
-        The correlation method to use, by default "pearson".
+        The correlation method to use, by default "pearson". One of
+        ``"pearson"``, ``"spearman"`` (Pearson on ranks, ties averaged),
+        ``"partial"`` (from the Ledoit-Wolf shrunk precision matrix) or
+        ``"tangent"`` (log map of the shrunk covariance relative to a group
+        reference, see :func:`tangent_space`).
     **kwargs : Any
-        Additional parameters for the correlation method.
+        Additional parameters for the correlation method; ``reference`` for
+        ``"tangent"``.
 
     Returns
     -------
     np.ndarray
-        The functional connectivity matrix, with shape (roi, roi).
-    """
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nilearn to compute functional connectivity.
-    print(f"Computing functional connectivity with atlas: {atlas}, method: {method}")
-    
-    # If data is already in ROI format
-    if len(data.shape) == 2:
+        The functional connectivity matrix, with shape (roi, roi), or
+        (subject, roi, roi) for a batch. Rows follow the sorted atlas labels.
+
+    Raises
+    ------
+    ValueError
+        If the method is unknown.
+    """
+    if method not in ("pearson", "spearman", "partial", "tangent"):
+        raise ValueError(f"Unknown connectivity method: {method}")
+
+    if len(data.shape) == 3:
+        roi_data = data
+    elif len(data.shape) == 2:
+        # Data is already in ROI format
         roi_data = data
     else:
-        # Placeholder: extract ROI time series using the specified atlas
-        # In a real implementation, we would use nilearn.input_data.NiftiLabelsMasker
-        print(f"Extracting ROI time series using atlas: {atlas}")
-        n_rois = 100  # Placeholder
-        n_timepoints = data.shape[-1]
-        roi_data = np.random.randn(n_rois, n_timepoints)
-    
+        roi_data, _ = extract_roi_timeseries(data, atlas)
+
+    if method == "partial":
+        return partial_correlation(roi_data)
+    if method == "tangent":
+        return tangent_space(roi_data, reference=kwargs.get("reference"))[0]
+
+    if len(roi_data.shape) == 3:
+        subjects: Union[np.ndarray, Iterator[np.ndarray]] = roi_data
+        if method == "spearman":
+            # Rank a chunk of subjects at a time, then correlate the ranks.
+            subjects = (
+                ranks
+                for start in range(0, len(roi_data), _SUBJECTS_PER_CHUNK)
+                for ranks in rank_data(roi_data[start:start + _SUBJECTS_PER_CHUNK])
+            )
+        return batch_correlation(subjects, packed=False, dtype=np.float64)
+
+    if method == "spearman":
+        roi_data = rank_data(roi_data)
+
     # Compute correlation matrix
     fc_matrix = np.corrcoef(roi_data)
-    
+
     return fc_matrix
 
 
+def _pool_matrix(matrix: np.ndarray, factor: int, pool: str) -> np.ndarray:
+    """
+    Downsample a matrix by pooling ``factor x factor`` blocks.
+
+    Edge blocks may be smaller, and NaN cells are ignored. ``"max"`` keeps
+    the value of largest magnitude, with its sign.
+    """
+    rows = np.arange(0, matrix.shape[0], factor)
+    cols = np.arange(0, matrix.shape[1], factor)
+    finite = np.isfinite(matrix)
+    counts = np.add.reduceat(
+        np.add.reduceat(finite.astype(np.int64), rows, axis=0), cols, axis=1
+    )
+    if pool == "mean":
+        values = np.where(finite, matrix, 0.0)
+        sums = np.add.reduceat(np.add.reduceat(values, rows, axis=0), cols, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    high = np.where(finite, matrix, -np.inf)
+    high = np.maximum.reduceat(np.maximum.reduceat(high, rows, axis=0), cols, axis=1)
+    low = np.where(finite, matrix, np.inf)
+    low = np.minimum.reduceat(np.minimum.reduceat(low, rows, axis=0), cols, axis=1)
+    pooled = np.where(np.abs(low) > np.abs(high), low, high)
+    return np.where(counts > 0, pooled, np.nan)
+
+
+def _network_blocks(networks: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Start index of each run of equal network names, and the names."""
+    names = list(networks)
+    starts = [0] + [i for i in range(1, len(names)) if names[i] != names[i - 1]]
+    return np.array(starts), [names[i] for i in starts]
+
+
 def plot_matrix(
     matrix: np.ndarray,
     roi_labels: Optional[List[str]] = None,
@@ -64,17 +880,30 @@ def plot_matrix(
     vmax: float = 1.0,
     title: str = "Functional Connectivity Matrix",
     figsize: Tuple[int, int] = (10, 8),
+    networks: Optional[List[str]] = None,
+    max_cells: int = _DETAIL_LIMIT,
+    pool: str = "mean",
+    filepath: Optional[str] = None,
+    dpi: int = 100,
     **kwargs: Any
 ) -> plt.Figure:
     """
     Plot a functional connectivity matrix.
 
+    Matrices with up to ``max_cells`` rows and columns are drawn in full
+    detail, with a grid line around every cell and per-ROI tick labels.
+    Larger matrices are drawn in a fast mode: no per-cell artists are
+    created, and the matrix is pooled down to the resolution of the output
+    image before drawing, so the cost no longer grows with the square of the
+    number of ROIs. Network blocks can be labelled in either mode.
+
     Parameters
     ----------
     matrix : np.ndarray
         The functional connectivity matrix to plot.
     roi_labels : Optional[List[str]], optional
-        Labels for the regions of interest, by default None.
+        Labels for the regions of interest, by default None. Only drawn in
+        full-detail mode.
     cmap : str, optional
         The colormap to use, by default "coolwarm".
     vmin : float, optional
@@ -85,6 +914,21 @@ def plot_matrix(
         The title of the plot, by default "Functional Connectivity Matrix".
     figsize : Tuple[int, int], optional
         The size of the figure, by default (10, 8).
+    networks : Optional[List[str]], optional
+        Network name of each ROI, with ROIs ordered by network, by default
+        None. Block boundaries are outlined and each block is labelled once.
+    max_cells : int, optional
+        Largest matrix drawn in full detail, by default 100.
+    pool : str, optional
+        How cells are combined when a large matrix is downsampled:
+        ``"mean"``, or ``"max"`` for the value of largest magnitude, by
+        default "mean".
+    filepath : Optional[str], optional
+        PNG file to render to, by default None. The figure is then built
+        and drawn with the Agg canvas directly, outside pyplot, with a fixed
+        layout; this is the fast path for rendering many matrices.
+    dpi : int, optional
+        Resolution of the output in dots per inch, by default 100.
     **kwargs : Any
         Additional parameters for matplotlib.pyplot.imshow.
 
@@ -92,30 +936,81 @@ def plot_matrix(
     -------
     plt.Figure
         The matplotlib figure object.
+
+    Raises
+    ------
+    ValueError
+        If ``pool`` is unknown or ``networks`` does not match the matrix.
     """
-    fig, ax = plt.subplots(figsize=figsize)
-    
-    im = ax.imshow(matrix, cmap=cmap, vmin=vmin, vmax=vmax, **kwargs)
-    
+    if pool not in ("mean", "max"):
+        raise ValueError(f"Unknown pooling: {pool}")
+    matrix = np.asarray(matrix)
+    n_rows, n_cols = matrix.shape
+    if networks is not None and len(networks) != n_rows:
+        raise ValueError(f"Expected {n_rows} network names, got {len(networks)}")
+    detailed = max(n_rows, n_cols) <= max_cells
+
+    if filepath is None:
+        fig, ax = plt.subplots(figsize=figsize, dpi=dpi)
+    else:
+        # A bare Figure is not tracked by pyplot, so nothing accumulates
+        # when many matrices are rendered in one process.
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes(_AXES_RECT)
+
+    image = matrix
+    if not detailed:
+        # One matrix cell per output pixel at most.
+        pixels = max(1, int(min(figsize) * dpi))
+        factor = int(np.ceil(max(n_rows, n_cols) / pixels))
+        if factor > 1:
+            image = _pool_matrix(matrix, factor, pool)
+        kwargs.setdefault("interpolation", "nearest")
+    im = ax.imshow(
+        image, cmap=cmap, vmin=vmin, vmax=vmax,
+        extent=(-0.5, n_cols - 0.5, n_rows - 0.5, -0.5), **kwargs
+    )
+
     # Add colorbar
-    cbar = fig.colorbar(im, ax=ax)
+    if filepath is None:
+        cbar = fig.colorbar(im, ax=ax)
+    else:
+        cbar = fig.colorbar(im, cax=fig.add_axes(_COLORBAR_RECT))
     cbar.set_label("Correlation")
-    
+
     # Add labels if provided
-    if roi_labels is not None:
+    if roi_labels is not None and detailed and networks is None:
         n_rois = len(roi_labels)
         ax.set_xticks(np.arange(n_rois))
         ax.set_yticks(np.arange(n_rois))
         ax.set_xticklabels(roi_labels, rotation=90)
         ax.set_yticklabels(roi_labels)
-    
+    elif networks is not None:
+        starts, names = _network_blocks(networks)
+        bounds = np.append(starts, n_rows) - 0.5
+        centers = (bounds[:-1] + bounds[1:]) / 2
+        ax.set_xticks(centers)
+        ax.set_yticks(centers)
+        ax.set_xticklabels(names, rotation=90)
+        ax.set_yticklabels(names)
+        ax.hlines(bounds[1:-1], -0.5, n_cols - 0.5, colors="k", linewidth=0.8)
+        ax.vlines(bounds[1:-1], -0.5, n_rows - 0.5, colors="k", linewidth=0.8)
+    elif not detailed:
+        ax.set_xticks([])
+        ax.set_yticks([])
+
     ax.set_title(title)
-    
+
     # Add grid lines
-    ax.set_xticks(np.arange(-0.5, matrix.shape[1], 1), minor=True)
-    ax.set_yticks(np.arange(-0.5, matrix.shape[0], 1), minor=True)
-    ax.grid(which="minor", color="w", linestyle="-", linewidth=0.5)
-    
-    fig.tight_layout()
-    
-    return fig 
\ No newline at end of file
+    if detailed:
+        ax.set_xticks(np.arange(-0.5, n_cols, 1), minor=True)
+        ax.set_yticks(np.arange(-0.5, n_rows, 1), minor=True)
+        ax.grid(which="minor", color="w", linestyle="-", linewidth=0.5)
+
+    if filepath is None:
+        fig.tight_layout()
+    else:
+        fig.canvas.print_png(filepath)
+
+    return fig
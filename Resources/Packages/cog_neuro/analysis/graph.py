@@ -0,0 +1,534 @@
+"""
+Graph-theory metrics of thresholded connectivity matrices.
+
+Every metric here takes a stack of adjacency matrices with shape
+(..., roi, roi) and evaluates the whole stack in batched array operations,
+so that many subjects and threshold levels cost a handful of large matrix
+products rather than one Python-level graph traversal each. Triangles are
+counted from matrix products, shortest paths come from breadth-first search
+by boolean matrix products (binary graphs) or a batched Floyd-Warshall
+recursion (weighted graphs), and communities are found by Newman's
+leading-eigenvector method with every graph's eigendecomposition done in
+one batched call. Stacks are processed a chunk of graphs at a time to bound
+memory.
+"""
+
+import numpy as np
+from typing import NamedTuple, Optional, Sequence, Tuple, Union
+
+from .functional_connectivity import pack_upper, unpack_upper
+
+
+# Graphs processed together per batched matrix product.
+_GRAPHS_PER_CHUNK = 64
+
+# Upper bound on (graph * roi * degree^2) elements for the per-node
+# subgraphs of local efficiency.
+_SUBGRAPH_ELEMENTS = 1 << 22
+
+
+class GraphMetrics(NamedTuple):
+    """Result of :func:`graph_metrics`."""
+
+    degree: np.ndarray
+    strength: np.ndarray
+    clustering: np.ndarray
+    local_efficiency: np.ndarray
+    global_efficiency: np.ndarray
+    modularity: np.ndarray
+    communities: np.ndarray
+
+
+def _chunks(n: int, size: int = _GRAPHS_PER_CHUNK):
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
+
+
+def _as_batch(adjacency: np.ndarray) -> Tuple[np.ndarray, Tuple[int, ...]]:
+    """View (..., roi, roi) adjacency matrices as (graph, roi, roi)."""
+    adjacency = np.asarray(adjacency)
+    if adjacency.ndim < 2 or adjacency.shape[-1] != adjacency.shape[-2]:
+        raise ValueError(
+            f"Expected (..., roi, roi) adjacency matrices, got shape {adjacency.shape}"
+        )
+    return adjacency.reshape((-1,) + adjacency.shape[-2:]), adjacency.shape[:-2]
+
+
+def _clean(adjacency: np.ndarray) -> np.ndarray:
+    """Float copy with NaNs and the diagonal set to zero."""
+    adjacency = np.nan_to_num(np.array(adjacency, dtype=np.float64), nan=0.0)
+    idx = np.arange(adjacency.shape[-1])
+    adjacency[..., idx, idx] = 0.0
+    return adjacency
+
+
+def threshold_matrices(
+    matrices: np.ndarray,
+    density: Optional[Union[float, Sequence[float]]] = None,
+    threshold: Optional[Union[float, Sequence[float]]] = None,
+    absolute: bool = False,
+    binarize: bool = False,
+) -> np.ndarray:
+    """
+    Threshold connectivity matrices at one or several levels.
+
+    Exactly one of ``density`` and ``threshold`` is given. A proportional
+    threshold keeps the strongest ``density`` fraction of edges of every
+    matrix, so all graphs at a level have the same number of edges; an
+    absolute threshold keeps edges whose weight is at least ``threshold``.
+    Edges are ranked once per matrix and every level is then a comparison
+    against that ranking.
+
+    Parameters
+    ----------
+    matrices : np.ndarray
+        Symmetric connectivity matrices with shape (..., roi, roi).
+    density : float or sequence of float, optional
+        Fraction(s) of edges to keep, in [0, 1].
+    threshold : float or sequence of float, optional
+        Minimum edge weight(s) to keep.
+    absolute : bool, optional
+        Rank and threshold edges by absolute weight, by default False.
+    binarize : bool, optional
+        Set kept edges to 1 instead of their weight, by default False.
+
+    Returns
+    -------
+    np.ndarray
+        Thresholded matrices with a zero diagonal. A scalar level gives
+        shape (..., roi, roi); a sequence of levels gives
+        (..., level, roi, roi).
+    """
+    if (density is None) == (threshold is None):
+        raise ValueError("Specify exactly one of density and threshold")
+    matrices = np.asarray(matrices, dtype=np.float64)
+    if matrices.ndim < 2 or matrices.shape[-1] != matrices.shape[-2]:
+        raise ValueError(f"Expected (..., roi, roi) matrices, got shape {matrices.shape}")
+    levels = np.asarray(density if threshold is None else threshold, dtype=np.float64)
+    scalar = levels.ndim == 0
+    levels = np.atleast_1d(levels)
+
+    packed = pack_upper(matrices)
+    score = np.abs(packed) if absolute else packed.copy()
+    score[np.isnan(score)] = -np.inf
+
+    if threshold is None:
+        if np.any((levels < 0) | (levels > 1)):
+            raise ValueError("density must be in [0, 1]")
+        n_edges = packed.shape[-1]
+        order = np.argsort(-score, axis=-1, kind="stable")
+        rank = np.empty_like(order)
+        np.put_along_axis(rank, order, np.arange(n_edges), axis=-1)
+        n_keep = np.round(levels * n_edges).astype(np.int64)
+        keep = rank[..., None, :] < n_keep[:, None]
+        keep &= np.isfinite(score)[..., None, :]
+    else:
+        keep = score[..., None, :] >= levels[:, None]
+
+    values = np.where(keep, 1.0 if binarize else packed[..., None, :], 0.0)
+    thresholded = unpack_upper(values, diagonal=0.0)
+    return thresholded[..., 0, :, :] if scalar else thresholded
+
+
+def degree(adjacency: np.ndarray) -> np.ndarray:
+    """
+    Number of edges of every node.
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Adjacency matrices with shape (..., roi, roi).
+
+    Returns
+    -------
+    np.ndarray
+        Degrees with shape (..., roi).
+    """
+    adjacency = _clean(adjacency)
+    return np.count_nonzero(adjacency, axis=-1)
+
+
+def strength(adjacency: np.ndarray) -> np.ndarray:
+    """
+    Sum of edge weights of every node.
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Adjacency matrices with shape (..., roi, roi).
+
+    Returns
+    -------
+    np.ndarray
+        Strengths with shape (..., roi).
+    """
+    return _clean(adjacency).sum(axis=-1)
+
+
+def clustering_coefficient(adjacency: np.ndarray, weighted: bool = False) -> np.ndarray:
+    """
+    Clustering coefficient of every node.
+
+    The binary coefficient is the fraction of a node's neighbour pairs that
+    are connected, with triangles counted from the diagonal of ``A^3``. The
+    weighted coefficient is that of Onnela et al. (2005), the mean geometric
+    intensity of a node's triangles with weights scaled by the largest
+    weight of each graph.
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Undirected adjacency matrices with shape (..., roi, roi) and
+        non-negative weights.
+    weighted : bool, optional
+        Use edge weights, by default False.
+
+    Returns
+    -------
+    np.ndarray
+        Clustering coefficients with shape (..., roi); nodes with fewer than
+        two neighbours have a coefficient of 0.
+    """
+    batch, lead = _as_batch(adjacency)
+    result = np.empty(batch.shape[:2])
+    for chunk in _chunks(len(batch)):
+        a = _clean(batch[chunk])
+        k = np.count_nonzero(a, axis=-1)
+        if weighted:
+            top = a.max(axis=(1, 2), keepdims=True)
+            a = np.cbrt(np.divide(a, top, out=np.zeros_like(a), where=top > 0))
+        else:
+            a = (a != 0).astype(np.float64)
+        triangles = np.einsum("gij,gij->gi", np.matmul(a, a), a)
+        pairs = k * (k - 1.0)
+        result[chunk] = np.divide(triangles, pairs, out=np.zeros_like(triangles), where=pairs > 0)
+    return result.reshape(lead + result.shape[-1:])
+
+
+def _binary_distances(adjacency: np.ndarray) -> np.ndarray:
+    """
+    Shortest path lengths of (graph, roi, roi) binary graphs.
+
+    Breadth-first search from every node of every graph at once: the next
+    frontier is the boolean product of the current one with the adjacency.
+    """
+    n_graphs, n_rois = adjacency.shape[:2]
+    a = (adjacency != 0).astype(np.float32)
+    frontier = np.broadcast_to(np.eye(n_rois, dtype=bool), a.shape).copy()
+    reached = frontier.copy()
+    distances = np.where(frontier, 0.0, np.inf)
+    step = 0
+    while True:
+        step += 1
+        frontier = (np.matmul(frontier.astype(np.float32), a) > 0) & ~reached
+        if not frontier.any():
+            return distances
+        distances[frontier] = step
+        reached |= frontier
+
+
+def _weighted_distances(adjacency: np.ndarray) -> np.ndarray:
+    """
+    Shortest path lengths of (graph, roi, roi) weighted graphs.
+
+    Edge lengths are inverse weights, and the Floyd-Warshall recursion is
+    run for all graphs together, one intermediate node per step.
+    """
+    with np.errstate(divide="ignore"):
+        distances = np.where(adjacency > 0, 1.0 / adjacency, np.inf)
+    idx = np.arange(adjacency.shape[-1])
+    distances[:, idx, idx] = 0.0
+    for k in idx:
+        np.minimum(distances, distances[:, :, k, None] + distances[:, None, k, :], out=distances)
+    return distances
+
+
+def shortest_paths(adjacency: np.ndarray, weighted: bool = False) -> np.ndarray:
+    """
+    All-pairs shortest path lengths.
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Undirected adjacency matrices with shape (..., roi, roi) and
+        non-negative weights.
+    weighted : bool, optional
+        Use inverse weights as edge lengths, by default False (every edge
+        has length 1).
+
+    Returns
+    -------
+    np.ndarray
+        Path lengths with shape (..., roi, roi), ``inf`` between
+        disconnected nodes.
+    """
+    batch, lead = _as_batch(adjacency)
+    result = np.empty(batch.shape)
+    for chunk in _chunks(len(batch)):
+        a = _clean(batch[chunk])
+        result[chunk] = _weighted_distances(a) if weighted else _binary_distances(a)
+    return result.reshape(lead + result.shape[-2:])
+
+
+def _mean_inverse(distances: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """Mean inverse off-diagonal distance over ``n`` nodes per graph."""
+    inverse = np.zeros_like(distances)
+    np.divide(1.0, distances, out=inverse, where=distances > 0)
+    pairs = n * (n - 1.0)
+    total = inverse.sum(axis=(-2, -1))
+    return np.divide(total, pairs, out=np.zeros_like(total), where=pairs > 0)
+
+
+def global_efficiency(adjacency: np.ndarray, weighted: bool = False) -> np.ndarray:
+    """
+    Global efficiency, the mean inverse shortest path length (Latora and
+    Marchiori, 2001).
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Undirected adjacency matrices with shape (..., roi, roi) and
+        non-negative weights.
+    weighted : bool, optional
+        Use inverse weights as edge lengths, by default False.
+
+    Returns
+    -------
+    np.ndarray
+        Efficiencies with shape (...).
+    """
+    distances = shortest_paths(adjacency, weighted=weighted)
+    n_rois = distances.shape[-1]
+    return _mean_inverse(distances, np.float64(n_rois))
+
+
+def local_efficiency(adjacency: np.ndarray) -> np.ndarray:
+    """
+    Local efficiency of every node on the binary graph.
+
+    The local efficiency of a node is the global efficiency of the subgraph
+    induced by its neighbours. The subgraphs of all nodes of a chunk of
+    graphs are searched together, each padded to the largest degree in the
+    chunk. Edge weights are ignored.
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Undirected adjacency matrices with shape (..., roi, roi).
+
+    Returns
+    -------
+    np.ndarray
+        Local efficiencies with shape (..., roi); nodes with fewer than two
+        neighbours have an efficiency of 0.
+    """
+    batch, lead = _as_batch(adjacency)
+    n_graphs, n_rois = batch.shape[:2]
+    adjacency = np.empty(batch.shape, dtype=bool)
+    for chunk in _chunks(n_graphs):
+        adjacency[chunk] = _clean(batch[chunk]) != 0
+    k = adjacency.sum(axis=-1)
+    # Subgraphs are padded to the largest degree of their chunk, so graphs
+    # of similar density are batched together.
+    width = k.max(axis=-1, initial=0)
+    order = np.argsort(width, kind="stable")
+    result = np.zeros((n_graphs, n_rois))
+    start = 0
+    while start < n_graphs:
+        size = _SUBGRAPH_ELEMENTS // (n_rois * max(int(width[order[start]]), 1) ** 2)
+        size = max(1, min(_GRAPHS_PER_CHUNK, size))
+        end = min(start + size, n_graphs)
+        w = int(width[order[end - 1]])
+        end = min(end, start + max(1, _SUBGRAPH_ELEMENTS // (n_rois * max(w, 1) ** 2)))
+        index = order[start:end]
+        start = end
+        w = int(width[index].max())
+        if w < 2:
+            continue
+        a = adjacency[index]
+        # (graph, node, neighbour, neighbour): the adjacency among each
+        # node's neighbours, which are gathered first and padded to w.
+        neighbours = np.argsort(~a, axis=-1, kind="stable")[..., :w]
+        valid = np.take_along_axis(a, neighbours, axis=-1)
+        graphs = np.arange(len(index))[:, None, None, None]
+        sub = a[graphs, neighbours[..., :, None], neighbours[..., None, :]]
+        sub &= valid[..., :, None] & valid[..., None, :]
+        distances = _binary_distances(sub.reshape((-1, w, w)))
+        result[index] = _mean_inverse(distances, k[index].reshape(-1)).reshape(-1, n_rois)
+    return result.reshape(lead + (n_rois,))
+
+
+def _relabel(labels: np.ndarray, n_labels: int) -> np.ndarray:
+    """Renumber each row of (graph, roi) labels to 0..k-1 in label order."""
+    rows = np.arange(len(labels))[:, None]
+    present = np.zeros((len(labels), n_labels), dtype=bool)
+    present[rows, labels] = True
+    return (np.cumsum(present, axis=1) - 1)[rows, labels]
+
+
+def _modularity(a: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Newman's Q of (graph, roi, roi) adjacency for (graph, roi) labels."""
+    k = a.sum(axis=-1)
+    two_m = k.sum(axis=-1)
+    onehot = (labels[:, :, None] == np.arange(labels.max() + 1)).astype(np.float64)
+    within = np.einsum("gic,gij,gjc->g", onehot, a, onehot)
+    totals = np.einsum("gi,gic->gc", k, onehot)
+    q = within - (totals ** 2).sum(axis=-1) / np.where(two_m > 0, two_m, 1)
+    return np.divide(q, two_m, out=np.zeros_like(q), where=two_m > 0)
+
+
+def _leading_eigenvector(a: np.ndarray, tol: float = 1e-10) -> np.ndarray:
+    """
+    Communities of (graph, roi, roi) adjacency by repeated spectral bisection.
+
+    At every level each community is split by the sign of the leading
+    eigenvector of its generalized modularity matrix (Newman, 2006). The
+    matrices of all communities of a graph form one block-diagonal matrix,
+    so a single batched ``eigh`` covers every graph and community; each
+    eigenvector is an eigenvector of the blocks it is supported on, and a
+    community takes the one with the largest eigenvalue among those. Splits
+    that do not increase modularity are rejected.
+    """
+    n_graphs, n_rois = a.shape[:2]
+    k = a.sum(axis=-1)
+    two_m = k.sum(axis=-1)
+    scale = np.where(two_m > 0, two_m, 1)[:, None, None]
+    b = a - k[:, :, None] * k[:, None, :] / scale
+    labels = np.zeros((n_graphs, n_rois), dtype=np.int64)
+    rows = np.arange(n_graphs)[:, None]
+    idx = np.arange(n_rois)
+    n_labels = 1
+    while n_labels < n_rois:
+        same = labels[:, :, None] == labels[:, None, :]
+        bg = np.where(same, b, 0.0)
+        bg[:, idx, idx] -= bg.sum(axis=-1)
+        values, vectors = np.linalg.eigh(bg)
+
+        onehot = (labels[:, :, None] == np.arange(n_labels)).astype(np.float64)
+        mass = np.einsum("gic,gij->gcj", onehot, vectors ** 2)
+        score = np.where(mass > 1e-8, values[:, None, :], -np.inf)
+        best = score.argmax(axis=-1)
+        best_value = np.take_along_axis(score, best[:, :, None], axis=-1)[..., 0]
+
+        s = np.sign(vectors[rows, idx, best[rows, labels]])
+        s[s == 0] = 1
+        gain = np.einsum("gic,gij,gj,gi->gc", onehot, bg, s, s)
+        split = (best_value > tol) & (gain > tol * scale[:, :, 0])
+        if not split.any():
+            break
+        labels = _relabel(2 * labels + (split[rows, labels] & (s < 0)), 2 * n_labels)
+        n_labels = int(labels.max()) + 1
+    return labels
+
+
+def modularity(
+    adjacency: np.ndarray, communities: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Modularity of a community partition.
+
+    Without ``communities``, the partition is found by Newman's (2006)
+    leading-eigenvector method, applied to all graphs together.
+
+    Parameters
+    ----------
+    adjacency : np.ndarray
+        Undirected adjacency matrices with shape (..., roi, roi) and
+        non-negative weights.
+    communities : np.ndarray, optional
+        Integer community labels with shape (roi,) or (..., roi).
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Modularity Q with shape (...), and community labels with shape
+        (..., roi).
+    """
+    batch, lead = _as_batch(adjacency)
+    n_graphs, n_rois = batch.shape[:2]
+    if communities is not None:
+        communities = np.asarray(communities)
+        if not np.issubdtype(communities.dtype, np.integer):
+            raise ValueError("communities must be integer labels")
+        labels = np.broadcast_to(communities, lead + (n_rois,)).reshape(n_graphs, n_rois)
+        labels = np.unique(labels, return_inverse=True)[1].reshape(n_graphs, n_rois)
+    else:
+        labels = np.empty((n_graphs, n_rois), dtype=np.int64)
+    q = np.empty(n_graphs)
+    for chunk in _chunks(n_graphs):
+        a = _clean(batch[chunk])
+        if communities is None:
+            labels[chunk] = _leading_eigenvector(a)
+        q[chunk] = _modularity(a, labels[chunk])
+    return q.reshape(lead), labels.reshape(lead + (n_rois,))
+
+
+def graph_metrics(
+    matrices: np.ndarray,
+    density: Optional[Union[float, Sequence[float]]] = None,
+    threshold: Optional[Union[float, Sequence[float]]] = None,
+    absolute: bool = False,
+    weighted: bool = False,
+) -> GraphMetrics:
+    """
+    Threshold connectivity matrices and compute the standard graph metrics.
+
+    Parameters
+    ----------
+    matrices : np.ndarray
+        Symmetric connectivity matrices with shape (..., roi, roi).
+    density : float or sequence of float, optional
+        Proportional threshold level(s); see :func:`threshold_matrices`.
+    threshold : float or sequence of float, optional
+        Absolute threshold level(s); see :func:`threshold_matrices`.
+    absolute : bool, optional
+        Rank and threshold edges by absolute weight, by default False. Kept
+        weights are then made non-negative.
+    weighted : bool, optional
+        Keep edge weights for strength, clustering, global efficiency and
+        modularity, by default False (binary graphs). The metrics assume
+        non-negative weights, so without ``absolute`` any negative weight
+        that survives the threshold is set to zero, removing that edge.
+
+    Returns
+    -------
+    GraphMetrics
+        Node metrics with shape (..., [level,] roi) and global efficiency
+        and modularity with shape (..., [level]), where the level axis is
+        present when a sequence of levels is given.
+    """
+    if (density is None) == (threshold is None):
+        raise ValueError("Specify exactly one of density and threshold")
+    batch, lead = _as_batch(matrices)
+    n_matrices, n_rois = batch.shape[:2]
+    levels = np.shape(density if threshold is None else threshold)
+    # Matrices are thresholded a chunk at a time, so only the graphs of one
+    # chunk of matrices (at every level) are held in memory.
+    per_chunk = max(1, _GRAPHS_PER_CHUNK // max(1, int(np.prod(levels))))
+    out = GraphMetrics(
+        degree=np.empty((n_matrices,) + levels + (n_rois,), dtype=np.int64),
+        strength=np.empty((n_matrices,) + levels + (n_rois,)),
+        clustering=np.empty((n_matrices,) + levels + (n_rois,)),
+        local_efficiency=np.empty((n_matrices,) + levels + (n_rois,)),
+        global_efficiency=np.empty((n_matrices,) + levels),
+        modularity=np.empty((n_matrices,) + levels),
+        communities=np.empty((n_matrices,) + levels + (n_rois,), dtype=np.int64),
+    )
+    for chunk in _chunks(n_matrices, per_chunk):
+        a = threshold_matrices(
+            batch[chunk], density=density, threshold=threshold, absolute=absolute,
+            binarize=not weighted,
+        )
+        if absolute:
+            np.abs(a, out=a)
+        elif weighted:
+            np.maximum(a, 0.0, out=a)
+        out.degree[chunk] = degree(a)
+        out.strength[chunk] = strength(a)
+        out.clustering[chunk] = clustering_coefficient(a, weighted=weighted)
+        out.local_efficiency[chunk] = local_efficiency(a)
+        out.global_efficiency[chunk] = global_efficiency(a, weighted=weighted)
+        out.modularity[chunk], out.communities[chunk] = modularity(a)
+    return GraphMetrics(
+        *(value.reshape(lead + value.shape[1:]) for value in out)
+    )
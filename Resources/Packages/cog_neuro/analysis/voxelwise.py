@@ -0,0 +1,405 @@
+"""
+Voxel-wise and seed-to-voxel functional connectivity.
+
+A dense voxel x voxel correlation matrix does not fit in memory for a
+whole-brain mask, so this module never builds one. Time series are
+standardized once so that correlations become dot products, and the
+matrix is computed tile by tile with float32 matrix multiplication. Each
+tile is reduced as soon as it is computed, to the edges above a threshold,
+the top-k neighbours of each voxel, or per-voxel degree and strength, so
+peak memory is bounded by the tile size. Row tiles are spread across a
+thread pool; NumPy releases the GIL inside the matrix products.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from ..utils.masked import MaskedTimeSeries
+
+
+# Voxels per tile side; a tile of correlations is tile_size^2 float32 values.
+_DEFAULT_TILE_SIZE = 2048
+
+
+class SparseConnectivity(NamedTuple):
+    """
+    Sparse voxel x voxel connectivity in compressed sparse row layout.
+
+    The neighbours of voxel ``i`` are ``indices[indptr[i]:indptr[i + 1]]``
+    with correlations ``data[indptr[i]:indptr[i + 1]]``. Rows and columns
+    index the voxels in ``voxels``, the flat (C-order) indices of the masked
+    voxels in the volume.
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    voxels: np.ndarray
+    shape: Tuple[int, int]
+
+    def to_dense(self) -> np.ndarray:
+        """Expand to a dense (voxel, voxel) array; only for small masks."""
+        dense = np.zeros(self.shape, dtype=self.data.dtype)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+
+class ConnectivityMaps(NamedTuple):
+    """Per-voxel degree and strength, as volumes when the input is 4D."""
+
+    degree: np.ndarray
+    strength: np.ndarray
+
+
+def standardize(
+    data: Union[np.ndarray, MaskedTimeSeries],
+    mask: Optional[np.ndarray] = None,
+    dtype: np.dtype = np.float32,
+    block_size: int = _DEFAULT_TILE_SIZE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Center and scale voxel time series so that dot products are correlations.
+
+    The result is allocated once and filled a block of voxels at a time,
+    each block converted to float64 only while it is processed, so memory
+    beyond the result is bounded by the block size.
+
+    Parameters
+    ----------
+    data : Union[np.ndarray, MaskedTimeSeries]
+        Array with shape (x, y, z, time) or (voxels, time), or masked time
+        series, whose voxels are used without scattering them to 4D.
+    mask : Optional[np.ndarray], optional
+        Boolean array matching ``data.shape[:-1]`` selecting the voxels to
+        keep, by default every voxel with non-zero variance.
+    dtype : np.dtype, optional
+        Dtype of the result, by default float32.
+    block_size : int, optional
+        Voxels processed at a time, by default 2048.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The standardized series with shape (voxels, time) and unit norm
+        rows (constant series are all zero), and the flat C-order index of
+        each row in ``data.shape[:-1]``.
+    """
+    n_timepoints = data.shape[-1]
+    if block_size < 1:
+        raise ValueError(f"block_size must be positive, got {block_size}")
+    if mask is not None:
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != data.shape[:-1]:
+            raise ValueError(
+                f"Mask shape {mask.shape} does not match data shape {data.shape[:-1]}"
+            )
+    # Rows of ``source`` to standardize, or None for all of them.
+    rows = None
+    if isinstance(data, MaskedTimeSeries):
+        source, voxels = data.series, data.voxel_indices
+        if mask is not None:
+            # Voxels outside the stored mask have no data and are dropped.
+            rows = np.flatnonzero(mask[data.mask])
+            voxels = voxels[rows]
+    else:
+        source = np.asarray(data).reshape(-1, n_timepoints)
+        if mask is not None:
+            rows = voxels = np.flatnonzero(mask)
+        else:
+            voxels = np.arange(source.shape[0])
+
+    n_rows = len(voxels)
+    out = np.empty((n_rows, n_timepoints), dtype=dtype)
+    norms = np.empty(n_rows)
+    for block in _tiles(n_rows, block_size):
+        x = np.array(source[block] if rows is None else source[rows[block]], dtype=np.float64)
+        x -= x.mean(axis=1, keepdims=True)
+        norms[block] = np.sqrt(np.einsum("ij,ij->i", x, x))
+        with np.errstate(divide="ignore"):
+            x *= np.where(norms[block] > 0, 1.0 / norms[block], 0.0)[:, None]
+        out[block] = x
+
+    if mask is None:
+        keep = np.flatnonzero(norms > 0)
+        if len(keep) < n_rows:
+            # Compact in place: a kept row never moves past its own position,
+            # so every block is read before it can be overwritten.
+            for start in range(0, len(keep), block_size):
+                block = keep[start:start + block_size]
+                out[start:start + len(block)] = out[block]
+            out, voxels = out[:len(keep)], voxels[keep]
+    return out, voxels
+
+
+def _tiles(n: int, tile_size: int) -> List[slice]:
+    return [slice(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+
+
+def _map_tiles(func, tiles: List[slice], n_jobs: int) -> list:
+    """Apply ``func`` to every row tile, in order, on up to ``n_jobs`` threads."""
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(tiles) == 1:
+        return [func(tile) for tile in tiles]
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(func, tiles))
+
+
+def _select(values: np.ndarray, threshold: float, absolute: bool) -> np.ndarray:
+    return np.abs(values) >= threshold if absolute else values >= threshold
+
+
+def _threshold_rows(
+    z: np.ndarray,
+    rows: slice,
+    tiles: List[slice],
+    threshold: float,
+    absolute: bool,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Edges above the threshold in one row tile, sorted by (row, column)."""
+    row_parts, col_parts, value_parts = [], [], []
+    block = z[rows]
+    own = np.arange(rows.start, rows.stop)
+    for cols in tiles:
+        corr = block @ z[cols].T
+        if cols.start < rows.stop and rows.start < cols.stop:
+            # Exclude self-connections on the diagonal tiles.
+            corr[np.arange(cols.start, cols.stop)[None, :] == own[:, None]] = np.nan
+        r, c = np.nonzero(_select(corr, threshold, absolute))
+        row_parts.append(r + rows.start)
+        col_parts.append(c + cols.start)
+        value_parts.append(corr[r, c])
+    r, c, v = (np.concatenate(p) for p in (row_parts, col_parts, value_parts))
+    order = np.lexsort((c, r))
+    return r[order], c[order], v[order]
+
+
+def _top_k_rows(
+    z: np.ndarray,
+    rows: slice,
+    tiles: List[slice],
+    k: int,
+    absolute: bool,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Columns and values of the ``k`` strongest neighbours of each row."""
+    n_rows = rows.stop - rows.start
+    best_cols = np.empty((n_rows, 0), dtype=np.int64)
+    best_vals = np.empty((n_rows, 0), dtype=z.dtype)
+    block = z[rows]
+    own = np.arange(rows.start, rows.stop)
+    for cols in tiles:
+        corr = block @ z[cols].T
+        columns = np.broadcast_to(np.arange(cols.start, cols.stop), corr.shape)
+        corr[columns == own[:, None]] = np.nan
+        # Merge the tile with the running candidates and keep the best k.
+        vals = np.concatenate([best_vals, corr], axis=1)
+        idx = np.concatenate([best_cols, columns], axis=1)
+        score = np.abs(vals) if absolute else vals.copy()
+        score[np.isnan(score)] = -np.inf
+        if vals.shape[1] > k:
+            part = np.argpartition(-score, k - 1, axis=1)[:, :k]
+            vals = np.take_along_axis(vals, part, axis=1)
+            idx = np.take_along_axis(idx, part, axis=1)
+        best_vals, best_cols = vals, idx
+    score = np.abs(best_vals) if absolute else best_vals.copy()
+    score[np.isnan(score)] = -np.inf
+    order = np.argsort(-score, axis=1, kind="stable")
+    return (
+        np.take_along_axis(best_cols, order, axis=1),
+        np.take_along_axis(best_vals, order, axis=1),
+    )
+
+
+def _degree_rows(
+    z: np.ndarray,
+    rows: slice,
+    tiles: List[slice],
+    threshold: float,
+    absolute: bool,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Degree and strength of each row over edges above the threshold."""
+    n_rows = rows.stop - rows.start
+    degree = np.zeros(n_rows, dtype=np.int64)
+    strength = np.zeros(n_rows, dtype=np.float64)
+    block = z[rows]
+    own = np.arange(rows.start, rows.stop)
+    for cols in tiles:
+        corr = block @ z[cols].T
+        if cols.start < rows.stop and rows.start < cols.stop:
+            corr[np.arange(cols.start, cols.stop)[None, :] == own[:, None]] = np.nan
+        selected = _select(corr, threshold, absolute)
+        degree += selected.sum(axis=1)
+        strength += np.where(selected, corr, 0).sum(axis=1, dtype=np.float64)
+    return degree, strength
+
+
+def voxelwise_connectivity(
+    data: Union[np.ndarray, MaskedTimeSeries],
+    mask: Optional[np.ndarray] = None,
+    reduction: str = "threshold",
+    threshold: float = 0.5,
+    k: int = 10,
+    absolute: bool = False,
+    tile_size: int = _DEFAULT_TILE_SIZE,
+    n_jobs: int = 1,
+) -> Union[SparseConnectivity, ConnectivityMaps]:
+    """
+    Compute voxel x voxel correlations tile by tile and reduce them.
+
+    Parameters
+    ----------
+    data : Union[np.ndarray, MaskedTimeSeries]
+        Array with shape (x, y, z, time) or (voxels, time), or masked time
+        series (see :func:`standardize`).
+    mask : Optional[np.ndarray], optional
+        Boolean array matching ``data.shape[:-1]`` selecting voxels, by
+        default every voxel with non-zero variance.
+    reduction : str, optional
+        ``"threshold"`` to keep every edge with correlation at or above
+        ``threshold``, ``"topk"`` to keep the ``k`` strongest neighbours of
+        each voxel, or ``"degree"`` for per-voxel degree and strength maps,
+        by default "threshold".
+    threshold : float, optional
+        Correlation threshold for ``"threshold"`` and ``"degree"``, by
+        default 0.5.
+    k : int, optional
+        Neighbours kept per voxel for ``"topk"``, by default 10.
+    absolute : bool, optional
+        Whether to threshold and rank by absolute correlation, by default
+        False.
+    tile_size : int, optional
+        Voxels per tile side, by default 2048. Each thread holds one
+        ``tile_size x tile_size`` float32 tile at a time.
+    n_jobs : int, optional
+        Number of threads, by default 1. Use -1 for one per CPU.
+
+    Returns
+    -------
+    Union[SparseConnectivity, ConnectivityMaps]
+        A sparse matrix for ``"threshold"`` and ``"topk"`` (self-connections
+        excluded), or degree and strength maps for ``"degree"``. Maps are
+        volumes of ``data.shape[:-1]`` with zeros outside the mask.
+
+    Raises
+    ------
+    ValueError
+        If the reduction or its parameters are invalid.
+    """
+    if reduction not in ("threshold", "topk", "degree"):
+        raise ValueError(f"Unknown reduction: {reduction}")
+    if tile_size < 1:
+        raise ValueError(f"tile_size must be positive, got {tile_size}")
+
+    z, voxels = standardize(data, mask, block_size=tile_size)
+    n_voxels = len(voxels)
+    tiles = _tiles(n_voxels, tile_size)
+
+    if reduction == "degree":
+        parts = _map_tiles(
+            lambda rows: _degree_rows(z, rows, tiles, threshold, absolute), tiles, n_jobs
+        )
+        degree = np.zeros(int(np.prod(data.shape[:-1])), dtype=np.int64)
+        strength = np.zeros(degree.shape, dtype=np.float64)
+        if parts:
+            degree[voxels] = np.concatenate([p[0] for p in parts])
+            strength[voxels] = np.concatenate([p[1] for p in parts])
+        return ConnectivityMaps(
+            degree.reshape(data.shape[:-1]), strength.reshape(data.shape[:-1])
+        )
+
+    if reduction == "topk":
+        if not 0 < k < n_voxels:
+            raise ValueError(f"k must be between 1 and {n_voxels - 1}, got {k}")
+        parts = _map_tiles(
+            lambda rows: _top_k_rows(z, rows, tiles, k, absolute), tiles, n_jobs
+        )
+        indices = np.concatenate([p[0] for p in parts]).ravel()
+        values = np.concatenate([p[1] for p in parts]).ravel()
+        indptr = np.arange(0, n_voxels * k + 1, k, dtype=np.int64)
+        return SparseConnectivity(indptr, indices, values, voxels, (n_voxels, n_voxels))
+
+    parts = _map_tiles(
+        lambda rows: _threshold_rows(z, rows, tiles, threshold, absolute), tiles, n_jobs
+    )
+    rows = np.concatenate([p[0] for p in parts]) if parts else np.empty(0, np.int64)
+    indices = np.concatenate([p[1] for p in parts]) if parts else np.empty(0, np.int64)
+    values = np.concatenate([p[2] for p in parts]) if parts else np.empty(0, z.dtype)
+    indptr = np.zeros(n_voxels + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_voxels), out=indptr[1:])
+    return SparseConnectivity(indptr, indices, values, voxels, (n_voxels, n_voxels))
+
+
+def seed_to_voxel(
+    data: Union[np.ndarray, MaskedTimeSeries],
+    seed: np.ndarray,
+    mask: Optional[np.ndarray] = None,
+    tile_size: int = 65536,
+) -> np.ndarray:
+    """
+    Correlate one seed time series with every voxel.
+
+    Voxels are standardized and multiplied with the seed one tile at a
+    time, so only a tile of voxel time series is ever held in float64.
+
+    Parameters
+    ----------
+    data : Union[np.ndarray, MaskedTimeSeries]
+        Array with shape (x, y, z, time) or (voxels, time), or masked time
+        series (voxels outside their mask are zero in the map).
+    seed : np.ndarray
+        The seed time series with shape (time,), or a boolean seed region
+        matching ``data.shape[:-1]`` whose mean time series is used.
+    mask : Optional[np.ndarray], optional
+        Boolean array matching ``data.shape[:-1]``; voxels outside it are set
+        to zero, by default None.
+    tile_size : int, optional
+        Voxels processed at a time, by default 65536.
+
+    Returns
+    -------
+    np.ndarray
+        Correlation map with shape ``data.shape[:-1]``. Constant voxels are
+        zero.
+    """
+    n_timepoints = data.shape[-1]
+    seed = np.asarray(seed)
+    if seed.shape == data.shape[:-1] and seed.dtype == bool:
+        if isinstance(data, MaskedTimeSeries):
+            seed = data.series[seed[data.mask]]
+        else:
+            seed = data[seed]
+        seed = np.asarray(seed, dtype=np.float64).mean(axis=0)
+    if seed.shape != (n_timepoints,):
+        raise ValueError(
+            f"Seed must be a time series of length {n_timepoints} or a boolean "
+            f"region of shape {data.shape[:-1]}, got shape {seed.shape}"
+        )
+    seed = seed - seed.mean()
+    seed_norm = np.linalg.norm(seed)
+    if seed_norm == 0:
+        raise ValueError("Seed time series is constant")
+    seed = seed / seed_norm
+
+    if isinstance(data, MaskedTimeSeries):
+        matrix, flat_order = data.series, "C"
+    else:
+        # Flatten voxels in the data's own memory order so no copy is needed.
+        flat_order = "F" if data.flags.f_contiguous and not data.flags.c_contiguous else "C"
+        matrix = data.reshape(-1, n_timepoints, order=flat_order)
+    result = np.zeros(matrix.shape[0], dtype=np.float32)
+    for tile in _tiles(matrix.shape[0], tile_size):
+        block = np.asarray(matrix[tile], dtype=np.float64)
+        block = block - block.mean(axis=1, keepdims=True)
+        norms = np.sqrt(np.einsum("ij,ij->i", block, block))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[tile] = np.where(norms > 0, (block @ seed) / norms, 0.0)
+    if isinstance(data, MaskedTimeSeries):
+        result = data.map_volume(result)
+    else:
+        result = result.reshape(data.shape[:-1], order=flat_order)
+    if mask is not None:
+        result[~np.asarray(mask, dtype=bool)] = 0
+    return result
@@ -5,6 +5,26 @@ This module provides functions and classes for processing and analyzing
 neuroimaging data, including fMRI, EEG, and other modalities.
 """
 
+from .batch import SubjectResult, run_batch
+from .cache import StageCache
+from .confounds import ConfoundRegressor, regress_confounds
+from .nifti import NiftiImage, create_nifti, read_header, save_nifti
 from .preprocess import load_dataset, standard_pipeline
+from .realtime import OnlinePipeline, VolumeResult, replay
 
-__all__ = ["load_dataset", "standard_pipeline"]
+__all__ = [
+    "ConfoundRegressor",
+    "NiftiImage",
+    "OnlinePipeline",
+    "StageCache",
+    "SubjectResult",
+    "VolumeResult",
+    "create_nifti",
+    "load_dataset",
+    "read_header",
+    "regress_confounds",
+    "replay",
+    "run_batch",
+    "save_nifti",
+    "standard_pipeline",
+]
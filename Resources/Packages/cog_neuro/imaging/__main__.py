@@ -0,0 +1,7 @@
+"""Command-line entry point for multi-subject batch preprocessing."""
+
+import sys
+
+from .batch import main
+
+sys.exit(main())
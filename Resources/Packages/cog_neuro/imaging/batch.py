@@ -0,0 +1,340 @@
+"""
+Multi-subject batch preprocessing.
+
+This module schedules :func:`standard_pipeline` over many input files across
+a process pool. Concurrency is limited both by a worker count and by a
+memory budget, using a per-subject estimate derived from the NIfTI header.
+Workers never receive or return pickled arrays: results are either written
+straight into a memory-mapped output file, or into a shared memory block
+allocated by the parent. A failing subject is reported in its result and
+does not stop the rest of the batch.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import traceback
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from ..utils.shared_memory import SharedArray
+from .nifti import create_nifti, read_header
+from .preprocess import load_dataset, standard_pipeline
+
+
+# Rough number of float64 block-sized working buffers a pipeline stage holds.
+_WORKING_BUFFERS = 8
+
+
+class SubjectResult(NamedTuple):
+    """Outcome of preprocessing one subject."""
+
+    subject: str
+    output: Union[str, np.ndarray, None]
+    seconds: float
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the subject was processed successfully."""
+        return self.error is None
+
+
+def estimate_memory(
+    filepath: str,
+    block_size: int = 16,
+    dtype: Any = np.float32,
+    in_memory_output: bool = False,
+) -> int:
+    """
+    Estimate the peak memory in bytes needed to preprocess one subject.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the subject's NIfTI file.
+    block_size : int, optional
+        Volumes per block in chunked mode, by default 16.
+    dtype : Any, optional
+        Working dtype, by default float32.
+    in_memory_output : bool, optional
+        Whether the output is held in (shared) memory rather than written to
+        a memory-mapped file, by default False.
+
+    Returns
+    -------
+    int
+        Estimated peak memory in bytes.
+    """
+    header = read_header(filepath)
+    shape = header["shape"]
+    n_voxels = int(np.prod(shape[:3], dtype=np.int64))
+    n_samples = n_voxels * (shape[3] if len(shape) == 4 else 1)
+
+    estimate = _WORKING_BUFFERS * block_size * n_voxels * 8
+    if in_memory_output:
+        estimate += n_samples * np.dtype(dtype).itemsize
+    if header["scaled"]:
+        # Scaled inputs cannot be memory-mapped and are decoded to float64.
+        estimate += n_samples * 8
+    elif filepath.lower().endswith(".gz"):
+        estimate += n_samples * header["dtype"].itemsize
+    return int(estimate)
+
+
+def output_path(filepath: str, output_dir: str, suffix: str = "_preproc") -> str:
+    """Output ``.nii`` path for an input file inside ``output_dir``."""
+    name = os.path.basename(filepath)
+    stem = re.sub(r"\.nii(\.gz)?$", "", name, flags=re.IGNORECASE)
+    return os.path.join(output_dir, f"{stem}{suffix}.nii")
+
+
+def _process_subject(
+    filepath: str,
+    destination: Union[str, tuple],
+    kwargs: Dict[str, Any],
+) -> float:
+    """
+    Preprocess one subject in a worker process.
+
+    ``destination`` is either an output path or the descriptor of a shared
+    array allocated by the parent. Returns the processing time in seconds.
+    """
+    start = time.perf_counter()
+    header = read_header(filepath)
+    kwargs = dict(kwargs)
+    zooms = header["zooms"]
+    kwargs.setdefault("voxel_size", zooms[:3])
+    if len(zooms) == 4 and zooms[3] > 0:
+        kwargs.setdefault("t_r", zooms[3])
+    dtype = np.dtype(kwargs.pop("dtype", np.float32))
+
+    data = load_dataset(filepath)
+    if isinstance(destination, str):
+        out = create_nifti(
+            destination, data.shape, dtype=dtype, affine=header["affine"], zooms=zooms
+        )
+        standard_pipeline(data, out=out, dtype=dtype, **kwargs)
+        out.flush()
+        del out
+    else:
+        shared = SharedArray.attach(destination)
+        try:
+            standard_pipeline(data, out=shared.array, dtype=dtype, **kwargs)
+        finally:
+            shared.close()
+    return time.perf_counter() - start
+
+
+def run_batch(
+    filepaths: Sequence[str],
+    subject_kwargs: Optional[Sequence[Dict[str, Any]]] = None,
+    output_dir: Optional[str] = None,
+    n_workers: Optional[int] = None,
+    memory_budget: Optional[int] = None,
+    block_size: int = 16,
+    dtype: Any = np.float32,
+    **kwargs: Any
+) -> List[SubjectResult]:
+    """
+    Preprocess many subjects in parallel.
+
+    Parameters
+    ----------
+    filepaths : Sequence[str]
+        Paths to the subjects' NIfTI files.
+    subject_kwargs : Optional[Sequence[Dict[str, Any]]], optional
+        Per-subject pipeline parameters, aligned with ``filepaths`` and
+        merged over ``kwargs``, by default None.
+    output_dir : Optional[str], optional
+        Directory to write ``<name>_preproc.nii`` outputs to. If None, the
+        preprocessed arrays are returned in memory, by default None.
+    n_workers : Optional[int], optional
+        Maximum number of worker processes, by default one per CPU.
+    memory_budget : Optional[int], optional
+        Maximum total estimated memory in bytes for subjects in flight, by
+        default unlimited. A subject that exceeds the budget on its own is
+        still run, but alone.
+    block_size : int, optional
+        Volumes per block for the chunked pipeline, by default 16.
+    dtype : Any, optional
+        Working and output dtype, by default float32.
+    **kwargs : Any
+        Parameters passed to :func:`standard_pipeline` for every subject.
+        Voxel size and TR default to the values in each file's header.
+
+    Returns
+    -------
+    List[SubjectResult]
+        One result per input, in input order. Failed subjects have an
+        ``error`` message and no output.
+    """
+    filepaths = [str(p) for p in filepaths]
+    if subject_kwargs is None:
+        subject_kwargs = [{} for _ in filepaths]
+    if len(subject_kwargs) != len(filepaths):
+        raise ValueError("subject_kwargs must have one entry per file")
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = max(1, n_workers)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results: List[Optional[SubjectResult]] = [None] * len(filepaths)
+    estimates: Dict[int, int] = {}
+    pending = list(range(len(filepaths)))
+    for index in list(pending):
+        try:
+            estimates[index] = estimate_memory(
+                filepaths[index], block_size, dtype, in_memory_output=output_dir is None
+            )
+        except Exception as exc:
+            results[index] = SubjectResult(filepaths[index], None, 0.0, repr(exc))
+            pending.remove(index)
+
+    in_flight: Dict[Any, int] = {}
+    shared: Dict[int, SharedArray] = {}
+    reserved = 0
+    pool = ProcessPoolExecutor(max_workers=n_workers)
+
+    def finish(index: int, output: Any, seconds: float, error: Optional[str]) -> None:
+        if index in shared:
+            block = shared.pop(index)
+            if error is None:
+                output = np.array(block.array)
+            block.unlink()
+        results[index] = SubjectResult(filepaths[index], output, seconds, error)
+
+    try:
+        while pending or in_flight:
+            # Submit as many subjects as the worker count and budget allow.
+            while pending and len(in_flight) < n_workers:
+                index = pending[0]
+                if (
+                    in_flight
+                    and memory_budget is not None
+                    and reserved + estimates[index] > memory_budget
+                ):
+                    break
+                pending.pop(0)
+                options = dict(kwargs, block_size=block_size, dtype=dtype)
+                options.update(subject_kwargs[index])
+                if output_dir is not None:
+                    destination = output_path(filepaths[index], output_dir)
+                else:
+                    shape = read_header(filepaths[index])["shape"]
+                    shared[index] = SharedArray.create(shape, options["dtype"])
+                    destination = shared[index].descriptor
+                future = pool.submit(
+                    _process_subject, filepaths[index], destination, options
+                )
+                in_flight[future] = index
+                reserved += estimates[index]
+
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                index = in_flight.pop(future)
+                reserved -= estimates[index]
+                try:
+                    seconds = future.result()
+                except BrokenProcessPool as exc:
+                    broken = True
+                    finish(index, None, 0.0, f"Worker process died: {exc!r}")
+                except Exception:
+                    finish(index, None, 0.0, traceback.format_exc())
+                else:
+                    output = None
+                    if output_dir is not None:
+                        output = output_path(filepaths[index], output_dir)
+                    finish(index, output, seconds, None)
+
+            if broken:
+                # A crashed worker takes the whole pool with it; fail the
+                # subjects that were running and start a fresh pool.
+                for future, index in list(in_flight.items()):
+                    reserved -= estimates[index]
+                    finish(index, None, 0.0, "Worker pool crashed while running")
+                in_flight.clear()
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=n_workers)
+    finally:
+        pool.shutdown(wait=True)
+        for block in shared.values():
+            block.unlink()
+
+    return results
+
+
+def _parse_bytes(value: str) -> int:
+    """Parse a size such as ``512M`` or ``16G`` into bytes."""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)B?\s*", value, flags=re.IGNORECASE)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Invalid memory size: {value}")
+    scale = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+    return int(float(match.group(1)) * scale[match.group(2).upper()])
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command-line entry point: ``python -m cog_neuro.imaging``."""
+    parser = argparse.ArgumentParser(
+        prog="python -m cog_neuro.imaging",
+        description="Run the standard preprocessing pipeline over many subjects.",
+    )
+    parser.add_argument("inputs", nargs="+", help="Input .nii/.nii.gz files")
+    parser.add_argument("-o", "--output-dir", required=True, help="Output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="Maximum number of worker processes (default: CPU count)")
+    parser.add_argument("-m", "--memory-budget", type=_parse_bytes, default=None,
+                        help="Memory budget for subjects in flight, e.g. 32G")
+    parser.add_argument("--block-size", type=int, default=16,
+                        help="Volumes per block (default: 16)")
+    parser.add_argument("--fwhm", type=float, default=6.0,
+                        help="Smoothing FWHM in mm (default: 6.0)")
+    parser.add_argument("--high-pass", type=float, default=0.01,
+                        help="High-pass cutoff in Hz (default: 0.01)")
+    parser.add_argument("--low-pass", type=float, default=None,
+                        help="Low-pass cutoff in Hz (default: none)")
+    parser.add_argument("--t-r", type=float, default=None,
+                        help="Repetition time in seconds (default: from header)")
+    parser.add_argument("--no-motion-correction", action="store_true")
+    parser.add_argument("--no-spatial-smoothing", action="store_true")
+    parser.add_argument("--no-temporal-filtering", action="store_true")
+    args = parser.parse_args(argv)
+
+    kwargs: Dict[str, Any] = {
+        "motion_correction": not args.no_motion_correction,
+        "spatial_smoothing": not args.no_spatial_smoothing,
+        "temporal_filtering": not args.no_temporal_filtering,
+        "fwhm": args.fwhm,
+        "high_pass": args.high_pass,
+        "low_pass": args.low_pass,
+    }
+    if args.t_r is not None:
+        kwargs["t_r"] = args.t_r
+
+    start = time.perf_counter()
+    results = run_batch(
+        args.inputs,
+        output_dir=args.output_dir,
+        n_workers=args.workers,
+        memory_budget=args.memory_budget,
+        block_size=args.block_size,
+        **kwargs
+    )
+    elapsed = time.perf_counter() - start
+
+    failures = [r for r in results if not r.ok]
+    for result in results:
+        status = "ok" if result.ok else "FAILED"
+        print(f"{status:6s} {result.subject} ({result.seconds:.1f} s)")
+    for result in failures:
+        print(f"\n{result.subject}:\n{result.error}", file=sys.stderr)
+    n_ok = len(results) - len(failures)
+    rate = n_ok / elapsed * 3600 if elapsed > 0 else float("inf")
+    print(f"\n{n_ok}/{len(results)} subjects in {elapsed:.1f} s ({rate:.1f} subjects/hour)")
+    return 1 if failures else 0
@@ -0,0 +1,254 @@
+"""
+Content-addressed on-disk cache for preprocessing stage outputs.
+
+Each cached intermediate is stored as a ``.npy`` file named by a hash of
+the input data (or its file path, size and mtime when the input is a
+memmap), the chain of stages applied so far, and each stage's parameters.
+Hits are returned as read-only memmaps, so a parameter sweep only pays for
+the stages whose inputs or parameters changed. The cache directory is
+capped in size and evicts least-recently-used entries.
+"""
+
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import tempfile
+import time
+import numpy as np
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+# Parameters that affect speed but not results, or that are determined by
+# earlier stages (motion_params), excluded from stage keys.
+_EXCLUDED_PARAMS = {"data", "n_jobs", "return_params", "kwargs", "out", "motion_params"}
+
+# Bytes hashed per update when fingerprinting in-memory arrays.
+_HASH_CHUNK = 64 * 2 ** 20
+
+
+def _hash_array(array: np.ndarray, digest: Any) -> None:
+    """
+    Feed an array's shape, dtype and contents into ``digest``.
+
+    The contents are hashed in C order, in bounded row blocks, so the same
+    values give the same hash regardless of memory layout.
+    """
+    digest.update(repr((array.shape, array.dtype.str)).encode())
+    if array.ndim == 0 or array.size == 0:
+        digest.update(array.tobytes())
+        return
+    row_bytes = max(1, array[0].nbytes)
+    step = max(1, _HASH_CHUNK // row_bytes)
+    for start in range(0, array.shape[0], step):
+        digest.update(np.ascontiguousarray(array[start:start + step]).data)
+
+
+def data_key(data: np.ndarray) -> str:
+    """
+    Fingerprint input data for use as the root of a cache key.
+
+    Top-level memmaps are identified by their file's path, size, mtime and
+    offset, which avoids reading the data; any other array is hashed.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The input data.
+
+    Returns
+    -------
+    str
+        Hex digest identifying the data.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    if (
+        isinstance(data, np.memmap)
+        and data.filename is not None
+        and isinstance(data.base, mmap.mmap)
+    ):
+        stat = os.stat(data.filename)
+        digest.update(repr((
+            "memmap", os.path.realpath(data.filename), stat.st_size,
+            stat.st_mtime_ns, data.offset, data.shape, data.dtype.str,
+            data.flags.f_contiguous,
+        )).encode())
+    else:
+        _hash_array(np.asarray(data), digest)
+    return digest.hexdigest()
+
+
+def _param_token(value: Any) -> Any:
+    """JSON-serializable stand-in for a parameter value."""
+    if isinstance(value, np.ndarray):
+        digest = hashlib.blake2b(digest_size=20)
+        _hash_array(value, digest)
+        return {"array": digest.hexdigest()}
+    if isinstance(value, (np.generic,)):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_param_token(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _param_token(v) for k, v in sorted(value.items())}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return repr(value)
+
+
+def stage_params(func: Callable, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolve the parameters a stage function will actually use.
+
+    Parameters
+    ----------
+    func : Callable
+        The stage function, e.g. ``_apply_spatial_smoothing``.
+    kwargs : Dict[str, Any]
+        The keyword arguments it will be called with.
+
+    Returns
+    -------
+    Dict[str, Any]
+        Every named parameter of ``func`` (other than the data and options
+        that do not change results), with its value from ``kwargs`` or its
+        default.
+    """
+    params = {}
+    for name, parameter in inspect.signature(func).parameters.items():
+        if name in _EXCLUDED_PARAMS or parameter.kind is parameter.VAR_KEYWORD:
+            continue
+        params[name] = kwargs.get(name, parameter.default)
+    return params
+
+
+def stage_key(parent_key: str, stage: str, params: Dict[str, Any]) -> str:
+    """Cache key for applying ``stage`` with ``params`` to ``parent_key``."""
+    payload = json.dumps(
+        [parent_key, stage, _param_token(params)], sort_keys=True
+    ).encode()
+    return hashlib.blake2b(payload, digest_size=20).hexdigest()
+
+
+class StageCache:
+    """
+    Directory of cached stage outputs with a size cap and LRU eviction.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to store entries in; created if missing.
+    max_bytes : Optional[int], optional
+        Maximum total size of the cache in bytes, by default unlimited.
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # Explicit nanosecond times keep the LRU order exact even when the
+        # filesystem's own timestamps are coarser than the access rate.
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[np.memmap]:
+        """
+        Return the cached array for ``key`` as a read-only memmap, or None.
+
+        A hit refreshes the entry's position in the LRU order.
+        """
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            self._touch(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return array
+
+    def create(
+        self, shape: Tuple[int, ...], dtype: Any
+    ) -> Tuple[np.memmap, str]:
+        """
+        Allocate a writable, memory-mapped entry to be filled in place.
+
+        Returns
+        -------
+        Tuple[np.memmap, str]
+            The writable memmap and its temporary path, to be passed to
+            :meth:`commit` once filled.
+        """
+        fd, tmp_path = tempfile.mkstemp(suffix=".npy.tmp", dir=self.directory)
+        os.close(fd)
+        array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+        return array, tmp_path
+
+    def commit(self, key: str, array: np.memmap, tmp_path: str) -> np.memmap:
+        """Publish an entry allocated with :meth:`create` under ``key``."""
+        array.flush()
+        del array
+        path = self._path(key)
+        os.replace(tmp_path, path)
+        self._touch(path)
+        self.evict(keep=path)
+        return self.get(key)
+
+    def put(self, key: str, array: np.ndarray) -> np.memmap:
+        """Store ``array`` under ``key`` and return it as a read-only memmap."""
+        entry, tmp_path = self.create(array.shape, array.dtype)
+        entry[...] = array
+        return self.commit(key, entry, tmp_path)
+
+    def _entries(self) -> Iterable[Tuple[int, int, str]]:
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npy"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield stat.st_mtime_ns, stat.st_size, path
+
+    @property
+    def size(self) -> int:
+        """Total size of all entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Remove least-recently-used entries until under ``max_bytes``.
+
+        The entry at path ``keep`` (normally the one just written) is never
+        removed, even if it alone exceeds the cap.
+        """
+        if self.max_bytes is None:
+            return
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        for _, _, path in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
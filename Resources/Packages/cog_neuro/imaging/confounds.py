@@ -0,0 +1,260 @@
+"""
+Nuisance (confound) regression for neuroimaging time series.
+
+The confound design matrix is factorized once with a QR decomposition
+into an orthonormal basis ``Q``, after which the residuals of every voxel
+are ``y - Q (Q^T y)``: two matrix products over blocks of the voxels x time
+matrix, with no per-voxel least-squares solve. Factorizations are cached
+by the content of the design, so runs or subjects that share a design
+reuse them, and the products run in the dtype of the data (e.g. float32)
+and in place where possible.
+"""
+
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from typing import Optional, Sequence, Union
+
+
+# Voxel time series regressed per matrix product.
+_VOXELS_PER_BLOCK = 16384
+
+# Number of confound factorizations kept in memory.
+_REGRESSOR_CACHE_SIZE = 16
+
+_regressor_cache: "OrderedDict[str, ConfoundRegressor]" = OrderedDict()
+
+
+def motion_confounds(params: np.ndarray, derivatives: bool = True) -> np.ndarray:
+    """
+    Build motion regressors from realignment parameters.
+
+    Parameters
+    ----------
+    params : np.ndarray
+        Motion parameters with shape (n_volumes, 6), as returned by
+        :func:`cog_neuro.imaging.motion.realign`.
+    derivatives : bool, optional
+        Whether to append the backward differences of the parameters, by
+        default True (the common 12-parameter model).
+
+    Returns
+    -------
+    np.ndarray
+        Confounds with shape (n_volumes, 6) or (n_volumes, 12).
+    """
+    params = np.asarray(params, dtype=np.float64)
+    if params.ndim != 2 or params.shape[1] != 6:
+        raise ValueError(f"Expected (n_volumes, 6) motion parameters, got {params.shape}")
+    if not derivatives:
+        return params
+    diff = np.zeros_like(params)
+    diff[1:] = np.diff(params, axis=0)
+    return np.hstack([params, diff])
+
+
+class ConfoundRegressor:
+    """
+    Orthonormal basis of a confound design, for fast residualization.
+
+    Parameters
+    ----------
+    confounds : np.ndarray
+        Design matrix with shape (n_timepoints, n_confounds).
+    preserve_mean : bool, optional
+        Whether to keep each voxel's mean, by default True. The confounds
+        are then centered, so their span is orthogonal to the constant;
+        otherwise a constant column is added and the mean is removed too.
+
+    Attributes
+    ----------
+    basis : np.ndarray
+        Orthonormal basis of the (centered) design with shape
+        (n_timepoints, rank). Rank-deficient designs, e.g. with duplicated
+        columns, are reduced to their numerical rank.
+    """
+
+    def __init__(self, confounds: np.ndarray, preserve_mean: bool = True):
+        design = np.asarray(confounds, dtype=np.float64)
+        if design.ndim == 1:
+            design = design[:, np.newaxis]
+        if design.ndim != 2:
+            raise ValueError(f"Confounds must be 2D (time, confound), got {design.ndim}D")
+        if not np.all(np.isfinite(design)):
+            raise ValueError("Confounds contain NaN or infinite values")
+
+        n_timepoints = design.shape[0]
+        if preserve_mean:
+            design = design - design.mean(axis=0)
+        else:
+            design = np.hstack([np.ones((n_timepoints, 1)), design])
+
+        basis = np.zeros((n_timepoints, 0))
+        if design.shape[1]:
+            q, r = np.linalg.qr(design)
+            diag = np.abs(np.diag(r))
+            tol = max(design.shape) * np.finfo(np.float64).eps * max(diag.max(), 1e-300)
+            if np.all(diag > tol):
+                basis = q
+            else:
+                # Householder QR without pivoting cannot drop dependent
+                # columns cleanly; fall back to the SVD for the rank.
+                u, s, _ = np.linalg.svd(design, full_matrices=False)
+                basis = u[:, s > max(design.shape) * np.finfo(np.float64).eps * s[0]]
+        basis.setflags(write=False)
+        self.basis = basis
+        self.preserve_mean = preserve_mean
+        self._cast = {np.dtype(np.float64): basis}
+
+    @property
+    def n_timepoints(self) -> int:
+        """Number of time points the design covers."""
+        return self.basis.shape[0]
+
+    @property
+    def rank(self) -> int:
+        """Number of independent confound directions removed."""
+        return self.basis.shape[1]
+
+    def _basis(self, dtype: np.dtype) -> np.ndarray:
+        if dtype not in self._cast:
+            basis = self.basis.astype(dtype)
+            basis.setflags(write=False)
+            self._cast[dtype] = basis
+        return self._cast[dtype]
+
+    def _residualize(self, matrix: np.ndarray) -> None:
+        """Regress the basis out of the rows of a (voxel, time) matrix in place."""
+        basis = self._basis(matrix.dtype)
+        for start in range(0, matrix.shape[0], _VOXELS_PER_BLOCK):
+            rows = matrix[start:start + _VOXELS_PER_BLOCK]
+            rows -= (rows @ basis) @ basis.T
+
+    def transform(
+        self,
+        data: np.ndarray,
+        mask: Optional[np.ndarray] = None,
+        out: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Remove the confounds from every time series of ``data``.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Array with time on the last axis, e.g. (x, y, z, time) or
+            (voxels, time).
+        mask : Optional[np.ndarray], optional
+            Boolean array matching ``data.shape[:-1]``; only voxels inside
+            it are regressed and the rest are copied unchanged, by default
+            None.
+        out : Optional[np.ndarray], optional
+            Array to write the residuals into, by default a new array of the
+            input's floating dtype (float64 for integer input). May be
+            ``data`` itself to work in place.
+
+        Returns
+        -------
+        np.ndarray
+            The residual time series, with the shape of ``data``.
+        """
+        if data.shape[-1] != self.n_timepoints:
+            raise ValueError(
+                f"Data has {data.shape[-1]} time points but the confounds have "
+                f"{self.n_timepoints}"
+            )
+        if out is None:
+            dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+            out = np.empty(data.shape, dtype=dtype)
+        if out is not data:
+            out[...] = data
+        if self.rank == 0:
+            return out
+
+        n_timepoints = self.n_timepoints
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            if mask.shape != data.shape[:-1]:
+                raise ValueError(
+                    f"Mask shape {mask.shape} does not match data shape {data.shape[:-1]}"
+                )
+            if mask.any():
+                matrix = out[mask]
+                self._residualize(matrix)
+                out[mask] = matrix
+            return out
+
+        if out.flags.c_contiguous:
+            self._residualize(out.reshape(-1, n_timepoints))
+            return out
+        # Non-contiguous outputs (e.g. Fortran-ordered memmaps) are processed
+        # a slab of the first axis at a time through a contiguous copy.
+        slab = max(1, _VOXELS_PER_BLOCK // max(int(np.prod(out.shape[1:-1])), 1))
+        for start in range(0, out.shape[0], slab):
+            block = np.ascontiguousarray(out[start:start + slab])
+            self._residualize(block.reshape(-1, n_timepoints))
+            out[start:start + slab] = block
+        return out
+
+
+def confound_regressor(
+    confounds: Union[np.ndarray, Sequence[Sequence[float]]],
+    preserve_mean: bool = True,
+) -> ConfoundRegressor:
+    """
+    Return the (cached) :class:`ConfoundRegressor` for a design matrix.
+
+    Designs are cached by content, so calling this once per run with the
+    same confounds factorizes the design only once.
+    """
+    design = np.ascontiguousarray(confounds, dtype=np.float64)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(repr((design.shape, preserve_mean)).encode())
+    digest.update(design.data)
+    key = digest.hexdigest()
+
+    regressor = _regressor_cache.get(key)
+    if regressor is None:
+        regressor = ConfoundRegressor(design, preserve_mean=preserve_mean)
+        _regressor_cache[key] = regressor
+        if len(_regressor_cache) > _REGRESSOR_CACHE_SIZE:
+            _regressor_cache.popitem(last=False)
+    else:
+        _regressor_cache.move_to_end(key)
+    return regressor
+
+
+def regress_confounds(
+    data: np.ndarray,
+    confounds: Union[np.ndarray, ConfoundRegressor],
+    preserve_mean: bool = True,
+    mask: Optional[np.ndarray] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Regress confounds out of time series along the last axis.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Array with time on the last axis.
+    confounds : Union[np.ndarray, ConfoundRegressor]
+        Design matrix with shape (n_timepoints, n_confounds), or a prepared
+        regressor to reuse its factorization explicitly.
+    preserve_mean : bool, optional
+        Whether to keep each voxel's mean, by default True. Ignored when a
+        regressor is given.
+    mask : Optional[np.ndarray], optional
+        Boolean array matching ``data.shape[:-1]`` selecting the voxels to
+        regress, by default all.
+    out : Optional[np.ndarray], optional
+        Array to write into, by default a new array. May be ``data`` itself.
+
+    Returns
+    -------
+    np.ndarray
+        The residual time series.
+    """
+    if not isinstance(confounds, ConfoundRegressor):
+        confounds = confound_regressor(confounds, preserve_mean=preserve_mean)
+    return confounds.transform(data, mask=mask, out=out)
@@ -0,0 +1,438 @@
+"""
+Rigid-body (6-DOF) realignment of fMRI volumes.
+
+Each volume is registered to a reference by Gauss-Newton least squares on
+a coarse-to-fine image pyramid, in the style of SPM's realign: the
+Jacobian is built once per pyramid level from the reference gradients and
+shared by every volume. Motion parameters are three translations in mm
+followed by three rotations in radians about the x, y and z axes, applied
+about the volume centre. Volumes can be registered in parallel across a
+process pool that reads and writes shared-memory buffers.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from ..utils.shared_memory import SharedArray
+
+
+# Maximum number of sample points used to estimate motion at any level.
+_MAX_SAMPLES = 60000
+
+# Gauss-Newton stops when the update is below these tolerances.
+_TRANSLATION_TOL = 1e-3  # mm
+_ROTATION_TOL = 1e-5  # radians
+
+
+def rotation_matrix(rx: float, ry: float, rz: float) -> np.ndarray:
+    """Rotation matrix ``Rz @ Ry @ Rx`` for angles in radians."""
+    cx, sx = np.cos(rx), np.sin(rx)
+    cy, sy = np.cos(ry), np.sin(ry)
+    cz, sz = np.cos(rz), np.sin(rz)
+    rot_x = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    rot_y = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rot_z = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return rot_z @ rot_y @ rot_x
+
+
+def rigid_matrix(
+    params: Sequence[float],
+    voxel_size: Sequence[float],
+    center: Sequence[float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Voxel-space mapping from reference voxels to moving-volume voxels.
+
+    Parameters
+    ----------
+    params : Sequence[float]
+        Translations (mm) and rotations (radians): tx, ty, tz, rx, ry, rz.
+    voxel_size : Sequence[float]
+        Voxel size in mm along each axis.
+    center : Sequence[float]
+        Rotation centre in voxel coordinates.
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Matrix ``A`` (3x3) and offset ``b`` such that a reference voxel
+        ``x`` samples the moving volume at ``A @ x + b``.
+    """
+    voxel_size = np.asarray(voxel_size, dtype=np.float64)
+    center = np.asarray(center, dtype=np.float64)
+    rotation = rotation_matrix(*params[3:6])
+    matrix = rotation * voxel_size[np.newaxis, :] / voxel_size[:, np.newaxis]
+    offset = center - matrix @ center + np.asarray(params[:3]) / voxel_size
+    return matrix, offset
+
+
+def trilinear_sample(volume: np.ndarray, coords: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample a volume at arbitrary voxel coordinates by trilinear interpolation.
+
+    Parameters
+    ----------
+    volume : np.ndarray
+        C-contiguous 3D volume.
+    coords : np.ndarray
+        Coordinates with shape (3, n_points).
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Interpolated values (0 outside the volume) and a boolean mask of the
+        points that fell inside the volume.
+    """
+    shape = volume.shape
+    flat = volume.reshape(-1)
+    inside = np.ones(coords.shape[1], dtype=bool)
+    base = []
+    frac = []
+    for axis in range(3):
+        c = coords[axis]
+        inside &= (c >= 0) & (c <= shape[axis] - 1)
+        c0 = np.clip(np.floor(c), 0, max(shape[axis] - 2, 0)).astype(np.intp)
+        base.append(c0)
+        frac.append(c - c0)
+
+    stride_y, stride_x = shape[2], shape[1] * shape[2]
+    index = base[0] * stride_x + base[1] * stride_y + base[2]
+    fx, fy, fz = frac
+    dx = stride_x if shape[0] > 1 else 0
+    dy = stride_y if shape[1] > 1 else 0
+    dz = 1 if shape[2] > 1 else 0
+
+    c00 = flat[index] * (1 - fz) + flat[index + dz] * fz
+    c01 = flat[index + dy] * (1 - fz) + flat[index + dy + dz] * fz
+    c10 = flat[index + dx] * (1 - fz) + flat[index + dx + dz] * fz
+    c11 = flat[index + dx + dy] * (1 - fz) + flat[index + dx + dy + dz] * fz
+    values = (c00 * (1 - fy) + c01 * fy) * (1 - fx) + (c10 * (1 - fy) + c11 * fy) * fx
+    values[~inside] = 0
+    return values, inside
+
+
+def _voxel_grid(shape: Tuple[int, ...], step: int = 1) -> np.ndarray:
+    """Voxel coordinates of a (strided) grid, with shape (3, n_points)."""
+    axes = [np.arange(0, n, step, dtype=np.float64) for n in shape]
+    grid = np.meshgrid(*axes, indexing="ij")
+    return np.stack([g.ravel() for g in grid])
+
+
+def resample_volume(
+    volume: np.ndarray,
+    params: Sequence[float],
+    voxel_size: Sequence[float],
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Resample a volume into reference space given its motion parameters.
+
+    Parameters
+    ----------
+    volume : np.ndarray
+        The moving 3D volume.
+    params : Sequence[float]
+        Motion parameters as returned by :meth:`RigidRegistration.register`.
+    voxel_size : Sequence[float]
+        Voxel size in mm along each axis.
+    out : Optional[np.ndarray], optional
+        Array to write the resampled volume into, by default a new array.
+
+    Returns
+    -------
+    np.ndarray
+        The realigned volume; voxels that map outside the moving volume are 0.
+    """
+    volume = np.ascontiguousarray(volume, dtype=np.float64)
+    center = (np.asarray(volume.shape) - 1) / 2.0
+    matrix, offset = rigid_matrix(params, voxel_size, center)
+    coords = matrix @ _voxel_grid(volume.shape) + offset[:, np.newaxis]
+    values, _ = trilinear_sample(volume, coords)
+    if out is None:
+        out = np.empty(volume.shape, dtype=np.float64)
+    out[...] = values.reshape(volume.shape)
+    return out
+
+
+def _downsample(volume: np.ndarray) -> np.ndarray:
+    """Halve each axis (of length > 1) by averaging 2x2x2 blocks."""
+    factors = [2 if n >= 4 else 1 for n in volume.shape]
+    trimmed = volume[tuple(slice(0, n - n % f) for n, f in zip(volume.shape, factors))]
+    shape = []
+    for n, f in zip(trimmed.shape, factors):
+        shape.extend([n // f, f])
+    return trimmed.reshape(shape).mean(axis=(1, 3, 5))
+
+
+class _ReferenceLevel:
+    """Reference image, sample points and Jacobian at one pyramid level."""
+
+    def __init__(
+        self,
+        volume: np.ndarray,
+        voxel_size: np.ndarray,
+        center: np.ndarray,
+    ):
+        self.volume = np.ascontiguousarray(volume, dtype=np.float64)
+        self.voxel_size = voxel_size
+        self.center = center
+
+        n_voxels = volume.size
+        step = max(1, int(np.ceil((n_voxels / _MAX_SAMPLES) ** (1.0 / 3.0))))
+        self.points = _voxel_grid(volume.shape, step)
+        index = tuple(self.points.astype(np.intp))
+
+        gradients = np.gradient(self.volume)
+        grad = np.stack(
+            [g[index] / vs for g, vs in zip(gradients, voxel_size)]
+        )
+        # Keep points that carry signal, as SPM does with its intensity mask.
+        self.target = self.volume[index]
+        informative = np.abs(grad).sum(axis=0) > 0
+        self.points = self.points[:, informative]
+        self.target = self.target[informative]
+        grad = grad[:, informative]
+
+        mm = (self.points - center[:, np.newaxis]) * voxel_size[:, np.newaxis]
+        gx, gy, gz = grad
+        px, py, pz = mm
+        self.jacobian = np.stack([
+            gx, gy, gz,
+            gz * py - gy * pz,
+            gx * pz - gz * px,
+            gy * px - gx * py,
+        ], axis=1)
+
+
+class RigidRegistration:
+    """
+    Precomputed reference pyramid for registering many volumes.
+
+    Parameters
+    ----------
+    reference : np.ndarray
+        The 3D reference volume.
+    voxel_size : Optional[Sequence[float]], optional
+        Voxel size in mm, by default 1 mm isotropic.
+    levels : int, optional
+        Number of pyramid levels, by default 3.
+    n_iterations : int, optional
+        Maximum Gauss-Newton iterations per level, by default 10.
+    """
+
+    def __init__(
+        self,
+        reference: np.ndarray,
+        voxel_size: Optional[Sequence[float]] = None,
+        levels: int = 3,
+        n_iterations: int = 10,
+    ):
+        if reference.ndim != 3:
+            raise ValueError(f"Reference must be a 3D volume, got {reference.ndim}D")
+        if voxel_size is None:
+            voxel_size = (1.0, 1.0, 1.0)
+        self.voxel_size = np.asarray(voxel_size, dtype=np.float64)[:3]
+        self.levels = max(1, int(levels))
+        self.n_iterations = n_iterations
+
+        self._levels = []
+        volume = np.asarray(reference, dtype=np.float64)
+        voxel = self.voxel_size.copy()
+        center = (np.asarray(volume.shape) - 1) / 2.0
+        for level in range(self.levels):
+            self._levels.append(_ReferenceLevel(volume, voxel, center))
+            if level + 1 < self.levels:
+                factors = np.array([2 if n >= 4 else 1 for n in volume.shape])
+                volume = _downsample(volume)
+                center = (center - (factors - 1) / 2.0) / factors
+                voxel = voxel * factors
+
+    def _pyramid(self, volume: np.ndarray) -> List[np.ndarray]:
+        pyramid = [np.ascontiguousarray(volume, dtype=np.float64)]
+        for _ in range(1, self.levels):
+            pyramid.append(np.ascontiguousarray(_downsample(pyramid[-1])))
+        return pyramid
+
+    def register(
+        self, volume: np.ndarray, initial: Optional[Sequence[float]] = None
+    ) -> np.ndarray:
+        """
+        Estimate the motion parameters of ``volume`` relative to the reference.
+
+        Parameters
+        ----------
+        volume : np.ndarray
+            The moving 3D volume.
+        initial : Optional[Sequence[float]], optional
+            Starting estimate, e.g. the previous volume's parameters, by
+            default zeros.
+
+        Returns
+        -------
+        np.ndarray
+            The six motion parameters.
+        """
+        params = np.zeros(6) if initial is None else np.array(initial, dtype=np.float64)
+        pyramid = self._pyramid(volume)
+
+        for level in reversed(range(self.levels)):
+            ref = self._levels[level]
+            moving = pyramid[level]
+            for _ in range(self.n_iterations):
+                matrix, offset = rigid_matrix(params, ref.voxel_size, ref.center)
+                coords = matrix @ ref.points + offset[:, np.newaxis]
+                values, inside = trilinear_sample(moving, coords)
+                if inside.sum() < 6:
+                    break
+                jacobian = ref.jacobian[inside]
+                residual = values[inside] - ref.target[inside]
+                hessian = jacobian.T @ jacobian
+                try:
+                    update = np.linalg.solve(hessian, -(jacobian.T @ residual))
+                except np.linalg.LinAlgError:
+                    break
+                params += update
+                if (
+                    np.abs(update[:3]).max() < _TRANSLATION_TOL
+                    and np.abs(update[3:]).max() < _ROTATION_TOL
+                ):
+                    break
+        return params
+
+
+# Per-process state for pool workers, set by _init_worker.
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(
+    data: Tuple, out: Tuple, params: Tuple, reference: np.ndarray, options: Dict[str, Any]
+) -> None:
+    """Attach to the shared buffers and build the reference pyramid once."""
+    _WORKER["data"] = SharedArray.attach(data)
+    _WORKER["out"] = SharedArray.attach(out)
+    _WORKER["params"] = SharedArray.attach(params)
+    _WORKER["registration"] = RigidRegistration(reference, **options)
+
+
+def _realign_range(start: int, stop: int) -> None:
+    """Register and resample volumes ``[start, stop)`` in a pool worker."""
+    _realign_volumes(
+        _WORKER["data"].array,
+        _WORKER["out"].array,
+        _WORKER["params"].array,
+        _WORKER["registration"],
+        range(start, stop),
+    )
+
+
+def _realign_volumes(
+    data: np.ndarray,
+    out: np.ndarray,
+    params: np.ndarray,
+    registration: RigidRegistration,
+    indices: range,
+) -> None:
+    """Register and resample the given volumes of ``data`` into ``out``."""
+    # Every volume starts from zero motion so results do not depend on how
+    # the run is split into blocks or across workers.
+    for index in indices:
+        volume = np.asarray(data[..., index], dtype=np.float64)
+        estimate = registration.register(volume)
+        params[index] = estimate
+        out[..., index] = resample_volume(volume, estimate, registration.voxel_size)
+
+
+def realign(
+    data: np.ndarray,
+    reference: Union[int, np.ndarray, None] = None,
+    voxel_size: Optional[Sequence[float]] = None,
+    levels: int = 3,
+    n_iterations: int = 10,
+    n_jobs: int = 1,
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Realign every volume of a 4D run to a reference volume.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        4D array with time on the last axis.
+    reference : Union[int, np.ndarray, None], optional
+        Index of the reference volume, or a 3D reference image, by default
+        the first volume.
+    voxel_size : Optional[Sequence[float]], optional
+        Voxel size in mm, by default 1 mm isotropic.
+    levels : int, optional
+        Number of pyramid levels, by default 3.
+    n_iterations : int, optional
+        Maximum Gauss-Newton iterations per level, by default 10.
+    n_jobs : int, optional
+        Number of worker processes, by default 1. Use -1 for one per CPU.
+        With more than one job, the run is placed in shared memory and
+        workers register contiguous ranges of volumes.
+    out : Optional[np.ndarray], optional
+        Array to write the realigned data into, by default a new array of
+        the input's floating dtype (float64 for integer input).
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        The realigned data and the ``(n_volumes, 6)`` motion parameters.
+    """
+    if data.ndim != 4:
+        raise ValueError(f"Expected 4D data, got {data.ndim}D")
+
+    n_volumes = data.shape[-1]
+    if reference is None:
+        reference = 0
+    if isinstance(reference, (int, np.integer)):
+        reference = np.asarray(data[..., int(reference)], dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    if reference.shape != data.shape[:3]:
+        raise ValueError(
+            f"Reference shape {reference.shape} does not match volume shape {data.shape[:3]}"
+        )
+
+    if out is None:
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+        out = np.empty(data.shape, dtype=dtype)
+
+    options = {"voxel_size": voxel_size, "levels": levels, "n_iterations": n_iterations}
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, n_volumes))
+
+    if n_jobs == 1:
+        params = np.zeros((n_volumes, 6))
+        registration = RigidRegistration(reference, **options)
+        _realign_volumes(data, out, params, registration, range(n_volumes))
+        return out, params
+
+    bounds = np.linspace(0, n_volumes, n_jobs + 1).astype(int)
+    with SharedArray.from_array(data, dtype=out.dtype) as shared_data, \
+            SharedArray.create(data.shape, out.dtype) as shared_out, \
+            SharedArray.create((n_volumes, 6), np.float64) as shared_params:
+        initargs = (
+            shared_data.descriptor,
+            shared_out.descriptor,
+            shared_params.descriptor,
+            reference,
+            options,
+        )
+        with ProcessPoolExecutor(
+            max_workers=n_jobs, initializer=_init_worker, initargs=initargs
+        ) as pool:
+            futures = [
+                pool.submit(_realign_range, int(start), int(stop))
+                for start, stop in zip(bounds[:-1], bounds[1:])
+                if stop > start
+            ]
+            for future in futures:
+                future.result()
+        out[...] = shared_out.array
+        params = shared_params.array.copy()
+
+    return out, params
@@ -0,0 +1,639 @@
+"""
+Lightweight NIfTI-1/NIfTI-2 reader and writer.
+
+This module parses NIfTI headers directly and exposes image data lazily.
+Uncompressed files are backed by ``np.memmap`` so single volumes or time
+ranges can be read without loading the whole run; gzipped files are
+decompressed as a stream, one volume at a time.
+"""
+
+import gzip
+import os
+import numpy as np
+from typing import Optional, Dict, Any, Iterator, Tuple, Sequence
+
+
+_NIFTI1_HEADER = np.dtype([
+    ("sizeof_hdr", "i4"),
+    ("data_type", "S10"),
+    ("db_name", "S18"),
+    ("extents", "i4"),
+    ("session_error", "i2"),
+    ("regular", "S1"),
+    ("dim_info", "u1"),
+    ("dim", "i2", (8,)),
+    ("intent_p1", "f4"),
+    ("intent_p2", "f4"),
+    ("intent_p3", "f4"),
+    ("intent_code", "i2"),
+    ("datatype", "i2"),
+    ("bitpix", "i2"),
+    ("slice_start", "i2"),
+    ("pixdim", "f4", (8,)),
+    ("vox_offset", "f4"),
+    ("scl_slope", "f4"),
+    ("scl_inter", "f4"),
+    ("slice_end", "i2"),
+    ("slice_code", "u1"),
+    ("xyzt_units", "u1"),
+    ("cal_max", "f4"),
+    ("cal_min", "f4"),
+    ("slice_duration", "f4"),
+    ("toffset", "f4"),
+    ("glmax", "i4"),
+    ("glmin", "i4"),
+    ("descrip", "S80"),
+    ("aux_file", "S24"),
+    ("qform_code", "i2"),
+    ("sform_code", "i2"),
+    ("quatern_b", "f4"),
+    ("quatern_c", "f4"),
+    ("quatern_d", "f4"),
+    ("qoffset_x", "f4"),
+    ("qoffset_y", "f4"),
+    ("qoffset_z", "f4"),
+    ("srow_x", "f4", (4,)),
+    ("srow_y", "f4", (4,)),
+    ("srow_z", "f4", (4,)),
+    ("intent_name", "S16"),
+    ("magic", "S4"),
+])
+
+_NIFTI2_HEADER = np.dtype([
+    ("sizeof_hdr", "i4"),
+    ("magic", "S8"),
+    ("datatype", "i2"),
+    ("bitpix", "i2"),
+    ("dim", "i8", (8,)),
+    ("intent_p1", "f8"),
+    ("intent_p2", "f8"),
+    ("intent_p3", "f8"),
+    ("pixdim", "f8", (8,)),
+    ("vox_offset", "i8"),
+    ("scl_slope", "f8"),
+    ("scl_inter", "f8"),
+    ("cal_max", "f8"),
+    ("cal_min", "f8"),
+    ("slice_duration", "f8"),
+    ("toffset", "f8"),
+    ("slice_start", "i8"),
+    ("slice_end", "i8"),
+    ("descrip", "S80"),
+    ("aux_file", "S24"),
+    ("qform_code", "i4"),
+    ("sform_code", "i4"),
+    ("quatern_b", "f8"),
+    ("quatern_c", "f8"),
+    ("quatern_d", "f8"),
+    ("qoffset_x", "f8"),
+    ("qoffset_y", "f8"),
+    ("qoffset_z", "f8"),
+    ("srow_x", "f8", (4,)),
+    ("srow_y", "f8", (4,)),
+    ("srow_z", "f8", (4,)),
+    ("slice_code", "i4"),
+    ("xyzt_units", "i4"),
+    ("intent_code", "i4"),
+    ("intent_name", "S16"),
+    ("dim_info", "u1"),
+    ("unused_str", "S15"),
+])
+
+# NIfTI datatype codes for the scalar types we support.
+_DATATYPES = {
+    2: np.dtype("u1"),
+    4: np.dtype("i2"),
+    8: np.dtype("i4"),
+    16: np.dtype("f4"),
+    64: np.dtype("f8"),
+    256: np.dtype("i1"),
+    512: np.dtype("u2"),
+    768: np.dtype("u4"),
+    1024: np.dtype("i8"),
+    1280: np.dtype("u8"),
+}
+_DATATYPE_CODES = {dtype: code for code, dtype in _DATATYPES.items()}
+
+NIFTI_EXTENSIONS = (".nii", ".nii.gz")
+
+
+def is_nifti_path(filepath: str) -> bool:
+    """Return True if ``filepath`` has a single-file NIfTI extension."""
+    return str(filepath).lower().endswith(NIFTI_EXTENSIONS)
+
+
+def _open_raw(filepath: str):
+    """Open ``filepath`` for binary reading, decompressing gzip transparently."""
+    if str(filepath).lower().endswith(".gz"):
+        return gzip.open(filepath, "rb")
+    return open(filepath, "rb")
+
+
+def _parse_header(raw: bytes) -> Tuple[np.ndarray, int, str]:
+    """
+    Parse the raw bytes of a NIfTI header.
+
+    Returns
+    -------
+    Tuple[np.ndarray, int, str]
+        The structured header record (in native byte order), the NIfTI
+        version (1 or 2) and the file's byte-order character.
+    """
+    if len(raw) < 4:
+        raise ValueError("File is too short to contain a NIfTI header")
+
+    for endian in ("<", ">"):
+        sizeof_hdr = int(np.frombuffer(raw[:4], dtype=endian + "i4")[0])
+        if sizeof_hdr == 348:
+            header_dtype, version = _NIFTI1_HEADER, 1
+            break
+        if sizeof_hdr == 540:
+            header_dtype, version = _NIFTI2_HEADER, 2
+            break
+    else:
+        raise ValueError("Not a NIfTI file: unrecognised header size")
+
+    if len(raw) < header_dtype.itemsize:
+        raise ValueError("Truncated NIfTI header")
+
+    header = np.frombuffer(
+        raw[:header_dtype.itemsize], dtype=header_dtype.newbyteorder(endian)
+    )[0]
+    header = header.astype(header_dtype)
+
+    magic = bytes(header["magic"])
+    if version == 1 and not magic.startswith(b"n+1"):
+        raise ValueError(
+            "Only single-file NIfTI-1 images (.nii/.nii.gz) are supported"
+        )
+    if version == 2 and not magic.startswith(b"n+2"):
+        raise ValueError(
+            "Only single-file NIfTI-2 images (.nii/.nii.gz) are supported"
+        )
+
+    return header, version, endian
+
+
+def _header_affine(header: np.ndarray) -> np.ndarray:
+    """Compute the voxel-to-world affine from the sform, qform or pixdim."""
+    pixdim = np.asarray(header["pixdim"], dtype=np.float64)
+
+    if int(header["sform_code"]) > 0:
+        affine = np.eye(4)
+        affine[0] = header["srow_x"]
+        affine[1] = header["srow_y"]
+        affine[2] = header["srow_z"]
+        return affine
+
+    if int(header["qform_code"]) > 0:
+        b = float(header["quatern_b"])
+        c = float(header["quatern_c"])
+        d = float(header["quatern_d"])
+        a = np.sqrt(max(0.0, 1.0 - (b * b + c * c + d * d)))
+        rotation = np.array([
+            [a * a + b * b - c * c - d * d, 2 * (b * c - a * d), 2 * (b * d + a * c)],
+            [2 * (b * c + a * d), a * a + c * c - b * b - d * d, 2 * (c * d - a * b)],
+            [2 * (b * d - a * c), 2 * (c * d + a * b), a * a + d * d - b * b - c * c],
+        ])
+        qfac = -1.0 if pixdim[0] < 0 else 1.0
+        zooms = np.array([pixdim[1], pixdim[2], pixdim[3] * qfac])
+        affine = np.eye(4)
+        affine[:3, :3] = rotation * zooms
+        affine[:3, 3] = [
+            header["qoffset_x"], header["qoffset_y"], header["qoffset_z"]
+        ]
+        return affine
+
+    affine = np.eye(4)
+    affine[0, 0], affine[1, 1], affine[2, 2] = pixdim[1:4]
+    return affine
+
+
+class NiftiImage:
+    """
+    Lazy view of a NIfTI-1 or NIfTI-2 image.
+
+    Uncompressed images are backed by a read-only ``np.memmap`` (available as
+    ``dataobj``) laid out in the file's native Fortran order, so each volume
+    occupies a contiguous block of the file. Gzipped images are decompressed
+    as a stream; volumes are produced sequentially without materializing the
+    full array.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to a ``.nii`` or ``.nii.gz`` file.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the file does not exist.
+    ValueError
+        If the file is not a supported NIfTI image.
+    """
+
+    def __init__(self, filepath: str):
+        if not os.path.exists(filepath):
+            raise FileNotFoundError(f"File not found: {filepath}")
+        if not is_nifti_path(filepath):
+            raise ValueError(f"Unsupported file format: {filepath}")
+
+        self.filepath = str(filepath)
+        self.compressed = self.filepath.lower().endswith(".gz")
+
+        with _open_raw(self.filepath) as f:
+            raw = f.read(_NIFTI2_HEADER.itemsize)
+        header, self.version, endian = _parse_header(raw)
+        self.header = header
+
+        ndim = int(header["dim"][0])
+        if not 1 <= ndim <= 7:
+            raise ValueError(f"Invalid number of dimensions in header: {ndim}")
+        shape = tuple(int(n) for n in header["dim"][1:ndim + 1])
+        # Trailing singleton dimensions beyond time carry no information.
+        while len(shape) > 3 and shape[-1] == 1:
+            shape = shape[:-1]
+        if len(shape) > 4:
+            raise ValueError("Images with more than four dimensions are not supported")
+        self.shape = shape
+
+        code = int(header["datatype"])
+        if code not in _DATATYPES:
+            raise ValueError(f"Unsupported NIfTI datatype code: {code}")
+        self.dtype = _DATATYPES[code].newbyteorder(endian)
+
+        self.offset = int(header["vox_offset"])
+        self.affine = _header_affine(header)
+        self.zooms = tuple(float(z) for z in header["pixdim"][1:len(shape) + 1])
+
+        slope = float(header["scl_slope"])
+        inter = float(header["scl_inter"])
+        # A zero or non-finite slope means the data are stored unscaled.
+        self.scaled = bool(
+            np.isfinite(slope) and slope != 0.0
+            and (slope != 1.0 or (np.isfinite(inter) and inter != 0.0))
+        )
+        self.slope = slope if self.scaled else 1.0
+        self.inter = inter if self.scaled else 0.0
+
+        self.dataobj = None
+        if not self.compressed:
+            self.dataobj = np.memmap(
+                self.filepath, dtype=self.dtype, mode="r",
+                offset=self.offset, shape=self.shape, order="F",
+            )
+
+        self._stream = None
+        self._stream_position = 0
+
+    @property
+    def n_volumes(self) -> int:
+        """Number of volumes (1 for 3D images)."""
+        return self.shape[3] if len(self.shape) == 4 else 1
+
+    @property
+    def volume_shape(self) -> Tuple[int, ...]:
+        """Spatial shape of a single volume."""
+        return self.shape[:3]
+
+    @property
+    def _volume_size(self) -> int:
+        return int(np.prod(self.volume_shape, dtype=np.int64))
+
+    def __enter__(self) -> "NiftiImage":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the memory map and any open decompression stream."""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self.dataobj = None
+
+    def _scale(self, values: np.ndarray, dtype: Optional[np.dtype]) -> np.ndarray:
+        """Apply ``scl_slope``/``scl_inter`` and cast to ``dtype``."""
+        if self.scaled:
+            out_dtype = np.dtype(dtype) if dtype is not None else np.float64
+            values = values.astype(out_dtype)
+            values *= self.slope
+            values += self.inter
+            return values
+        if dtype is not None:
+            return values.astype(dtype, copy=False)
+        return values.astype(self.dtype.newbyteorder("="), copy=False)
+
+    def _read_stream(self, start: int, stop: int) -> np.ndarray:
+        """Decompress volumes ``[start, stop)`` from the gzip stream."""
+        volume_bytes = self._volume_size * self.dtype.itemsize
+        if self._stream is None or start < self._stream_position:
+            if self._stream is not None:
+                self._stream.close()
+            self._stream = gzip.open(self.filepath, "rb")
+            self._stream.seek(self.offset)
+            self._stream_position = 0
+        if start > self._stream_position:
+            self._stream.seek((start - self._stream_position) * volume_bytes, 1)
+
+        n = stop - start
+        raw = self._stream.read(n * volume_bytes)
+        if len(raw) != n * volume_bytes:
+            raise ValueError(f"Truncated NIfTI data in {self.filepath}")
+        self._stream_position = stop
+        return np.frombuffer(raw, dtype=self.dtype).reshape(
+            self.volume_shape + (n,), order="F"
+        )
+
+    def get_volumes(
+        self, start: int = 0, stop: Optional[int] = None, dtype: Optional[np.dtype] = None
+    ) -> np.ndarray:
+        """
+        Read the volumes in ``[start, stop)`` into memory.
+
+        Parameters
+        ----------
+        start : int, optional
+            Index of the first volume, by default 0.
+        stop : Optional[int], optional
+            Index one past the last volume, by default the end of the run.
+        dtype : Optional[np.dtype], optional
+            Output dtype, by default the stored dtype (float64 if scaled).
+
+        Returns
+        -------
+        np.ndarray
+            Array with shape ``volume_shape + (stop - start,)``.
+        """
+        n_volumes = self.n_volumes
+        stop = n_volumes if stop is None else min(stop, n_volumes)
+        if not 0 <= start <= stop:
+            raise IndexError(f"Invalid volume range [{start}, {stop})")
+
+        if self.dataobj is not None:
+            if len(self.shape) == 3:
+                block = self.dataobj[..., np.newaxis]
+            else:
+                block = self.dataobj[..., start:stop]
+        else:
+            block = self._read_stream(start, stop)
+        return self._scale(np.asarray(block), dtype)
+
+    def get_volume(self, index: int, dtype: Optional[np.dtype] = None) -> np.ndarray:
+        """
+        Read a single 3D volume.
+
+        Parameters
+        ----------
+        index : int
+            Volume index; negative values count from the end.
+        dtype : Optional[np.dtype], optional
+            Output dtype, by default the stored dtype (float64 if scaled).
+
+        Returns
+        -------
+        np.ndarray
+            The volume, with shape ``volume_shape``.
+        """
+        if index < 0:
+            index += self.n_volumes
+        if not 0 <= index < self.n_volumes:
+            raise IndexError(f"Volume index out of range: {index}")
+        return self.get_volumes(index, index + 1, dtype=dtype)[..., 0]
+
+    def iter_volumes(
+        self,
+        start: int = 0,
+        stop: Optional[int] = None,
+        block_size: int = 1,
+        dtype: Optional[np.dtype] = None,
+    ) -> Iterator[np.ndarray]:
+        """
+        Iterate over the run in blocks of consecutive volumes.
+
+        For gzipped files this decompresses sequentially, so only one block is
+        held in memory at a time.
+
+        Parameters
+        ----------
+        start : int, optional
+            Index of the first volume, by default 0.
+        stop : Optional[int], optional
+            Index one past the last volume, by default the end of the run.
+        block_size : int, optional
+            Number of volumes per block, by default 1. Blocks of size 1 are
+            yielded as 3D arrays, larger blocks as 4D arrays.
+        dtype : Optional[np.dtype], optional
+            Output dtype, by default the stored dtype (float64 if scaled).
+
+        Yields
+        ------
+        np.ndarray
+            The next volume or block of volumes.
+        """
+        stop = self.n_volumes if stop is None else min(stop, self.n_volumes)
+        for block_start in range(start, stop, block_size):
+            block_stop = min(block_start + block_size, stop)
+            block = self.get_volumes(block_start, block_stop, dtype=dtype)
+            yield block[..., 0] if block_size == 1 else block
+
+    def to_array(self, dtype: Optional[np.dtype] = None) -> np.ndarray:
+        """
+        Read the full image into a newly allocated array.
+
+        Volumes are decoded one at a time into the preallocated output, so
+        peak memory is the output plus a single volume.
+
+        Parameters
+        ----------
+        dtype : Optional[np.dtype], optional
+            Output dtype, by default the stored dtype (float64 if scaled).
+
+        Returns
+        -------
+        np.ndarray
+            The image data, with shape ``shape``.
+        """
+        out_dtype = dtype
+        if out_dtype is None:
+            out_dtype = np.float64 if self.scaled else self.dtype.newbyteorder("=")
+        out = np.empty(self.shape, dtype=out_dtype)
+        target = out if out.ndim == 4 else out[..., np.newaxis]
+        for index, volume in enumerate(self.iter_volumes(dtype=out_dtype)):
+            target[..., index] = volume
+        return out
+
+
+def read_header(filepath: str) -> Dict[str, Any]:
+    """
+    Read the header of a NIfTI image without touching its data.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to a ``.nii`` or ``.nii.gz`` file.
+
+    Returns
+    -------
+    Dict[str, Any]
+        Dictionary with ``shape``, ``dtype``, ``zooms``, ``affine``,
+        ``version`` and ``scaled`` entries.
+    """
+    img = NiftiImage(filepath)
+    info = {
+        "shape": img.shape,
+        "dtype": img.dtype.newbyteorder("="),
+        "zooms": img.zooms,
+        "affine": img.affine,
+        "version": img.version,
+        "scaled": img.scaled,
+    }
+    img.close()
+    return info
+
+
+def _make_header(
+    shape: Tuple[int, ...],
+    dtype: np.dtype,
+    affine: Optional[np.ndarray],
+    zooms: Optional[Sequence[float]],
+) -> bytes:
+    """Serialize a NIfTI header (plus empty extension flag) for an array."""
+    if len(shape) not in (3, 4):
+        raise ValueError(f"Expected 3D or 4D data, got {len(shape)}D")
+
+    dtype = np.dtype(dtype).newbyteorder("=")
+    if dtype not in _DATATYPE_CODES:
+        raise ValueError(f"Unsupported dtype for NIfTI output: {dtype}")
+
+    ndim = len(shape)
+    if affine is None:
+        affine = np.eye(4)
+        if zooms is not None:
+            affine[0, 0], affine[1, 1], affine[2, 2] = list(zooms)[:3]
+    affine = np.asarray(affine, dtype=np.float64)
+    if zooms is None:
+        zooms = list(np.sqrt((affine[:3, :3] ** 2).sum(axis=0)))
+    zooms = list(zooms) + [1.0] * (ndim - len(zooms))
+
+    version = 2 if max(shape) > np.iinfo(np.int16).max else 1
+    header_dtype = _NIFTI1_HEADER if version == 1 else _NIFTI2_HEADER
+    header = np.zeros((), dtype=header_dtype)
+    header["sizeof_hdr"] = header_dtype.itemsize
+    header["magic"] = b"n+1\x00" if version == 1 else b"n+2\x00\r\n\x1a\n"
+    header["datatype"] = _DATATYPE_CODES[dtype]
+    header["bitpix"] = dtype.itemsize * 8
+    header["dim"][0] = ndim
+    header["dim"][1:ndim + 1] = shape
+    header["dim"][ndim + 1:] = 1
+    header["pixdim"][0] = 1.0
+    header["pixdim"][1:ndim + 1] = zooms[:ndim]
+    header["vox_offset"] = header_dtype.itemsize + 4
+    header["scl_slope"] = 1.0
+    header["xyzt_units"] = 2 | 8  # millimetres, seconds
+    header["sform_code"] = 1
+    header["srow_x"] = affine[0]
+    header["srow_y"] = affine[1]
+    header["srow_z"] = affine[2]
+    return header.tobytes() + b"\x00" * 4  # no header extensions
+
+
+def save_nifti(
+    filepath: str,
+    data: np.ndarray,
+    affine: Optional[np.ndarray] = None,
+    zooms: Optional[Sequence[float]] = None,
+    block_size: int = 16,
+) -> None:
+    """
+    Write an array to a single-file NIfTI image.
+
+    A NIfTI-1 header is written unless a dimension exceeds its 16-bit limit,
+    in which case NIfTI-2 is used. Files ending in ``.gz`` are compressed.
+    4D data is written in blocks of volumes so memmap inputs are never
+    loaded in full.
+
+    Parameters
+    ----------
+    filepath : str
+        Destination ``.nii`` or ``.nii.gz`` path.
+    data : np.ndarray
+        3D or 4D array to write.
+    affine : Optional[np.ndarray], optional
+        4x4 voxel-to-world affine, by default a diagonal built from ``zooms``.
+    zooms : Optional[Sequence[float]], optional
+        Voxel sizes in mm (and TR in seconds for 4D data), by default derived
+        from ``affine`` or 1.0.
+    block_size : int, optional
+        Number of volumes to write per block, by default 16.
+
+    Raises
+    ------
+    ValueError
+        If the path, dimensionality or dtype is not supported.
+    """
+    if not is_nifti_path(filepath):
+        raise ValueError(f"Unsupported file format: {filepath}")
+    header = _make_header(data.shape, data.dtype, affine, zooms)
+    dtype = np.dtype(data.dtype).newbyteorder("=")
+
+    opener = gzip.open if str(filepath).lower().endswith(".gz") else open
+    with opener(filepath, "wb") as f:
+        f.write(header)
+        if data.ndim == 3:
+            f.write(np.asarray(data, dtype=dtype).tobytes(order="F"))
+            return
+        for start in range(0, data.shape[3], block_size):
+            block = np.asarray(data[..., start:start + block_size], dtype=dtype)
+            f.write(block.tobytes(order="F"))
+
+
+def create_nifti(
+    filepath: str,
+    shape: Tuple[int, ...],
+    dtype: Any = np.float32,
+    affine: Optional[np.ndarray] = None,
+    zooms: Optional[Sequence[float]] = None,
+) -> np.memmap:
+    """
+    Create an uncompressed NIfTI file and return a writable memmap of its data.
+
+    This lets pipelines write results straight into the output file, e.g.
+    via ``standard_pipeline(..., out=create_nifti(...))``, without holding
+    the full array in memory.
+
+    Parameters
+    ----------
+    filepath : str
+        Destination ``.nii`` path.
+    shape : Tuple[int, ...]
+        3D or 4D shape of the image.
+    dtype : Any, optional
+        Data dtype, by default float32.
+    affine : Optional[np.ndarray], optional
+        4x4 voxel-to-world affine, by default a diagonal built from ``zooms``.
+    zooms : Optional[Sequence[float]], optional
+        Voxel sizes in mm (and TR in seconds for 4D data).
+
+    Returns
+    -------
+    np.memmap
+        Zero-initialized, writable memmap in the file's Fortran order.
+
+    Raises
+    ------
+    ValueError
+        If the path is gzipped or the shape or dtype is not supported.
+    """
+    if not str(filepath).lower().endswith(".nii"):
+        raise ValueError(f"Memory-mapped output requires a .nii path: {filepath}")
+    header = _make_header(tuple(shape), dtype, affine, zooms)
+    dtype = np.dtype(dtype).newbyteorder("=")
+    n_bytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    with open(filepath, "wb") as f:
+        f.write(header)
+        f.truncate(len(header) + n_bytes)
+    return np.memmap(
+        filepath, dtype=dtype, mode="r+", offset=len(header), shape=tuple(shape), order="F"
+    )
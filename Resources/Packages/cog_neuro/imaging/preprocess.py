@@ -2,26 +2,60 @@
 Preprocessing functions for neuroimaging data.
 
 This module provides functions for preprocessing neuroimaging data,
-including loading, motion correction, spatial smoothing, and temporal filtering.
+including loading, motion correction, spatial smoothing, confound
+regression and temporal filtering.
 """
 
 import os
 import numpy as np
-from typing import Union, Optional, Dict, Any
+from typing import Union, Optional, Dict, Any, Iterator, List, Tuple, Sequence
 
+from ..utils.chunked import ChunkedArray, is_chunked_store, open_chunked
+from ..utils.masked import MaskedTimeSeries
+from .cache import StageCache, data_key, stage_key, stage_params
+from .confounds import motion_confounds, regress_confounds
+from .filtering import temporal_filter
+from .motion import realign
+from .nifti import NiftiImage, is_nifti_path
+from .smoothing import smooth_volumes
 
-def load_dataset(filepath: str) -> np.ndarray:
+
+# Number of volumes per block when chunked mode is requested via ``out`` only.
+_DEFAULT_BLOCK_SIZE = 16
+
+
+def load_dataset(
+    filepath: str, mmap: bool = True, dtype: Optional[np.dtype] = None
+) -> Union[np.ndarray, ChunkedArray]:
     """
     Load a neuroimaging dataset from a file.
 
+    NIfTI-1 and NIfTI-2 images (``.nii`` and ``.nii.gz``) are supported.
+    Uncompressed, unscaled images are returned as a read-only ``np.memmap``
+    so that individual volumes are only read from disk when accessed. Other
+    images are decoded one volume at a time into a single preallocated array.
+    Use :class:`cog_neuro.imaging.nifti.NiftiImage` directly to stream
+    volumes from gzipped files without loading the whole run.
+
+    Chunked stores written by :func:`cog_neuro.utils.save_chunked` are
+    opened as a lazy :class:`~cog_neuro.utils.ChunkedArray`, which reads
+    only the chunks overlapping each selection.
+
     Parameters
     ----------
     filepath : str
-        Path to the neuroimaging data file.
+        Path to the neuroimaging data file or chunked store directory.
+    mmap : bool, optional
+        Whether to memory-map uncompressed images (or open chunked stores
+        lazily), by default True.
+    dtype : Optional[np.dtype], optional
+        Dtype of the returned array, by default the stored dtype (float64 for
+        images with a scaling slope or intercept). Requesting a dtype other
+        than the stored one disables memory-mapping.
 
     Returns
     -------
-    np.ndarray
+    Union[np.ndarray, ChunkedArray]
         The loaded neuroimaging data.
 
     Raises
@@ -34,59 +68,452 @@ def load_dataset(filepath: str) -> np.ndarray:
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"File not found: {filepath}")
 
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nibabel to load neuroimaging data.
-    print(f"Loading dataset from {filepath}")
-    
-    # Placeholder: return random data
-    return np.random.randn(64, 64, 30, 100)
+    if is_chunked_store(filepath):
+        store = open_chunked(filepath)
+        if mmap and (dtype is None or np.dtype(dtype) == store.dtype):
+            return store
+        return np.asarray(store[...], dtype=dtype)
+
+    if not is_nifti_path(filepath):
+        raise ValueError(f"Unsupported file format: {filepath}")
+
+    img = NiftiImage(filepath)
+    stored_dtype = img.dtype.newbyteorder("=")
+    if (
+        mmap
+        and img.dataobj is not None
+        and not img.scaled
+        and img.dtype == stored_dtype
+        and (dtype is None or np.dtype(dtype) == stored_dtype)
+    ):
+        return img.dataobj
+
+    data = img.to_array(dtype=dtype)
+    img.close()
+    return data
 
 
 def standard_pipeline(
-    data: np.ndarray,
+    data: Union[np.ndarray, MaskedTimeSeries],
     motion_correction: bool = True,
     spatial_smoothing: bool = True,
     temporal_filtering: bool = True,
+    block_size: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+    dtype: Optional[np.dtype] = None,
+    cache: Union[StageCache, str, None] = None,
+    confound_regression: bool = False,
     **kwargs: Any
 ) -> np.ndarray:
     """
     Apply a standard preprocessing pipeline to neuroimaging data.
 
+    By default every stage runs over the whole 4D array. When ``block_size``
+    or ``out`` is given, the pipeline runs in chunked mode instead: spatial
+    stages (motion correction, smoothing) are applied to blocks of
+    ``block_size`` volumes and temporal stages to slabs of voxels holding
+    roughly the same number of samples, all written directly into the output
+    buffer. Peak memory is then about one block rather than several copies
+    of the run, and ``data`` may be a read-only memmap.
+
     Parameters
     ----------
-    data : np.ndarray
-        The input neuroimaging data.
+    data : Union[np.ndarray, MaskedTimeSeries]
+        The input neuroimaging data. A :class:`MaskedTimeSeries` is
+        processed in its compact form: temporal stages only touch in-mask
+        voxels, spatial stages see dense blocks of ``block_size`` volumes
+        that are zero outside the mask, and the result is a new
+        :class:`MaskedTimeSeries` (``out`` and ``cache`` do not apply).
     motion_correction : bool, optional
         Whether to apply motion correction, by default True.
     spatial_smoothing : bool, optional
         Whether to apply spatial smoothing, by default True.
     temporal_filtering : bool, optional
         Whether to apply temporal filtering, by default True.
+    block_size : Optional[int], optional
+        Number of volumes per block in chunked mode, by default None
+        (16 if only ``out`` is given).
+    out : Optional[np.ndarray], optional
+        Preallocated array or memmap with the shape of ``data`` to write the
+        result into, by default None. May be ``data`` itself for in-place
+        processing.
+    dtype : Optional[np.dtype], optional
+        Working and output dtype, e.g. ``np.float32`` to halve memory, by
+        default the dtype of ``out`` or ``data`` (float64 for integer data).
+    cache : Union[StageCache, str, None], optional
+        Stage cache, or a directory to create one in, by default None. Each
+        stage's output is stored under a key derived from the input data, the
+        preceding stages and the stage's own parameters, and is reused by
+        later calls; e.g. changing only the filter cutoffs reruns only the
+        temporal filter. Outputs served from the cache are read-only memmaps.
+        In chunked mode the spatial stages are cached together.
+    confound_regression : bool, optional
+        Whether to regress confounds out of every voxel after smoothing and
+        before temporal filtering, by default False. The design is the
+        ``confounds`` array, plus the motion parameters estimated by motion
+        correction (and their derivatives) unless ``motion_confounds`` is
+        False.
     **kwargs : Any
         Additional parameters for specific preprocessing steps.
 
     Returns
     -------
-    np.ndarray
-        The preprocessed neuroimaging data.
+    Union[np.ndarray, MaskedTimeSeries]
+        The preprocessed neuroimaging data (``out`` if it was given).
     """
-    preprocessed_data = data.copy()
+    if dtype is None and out is None and not np.issubdtype(data.dtype, np.floating):
+        dtype = np.float64
+
+    if isinstance(cache, str):
+        cache = StageCache(cache)
+
+    if confound_regression and not motion_correction and kwargs.get("motion_params") is not None:
+        # Externally estimated motion is just another confound; folding it
+        # in keeps it part of the cache key.
+        kwargs["confounds"] = _motion_design(
+            kwargs.get("confounds"), kwargs.pop("motion_params"),
+            kwargs.get("motion_derivatives", True),
+        )
+
+    if isinstance(data, MaskedTimeSeries):
+        if out is not None or cache is not None:
+            raise ValueError("out and cache are not supported for MaskedTimeSeries input")
+        return _run_masked(
+            data,
+            motion_correction=motion_correction,
+            spatial_smoothing=spatial_smoothing,
+            temporal_filtering=temporal_filtering,
+            confound_regression=confound_regression,
+            block_size=block_size or _DEFAULT_BLOCK_SIZE,
+            dtype=dtype,
+            **kwargs
+        )
 
+    if block_size is not None or out is not None:
+        return _run_chunked(
+            data,
+            motion_correction=motion_correction,
+            spatial_smoothing=spatial_smoothing,
+            temporal_filtering=temporal_filtering,
+            confound_regression=confound_regression,
+            block_size=block_size or _DEFAULT_BLOCK_SIZE,
+            out=out,
+            dtype=dtype,
+            cache=cache,
+            **kwargs
+        )
+
+    stages = []
     if motion_correction:
-        preprocessed_data = _apply_motion_correction(preprocessed_data, **kwargs)
+        stages.append(("motion_correction", _apply_motion_correction))
+    if spatial_smoothing:
+        stages.append(("spatial_smoothing", _apply_spatial_smoothing))
+    if confound_regression:
+        stages.append(("confound_regression", _apply_confound_regression))
+    if temporal_filtering:
+        stages.append(("temporal_filtering", _apply_temporal_filtering))
+    needs_params = _needs_motion_params(motion_correction, confound_regression, kwargs)
+
+    first = 0
+    keys: List[str] = []
+    preprocessed_data = None
+    if cache is not None:
+        keys = _stage_keys(data, dtype, stages, kwargs)
+        params = cache.get(_params_key(keys)) if needs_params else None
+        # Resume after the last stage whose output is already cached. Later
+        # stages may need the motion parameters, so those must be cached too.
+        for index in reversed(range(len(stages))):
+            if needs_params and params is None:
+                break
+            preprocessed_data = cache.get(keys[index + 1])
+            if preprocessed_data is not None:
+                first = index + 1
+                if needs_params:
+                    kwargs["motion_params"] = np.asarray(params)
+                break
+
+    if preprocessed_data is None:
+        preprocessed_data = np.array(data, dtype=dtype)
+
+    for index in range(first, len(stages)):
+        name, stage = stages[index]
+        if name == "motion_correction" and needs_params:
+            preprocessed_data, params = stage(
+                preprocessed_data, **dict(kwargs, return_params=True)
+            )
+            kwargs["motion_params"] = params
+            if cache is not None:
+                cache.put(_params_key(keys), params)
+        else:
+            preprocessed_data = stage(preprocessed_data, **kwargs)
+        if cache is not None:
+            preprocessed_data = cache.put(keys[index + 1], preprocessed_data)
+
+    return preprocessed_data
+
+
+def _needs_motion_params(
+    motion_correction: bool, confound_regression: bool, kwargs: Dict[str, Any]
+) -> bool:
+    """Whether the confound stage will use parameters from motion correction."""
+    return motion_correction and confound_regression and kwargs.get("motion_confounds", True)
 
+
+def _params_key(keys: List[str]) -> str:
+    """Cache key of the motion parameters estimated by the first stage."""
+    return stage_key(keys[1], "motion_params", {})
+
+
+def _motion_design(
+    confounds: Optional[np.ndarray], params: np.ndarray, derivatives: bool
+) -> np.ndarray:
+    """Append motion regressors to an optional confound design."""
+    motion = motion_confounds(params, derivatives=derivatives)
+    if confounds is None:
+        return motion
+    confounds = np.asarray(confounds, dtype=np.float64)
+    if confounds.ndim == 1:
+        confounds = confounds[:, np.newaxis]
+    return np.hstack([confounds, motion])
+
+
+def _stage_keys(
+    data: np.ndarray,
+    dtype: Optional[np.dtype],
+    stages: List[Tuple[str, Any]],
+    kwargs: Dict[str, Any],
+) -> List[str]:
+    """Cache keys for the input and the output of each stage in turn."""
+    working_dtype = np.dtype(dtype or data.dtype).str
+    keys = [stage_key(data_key(data), "input", {"dtype": working_dtype})]
+    for name, stage in stages:
+        keys.append(stage_key(keys[-1], name, stage_params(stage, kwargs)))
+    return keys
+
+
+def _time_blocks(n_timepoints: int, block_size: int) -> Iterator[slice]:
+    """Yield slices covering ``range(n_timepoints)`` in blocks of volumes."""
+    for start in range(0, n_timepoints, block_size):
+        yield slice(start, min(start + block_size, n_timepoints))
+
+
+def _voxel_slabs(shape: Tuple[int, ...], block_size: int) -> Iterator[slice]:
+    """
+    Yield slices along the first axis of a 4D array whose slabs hold about
+    as many samples as ``block_size`` full volumes.
+    """
+    n_x, n_timepoints = shape[0], shape[-1]
+    plane_samples = int(np.prod(shape[1:], dtype=np.int64))
+    block_samples = block_size * int(np.prod(shape[:-1], dtype=np.int64))
+    slab = max(1, block_samples // max(plane_samples, 1))
+    for start in range(0, n_x, slab):
+        yield slice(start, min(start + slab, n_x))
+
+
+def _run_chunked(
+    data: np.ndarray,
+    motion_correction: bool,
+    spatial_smoothing: bool,
+    temporal_filtering: bool,
+    block_size: int,
+    out: Optional[np.ndarray],
+    dtype: Optional[np.dtype],
+    cache: Optional[StageCache] = None,
+    confound_regression: bool = False,
+    **kwargs: Any
+) -> np.ndarray:
+    """
+    Run the preprocessing stages block by block, writing into ``out``.
+
+    Spatial stages see blocks of whole volumes and temporal stages see slabs
+    of voxels with the full time course, so no stage ever needs the whole
+    run in memory. With a cache, the spatial pass and the final result are
+    each stored as one entry.
+    """
+    if data.ndim != 4:
+        raise ValueError(f"Chunked mode requires 4D data, got {data.ndim}D")
+    if block_size < 1:
+        raise ValueError(f"block_size must be positive, got {block_size}")
+
+    if out is None:
+        out = np.empty(data.shape, dtype=dtype or data.dtype)
+    elif out.shape != data.shape:
+        raise ValueError(
+            f"Output buffer has shape {out.shape}, expected {data.shape}"
+        )
+    elif dtype is not None and out.dtype != np.dtype(dtype):
+        raise ValueError(
+            f"Output buffer has dtype {out.dtype}, expected {np.dtype(dtype)}"
+        )
+
+    if motion_correction:
+        # Every block must be realigned to the same reference volume.
+        reference = kwargs.get("reference")
+        if reference is None or isinstance(reference, (int, np.integer)):
+            kwargs["reference"] = np.asarray(
+                data[..., int(reference or 0)], dtype=out.dtype
+            ).astype(np.float64)
+
+    spatial_stages = []
+    if motion_correction:
+        spatial_stages.append(("motion_correction", _apply_motion_correction))
     if spatial_smoothing:
-        preprocessed_data = _apply_spatial_smoothing(preprocessed_data, **kwargs)
+        spatial_stages.append(("spatial_smoothing", _apply_spatial_smoothing))
+    temporal_stages = []
+    if confound_regression:
+        temporal_stages.append(("confound_regression", _apply_confound_regression))
+    if temporal_filtering:
+        temporal_stages.append(("temporal_filtering", _apply_temporal_filtering))
+    needs_params = _needs_motion_params(motion_correction, confound_regression, kwargs)
+    params = np.zeros((data.shape[-1], 6)) if needs_params else None
 
+    source = data
+    spatial_done = False
+    if cache is not None:
+        keys = _stage_keys(data, out.dtype, spatial_stages + temporal_stages, kwargs)
+        cached = cache.get(keys[-1])
+        if cached is not None:
+            for block in _time_blocks(data.shape[-1], block_size):
+                out[..., block] = cached[..., block]
+            return out
+        if spatial_stages:
+            cached = cache.get(keys[len(spatial_stages)])
+            if needs_params:
+                cached_params = cache.get(_params_key(keys))
+                if cached_params is None:
+                    cached = None
+                else:
+                    params[...] = cached_params
+            if cached is None:
+                entry, tmp_path = cache.create(data.shape, out.dtype)
+                _spatial_pass(data, entry, spatial_stages, block_size, kwargs, params)
+                cached = cache.commit(keys[len(spatial_stages)], entry, tmp_path)
+                if needs_params:
+                    cache.put(_params_key(keys), params)
+            source, spatial_done = cached, True
+
+    if not spatial_done and (spatial_stages or out is not data):
+        _spatial_pass(data, out, spatial_stages, block_size, kwargs, params)
+        source = out
+
+    if needs_params:
+        kwargs["motion_params"] = params
+    mask = kwargs.pop("mask", None)
+    if temporal_stages or source is not out:
+        for slab in _voxel_slabs(out.shape, block_size):
+            values = np.array(source[slab], dtype=out.dtype)
+            slab_mask = None if mask is None else mask[slab]
+            for _, stage in temporal_stages:
+                values = stage(values, mask=slab_mask, **kwargs)
+            out[slab] = values
+
+    if cache is not None and temporal_stages:
+        cache.put(keys[-1], out)
+    return out
+
+
+def _spatial_pass(
+    data: np.ndarray,
+    out: np.ndarray,
+    stages: List[Tuple[str, Any]],
+    block_size: int,
+    kwargs: Dict[str, Any],
+    params: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Apply the spatial stages to blocks of volumes of ``data``, into ``out``.
+
+    If ``params`` is given, the motion parameters of each block are written
+    into it.
+    """
+    for block in _time_blocks(data.shape[-1], block_size):
+        volumes = np.array(data[..., block], dtype=out.dtype)
+        out[..., block] = _spatial_block(volumes, block, stages, kwargs, params)
+
+
+def _spatial_block(
+    volumes: np.ndarray,
+    block: slice,
+    stages: List[Tuple[str, Any]],
+    kwargs: Dict[str, Any],
+    params: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Apply the spatial stages to the block of volumes at ``block``."""
+    for name, stage in stages:
+        if name == "motion_correction" and params is not None:
+            volumes, params[block] = stage(volumes, **dict(kwargs, return_params=True))
+        else:
+            volumes = stage(volumes, **kwargs)
+    return volumes
+
+
+def _run_masked(
+    data: MaskedTimeSeries,
+    motion_correction: bool,
+    spatial_smoothing: bool,
+    temporal_filtering: bool,
+    confound_regression: bool,
+    block_size: int,
+    dtype: Optional[np.dtype],
+    **kwargs: Any
+) -> MaskedTimeSeries:
+    """
+    Run the preprocessing stages on the in-mask voxels only.
+
+    Spatial stages need whole volumes, so each block of volumes is
+    scattered into a dense block (zero outside the mask), processed and
+    gathered back. Temporal stages run directly on the (voxel, time)
+    buffer, in place where possible.
+    """
+    if block_size < 1:
+        raise ValueError(f"block_size must be positive, got {block_size}")
+    result = data.copy(dtype=dtype)
+    # Every stored voxel is in the brain; a dense mask does not apply.
+    kwargs.pop("mask", None)
+
+    spatial_stages = []
+    if motion_correction:
+        spatial_stages.append(("motion_correction", _apply_motion_correction))
+        reference = kwargs.get("reference")
+        if reference is None or isinstance(reference, (int, np.integer)):
+            kwargs["reference"] = data.volume(int(reference or 0)).astype(np.float64)
+    if spatial_smoothing:
+        spatial_stages.append(("spatial_smoothing", _apply_spatial_smoothing))
+    temporal_stages = []
+    if confound_regression:
+        temporal_stages.append(("confound_regression", _apply_confound_regression))
     if temporal_filtering:
-        preprocessed_data = _apply_temporal_filtering(preprocessed_data, **kwargs)
+        temporal_stages.append(("temporal_filtering", _apply_temporal_filtering))
+    needs_params = _needs_motion_params(motion_correction, confound_regression, kwargs)
+    params = np.zeros((data.n_timepoints, 6)) if needs_params else None
 
-    return preprocessed_data
+    series = result.series
+    if spatial_stages:
+        for block in _time_blocks(data.n_timepoints, block_size):
+            volumes = _spatial_block(
+                result[block].to_volume(), block, spatial_stages, kwargs, params
+            )
+            series[:, block] = volumes[result.mask]
+
+    if needs_params:
+        kwargs["motion_params"] = params
+    for _, stage in temporal_stages:
+        series = stage(series, **kwargs)
+    if result.layout == "time":
+        return result.with_data(np.ascontiguousarray(series.T))
+    return result.with_data(series)
 
 
 def _apply_motion_correction(
-    data: np.ndarray, method: str = "rigid", **kwargs: Any
-) -> np.ndarray:
+    data: np.ndarray,
+    method: str = "rigid",
+    reference: Union[int, np.ndarray, None] = None,
+    voxel_size: Optional[Sequence[float]] = None,
+    pyramid_levels: int = 3,
+    n_jobs: int = 1,
+    return_params: bool = False,
+    **kwargs: Any
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
     """
     Apply motion correction to neuroimaging data.
 
@@ -96,22 +523,55 @@ def _apply_motion_correction(
         The input neuroimaging data.
     method : str, optional
         The motion correction method to use, by default "rigid".
+    reference : Union[int, np.ndarray, None], optional
+        Index of the reference volume or a 3D reference image, by default
+        the first volume.
+    voxel_size : Optional[Sequence[float]], optional
+        The voxel size in mm along each spatial axis, by default 1 mm
+        isotropic.
+    pyramid_levels : int, optional
+        Number of coarse-to-fine pyramid levels, by default 3.
+    n_jobs : int, optional
+        Number of worker processes used to register volumes, by default 1.
+    return_params : bool, optional
+        Whether to also return the motion parameters, by default False.
     **kwargs : Any
         Additional parameters for the motion correction method.
 
     Returns
     -------
-    np.ndarray
-        The motion-corrected neuroimaging data.
+    Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]
+        The motion-corrected neuroimaging data and, if ``return_params`` is
+        True, the ``(n_volumes, 6)`` motion parameters (translations in mm,
+        rotations in radians).
+
+    Raises
+    ------
+    ValueError
+        If the motion correction method is not supported.
     """
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nibabel, nilearn, or FSL to apply motion correction.
-    print(f"Applying motion correction with method: {method}")
-    return data
+    if method != "rigid":
+        raise ValueError(f"Unsupported motion correction method: {method}")
+
+    corrected, params = realign(
+        data,
+        reference=reference,
+        voxel_size=voxel_size,
+        levels=pyramid_levels,
+        n_jobs=n_jobs,
+    )
+    if return_params:
+        return corrected, params
+    return corrected
 
 
 def _apply_spatial_smoothing(
-    data: np.ndarray, fwhm: float = 6.0, **kwargs: Any
+    data: np.ndarray,
+    fwhm: float = 6.0,
+    voxel_size: Optional[Sequence[float]] = None,
+    smoothing_method: str = "auto",
+    n_jobs: int = 1,
+    **kwargs: Any
 ) -> np.ndarray:
     """
     Apply spatial smoothing to neuroimaging data.
@@ -121,7 +581,15 @@ def _apply_spatial_smoothing(
     data : np.ndarray
         The input neuroimaging data.
     fwhm : float, optional
-        The full width at half maximum of the Gaussian kernel, by default 6.0.
+        The full width at half maximum of the Gaussian kernel in mm, by
+        default 6.0. A value of 0 or None disables smoothing.
+    voxel_size : Optional[Sequence[float]], optional
+        The voxel size in mm along each spatial axis, by default 1 mm
+        isotropic.
+    smoothing_method : str, optional
+        ``"separable"``, ``"fft"`` or ``"auto"``, by default "auto".
+    n_jobs : int, optional
+        Number of threads used to smooth volumes in parallel, by default 1.
     **kwargs : Any
         Additional parameters for the spatial smoothing method.
 
@@ -130,16 +598,79 @@ def _apply_spatial_smoothing(
     np.ndarray
         The spatially smoothed neuroimaging data.
     """
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nibabel, nilearn, or FSL to apply spatial smoothing.
-    print(f"Applying spatial smoothing with FWHM: {fwhm}")
-    return data
+    if not fwhm:
+        return data
+    return smooth_volumes(
+        data, fwhm, voxel_size=voxel_size, method=smoothing_method, n_jobs=n_jobs
+    )
+
+
+def _apply_confound_regression(
+    data: np.ndarray,
+    confounds: Optional[np.ndarray] = None,
+    motion_params: Optional[np.ndarray] = None,
+    motion_confounds: bool = True,
+    motion_derivatives: bool = True,
+    preserve_mean: bool = True,
+    mask: Optional[np.ndarray] = None,
+    **kwargs: Any
+) -> np.ndarray:
+    """
+    Regress nuisance signals out of every voxel time series.
+
+    The design is factorized once (and cached across calls with the same
+    design), then removed from all voxels with blocked matrix products. A
+    writable floating-point ``data`` array is modified in place.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The input neuroimaging data, with time on the last axis.
+    confounds : Optional[np.ndarray], optional
+        Confound time courses with shape (n_volumes, n_confounds), e.g. CSF
+        and white-matter signals, by default None.
+    motion_params : Optional[np.ndarray], optional
+        Motion parameters with shape (n_volumes, 6); filled in by
+        :func:`standard_pipeline` from the motion correction stage, by
+        default None.
+    motion_confounds : bool, optional
+        Whether to include the motion parameters in the design, by default
+        True.
+    motion_derivatives : bool, optional
+        Whether to also include their backward differences, by default True.
+    preserve_mean : bool, optional
+        Whether to keep each voxel's mean, by default True.
+    mask : Optional[np.ndarray], optional
+        Boolean brain mask; only in-mask voxels are regressed, by default
+        None.
+    **kwargs : Any
+        Additional parameters, ignored.
+
+    Returns
+    -------
+    np.ndarray
+        The residual neuroimaging data.
+    """
+    design = confounds
+    if motion_confounds and motion_params is not None:
+        design = _motion_design(confounds, motion_params, motion_derivatives)
+    if design is None:
+        return data
+
+    in_place = data.flags.writeable and np.issubdtype(data.dtype, np.floating)
+    return regress_confounds(
+        data, design, preserve_mean=preserve_mean, mask=mask,
+        out=data if in_place else None,
+    )
 
 
 def _apply_temporal_filtering(
     data: np.ndarray, 
     high_pass: Optional[float] = 0.01, 
     low_pass: Optional[float] = None, 
+    t_r: float = 2.0,
+    filter_method: str = "fft",
+    mask: Optional[np.ndarray] = None,
     **kwargs: Any
 ) -> np.ndarray:
     """
@@ -153,6 +684,14 @@ def _apply_temporal_filtering(
         The high-pass filter cutoff frequency in Hz, by default 0.01.
     low_pass : Optional[float], optional
         The low-pass filter cutoff frequency in Hz, by default None.
+    t_r : float, optional
+        The repetition time in seconds, by default 2.0.
+    filter_method : str, optional
+        ``"fft"`` for a zero-phase FFT band-pass or ``"cosine"`` for a
+        discrete cosine drift high-pass, by default "fft".
+    mask : Optional[np.ndarray], optional
+        Boolean brain mask matching the spatial shape of ``data``; only
+        in-mask voxels are filtered, by default None.
     **kwargs : Any
         Additional parameters for the temporal filtering method.
 
@@ -161,7 +700,13 @@ def _apply_temporal_filtering(
     np.ndarray
         The temporally filtered neuroimaging data.
     """
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nibabel, nilearn, or FSL to apply temporal filtering.
-    print(f"Applying temporal filtering with high-pass: {high_pass}, low-pass: {low_pass}")
-    return data 
\ No newline at end of file
+    if high_pass is None and low_pass is None:
+        return data
+    return temporal_filter(
+        data,
+        t_r=t_r,
+        high_pass=high_pass,
+        low_pass=low_pass,
+        method=filter_method,
+        mask=mask,
+    )
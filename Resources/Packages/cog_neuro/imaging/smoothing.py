@@ -0,0 +1,272 @@
+"""
+Gaussian spatial smoothing for 3D and 4D neuroimaging data.
+
+This module implements isotropic or anisotropic Gaussian smoothing with
+two interchangeable engines: separable 1D convolution, and FFT-based
+convolution with cached kernel spectra, which wins for large kernels on
+large volumes. Both use zero padding at the volume borders and produce the
+same result up to floating-point rounding. Volumes are smoothed in batches
+and batches are spread across a thread pool.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple, Union
+
+
+# Kernels are truncated at this many standard deviations.
+_TRUNCATE = 4.0
+
+# Relative cost of one FFT butterfly compared to one multiply-add of the
+# separable engine, measured on float32 data with NumPy's pocketfft.
+_FFT_COST_FACTOR = 3.5
+
+# Volumes smoothed together per task in the thread pool.
+_VOLUMES_PER_TASK = 4
+
+_FWHM_TO_SIGMA = 1.0 / np.sqrt(8.0 * np.log(2.0))
+
+
+def fwhm_to_sigma(
+    fwhm: Union[float, Sequence[float]],
+    voxel_size: Optional[Sequence[float]] = None,
+) -> Tuple[float, float, float]:
+    """
+    Convert a FWHM in mm to per-axis Gaussian standard deviations in voxels.
+
+    Parameters
+    ----------
+    fwhm : Union[float, Sequence[float]]
+        Full width at half maximum in mm, either isotropic or per axis.
+    voxel_size : Optional[Sequence[float]], optional
+        Voxel size in mm along each spatial axis, by default 1 mm isotropic.
+
+    Returns
+    -------
+    Tuple[float, float, float]
+        The standard deviation of the kernel along each axis, in voxels.
+    """
+    fwhm = np.broadcast_to(np.asarray(fwhm, dtype=np.float64), (3,))
+    if voxel_size is None:
+        voxel_size = (1.0, 1.0, 1.0)
+    voxel_size = np.asarray(voxel_size, dtype=np.float64)[:3]
+    if np.any(voxel_size <= 0):
+        raise ValueError(f"Voxel sizes must be positive, got {tuple(voxel_size)}")
+    return tuple(float(s) for s in fwhm * _FWHM_TO_SIGMA / voxel_size)
+
+
+@lru_cache(maxsize=64)
+def gaussian_kernel_1d(sigma: float, truncate: float = _TRUNCATE) -> np.ndarray:
+    """
+    Build a normalized 1D Gaussian kernel.
+
+    Parameters
+    ----------
+    sigma : float
+        Standard deviation in samples. A value of 0 gives the identity kernel.
+    truncate : float, optional
+        Truncate the kernel at this many standard deviations, by default 4.0.
+
+    Returns
+    -------
+    np.ndarray
+        Kernel of odd length ``2 * radius + 1``. The array is cached and
+        must not be modified.
+    """
+    if sigma <= 0:
+        kernel = np.ones(1)
+    else:
+        radius = int(truncate * sigma + 0.5)
+        x = np.arange(-radius, radius + 1, dtype=np.float64)
+        kernel = np.exp(-0.5 * (x / sigma) ** 2)
+        kernel /= kernel.sum()
+    kernel.setflags(write=False)
+    return kernel
+
+
+def _fft_length(n: int) -> int:
+    """Smallest 2-3-5-smooth integer >= ``n``, for efficient FFT sizes."""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+@lru_cache(maxsize=16)
+def _kernel_spectrum(
+    volume_shape: Tuple[int, int, int], sigmas: Tuple[float, float, float]
+) -> Tuple[np.ndarray, Tuple[int, int, int]]:
+    """
+    Cached real-FFT spectrum of the separable Gaussian kernel.
+
+    The FFT grid is padded by the kernel radius along each axis so the
+    circular convolution matches zero-padded linear convolution.
+
+    Returns
+    -------
+    Tuple[np.ndarray, Tuple[int, int, int]]
+        The spectrum with a trailing singleton axis for broadcasting over
+        volumes, and the padded FFT shape.
+    """
+    kernels = [gaussian_kernel_1d(s) for s in sigmas]
+    fft_shape = tuple(
+        _fft_length(n + len(k) // 2) for n, k in zip(volume_shape, kernels)
+    )
+
+    spectra = []
+    for axis, (kernel, length) in enumerate(zip(kernels, fft_shape)):
+        radius = len(kernel) // 2
+        wrapped = np.zeros(length)
+        wrapped[:radius + 1] = kernel[radius:]
+        if radius:
+            wrapped[-radius:] = kernel[:radius]
+        # The kernel is symmetric, so its spectrum is real.
+        if axis == 2:
+            spectra.append(np.fft.rfft(wrapped).real)
+        else:
+            spectra.append(np.fft.fft(wrapped).real)
+
+    spectrum = (
+        spectra[0][:, None, None] * spectra[1][None, :, None] * spectra[2][None, None, :]
+    )
+    spectrum = spectrum[..., np.newaxis]
+    spectrum.setflags(write=False)
+    return spectrum, fft_shape
+
+
+def _smooth_separable(
+    block: np.ndarray, sigmas: Tuple[float, float, float]
+) -> np.ndarray:
+    """Smooth a (x, y, z, t) block with three passes of 1D convolution."""
+    result = block
+    for axis, sigma in enumerate(sigmas):
+        kernel = gaussian_kernel_1d(sigma)
+        radius = len(kernel) // 2
+        if radius == 0:
+            continue
+        n = result.shape[axis]
+        pad = [(0, 0)] * result.ndim
+        pad[axis] = (radius, radius)
+        padded = np.pad(result, pad)
+        index = [slice(None)] * result.ndim
+        smoothed = np.zeros_like(result)
+        for offset, weight in enumerate(kernel):
+            index[axis] = slice(offset, offset + n)
+            smoothed += float(weight) * padded[tuple(index)]
+        result = smoothed
+    return result
+
+
+def _smooth_fft(block: np.ndarray, sigmas: Tuple[float, float, float]) -> np.ndarray:
+    """Smooth a (x, y, z, t) block by multiplication with a cached spectrum."""
+    volume_shape = block.shape[:3]
+    spectrum, fft_shape = _kernel_spectrum(volume_shape, sigmas)
+    transformed = np.fft.rfftn(block, s=fft_shape, axes=(0, 1, 2))
+    transformed *= spectrum
+    smoothed = np.fft.irfftn(transformed, s=fft_shape, axes=(0, 1, 2))
+    return smoothed[: volume_shape[0], : volume_shape[1], : volume_shape[2]]
+
+
+def _choose_method(
+    volume_shape: Tuple[int, int, int], sigmas: Tuple[float, float, float]
+) -> str:
+    """
+    Pick the cheaper engine from a simple cost model.
+
+    The separable engine costs one multiply-add per voxel per kernel tap;
+    the FFT engine costs ``P log2 P`` on the padded grid, independent of the
+    number of taps.
+    """
+    kernels = [gaussian_kernel_1d(s) for s in sigmas]
+    n_voxels = float(np.prod(volume_shape))
+    separable_cost = n_voxels * sum(len(k) for k in kernels if len(k) > 1)
+    padded = float(np.prod([
+        _fft_length(n + len(k) // 2) for n, k in zip(volume_shape, kernels)
+    ]))
+    fft_cost = _FFT_COST_FACTOR * padded * np.log2(max(padded, 2.0))
+    return "fft" if fft_cost < separable_cost else "separable"
+
+
+def smooth_volumes(
+    data: np.ndarray,
+    fwhm: Union[float, Sequence[float]],
+    voxel_size: Optional[Sequence[float]] = None,
+    method: str = "auto",
+    n_jobs: int = 1,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Smooth a 3D volume or every volume of a 4D run with a Gaussian kernel.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        A 3D volume or a 4D array with time on the last axis.
+    fwhm : Union[float, Sequence[float]]
+        Full width at half maximum of the kernel in mm, isotropic or per axis.
+    voxel_size : Optional[Sequence[float]], optional
+        Voxel size in mm along each spatial axis, by default 1 mm isotropic.
+    method : str, optional
+        ``"separable"``, ``"fft"`` or ``"auto"`` to choose the cheaper engine
+        for this kernel and volume size, by default "auto".
+    n_jobs : int, optional
+        Number of threads to smooth volumes with, by default 1. Use -1 for
+        one thread per CPU.
+    out : Optional[np.ndarray], optional
+        Array to write the result into, by default a new array of the input's
+        floating dtype (float64 for integer input). May be ``data`` itself.
+
+    Returns
+    -------
+    np.ndarray
+        The smoothed data, with the same shape as ``data``.
+
+    Raises
+    ------
+    ValueError
+        If the method or data dimensionality is not supported.
+    """
+    if data.ndim not in (3, 4):
+        raise ValueError(f"Expected 3D or 4D data, got {data.ndim}D")
+    if method not in ("auto", "separable", "fft"):
+        raise ValueError(f"Unknown smoothing method: {method}")
+
+    if out is None:
+        dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+        out = np.empty(data.shape, dtype=dtype)
+
+    sigmas = fwhm_to_sigma(fwhm, voxel_size)
+    if method == "auto":
+        method = _choose_method(data.shape[:3], sigmas)
+    smooth = _smooth_fft if method == "fft" else _smooth_separable
+
+    if data.ndim == 3:
+        out[...] = smooth(np.asarray(data, dtype=out.dtype)[..., np.newaxis], sigmas)[..., 0]
+        return out
+
+    def smooth_block(block: slice) -> None:
+        out[..., block] = smooth(np.asarray(data[..., block], dtype=out.dtype), sigmas)
+
+    n_volumes = data.shape[-1]
+    blocks = [
+        slice(start, min(start + _VOLUMES_PER_TASK, n_volumes))
+        for start in range(0, n_volumes, _VOLUMES_PER_TASK)
+    ]
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(blocks) == 1:
+        for block in blocks:
+            smooth_block(block)
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            # Consume the iterator so worker exceptions propagate.
+            list(pool.map(smooth_block, blocks))
+
+    return out
@@ -0,0 +1,16 @@
+"""
+Data structures shared across the imaging and analysis modules.
+"""
+
+from .chunked import ChunkedArray, is_chunked_store, open_chunked, save_chunked
+from .masked import MaskedTimeSeries
+from .shared_memory import SharedArray
+
+__all__ = [
+    "ChunkedArray",
+    "MaskedTimeSeries",
+    "SharedArray",
+    "is_chunked_store",
+    "open_chunked",
+    "save_chunked",
+]
@@ -0,0 +1,362 @@
+"""
+Chunked, compressed on-disk array store.
+
+An array is split into a regular grid of chunks, each compressed on its own
+with ``zlib`` or ``lzma`` and written to its own file, next to a JSON index
+holding the shape, dtype, chunk shape, codec and free-form attributes (e.g.
+the affine). Reading a time range or a block of voxels decompresses only
+the chunks it overlaps. Chunks are compressed and decompressed in a thread
+pool; both codecs release the GIL, so this scales with the number of cores.
+Before compression, the bytes of each chunk are regrouped by their position
+within an element ("byte shuffle"), which typically makes float data
+compress much better.
+"""
+
+import json
+import lzma
+import os
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+_INDEX_NAME = "index.json"
+
+_FORMAT = "cog_neuro.chunked"
+
+_VERSION = 1
+
+# Target number of elements per chunk for the default chunk shape.
+_CHUNK_ELEMENTS = 2 ** 20
+
+_COMPRESSIONS = ("zlib", "lzma", "none")
+
+
+def _compress(raw: bytes, compression: str, level: int) -> bytes:
+    if compression == "zlib":
+        return zlib.compress(raw, level)
+    if compression == "lzma":
+        return lzma.compress(raw, preset=level)
+    return raw
+
+
+def _decompress(payload: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.decompress(payload)
+    if compression == "lzma":
+        return lzma.decompress(payload)
+    return payload
+
+
+def _shuffle(chunk: np.ndarray) -> bytes:
+    """Group the bytes of every element by position, most significant together."""
+    raw = np.frombuffer(np.ascontiguousarray(chunk).tobytes(), dtype=np.uint8)
+    return raw.reshape(-1, chunk.dtype.itemsize).T.tobytes()
+
+
+def _unshuffle(raw: bytes, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+    grouped = np.frombuffer(raw, dtype=np.uint8).reshape(dtype.itemsize, -1)
+    return np.ascontiguousarray(grouped.T).view(dtype).reshape(shape)
+
+
+def _n_jobs(n_jobs: int) -> int:
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    return max(1, n_jobs)
+
+
+def _map(func, items: List[Any], n_jobs: int) -> list:
+    n_jobs = min(_n_jobs(n_jobs), max(len(items), 1))
+    if n_jobs == 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        return list(pool.map(func, items))
+
+
+def default_chunks(shape: Sequence[int]) -> Tuple[int, ...]:
+    """
+    Chunk shape with about a million elements and equal sides.
+
+    E.g. 32 along every axis of a 4D array, or 1024 x 1024 for a 2D array,
+    clipped to the array's shape.
+    """
+    edge = max(1, int(round(_CHUNK_ELEMENTS ** (1.0 / max(len(shape), 1)))))
+    return tuple(max(1, min(int(n), edge)) for n in shape)
+
+
+def is_chunked_store(path: Union[str, os.PathLike]) -> bool:
+    """Whether ``path`` is a directory written by :func:`save_chunked`."""
+    return os.path.isfile(os.path.join(os.fspath(path), _INDEX_NAME))
+
+
+def _chunk_name(index: Tuple[int, ...]) -> str:
+    return "c" + ".".join(str(i) for i in index)
+
+
+class ChunkedArray:
+    """
+    Read-only, lazily loaded array stored by :func:`save_chunked`.
+
+    Indexing with integers, slices and an ellipsis (``array[..., 10:20]``,
+    ``array[:8, :8, :8]``) reads and decompresses only the chunks the
+    selection overlaps and returns a NumPy array. ``np.asarray(array)``
+    reads everything.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store.
+    n_jobs : int, optional
+        Number of threads used to decompress chunks, by default 1. Use -1
+        for one per CPU.
+
+    Attributes
+    ----------
+    attrs : Dict[str, Any]
+        The attributes saved with the array.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], n_jobs: int = 1):
+        self.path = os.fspath(path)
+        with open(os.path.join(self.path, _INDEX_NAME)) as f:
+            index = json.load(f)
+        if index.get("format") != _FORMAT:
+            raise ValueError(f"Not a chunked array store: {self.path}")
+        if index.get("version", 0) > _VERSION:
+            raise ValueError(
+                f"Store version {index['version']} is newer than supported ({_VERSION})"
+            )
+        self.shape = tuple(index["shape"])
+        self.dtype = np.dtype(index["dtype"])
+        self.chunks = tuple(index["chunks"])
+        self.compression = index["compression"]
+        self.shuffle = index["shuffle"]
+        self.attrs: Dict[str, Any] = index.get("attrs", {})
+        self.n_jobs = n_jobs
+
+    @property
+    def ndim(self) -> int:
+        """Number of dimensions."""
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        """Number of elements."""
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the decompressed array in bytes."""
+        return self.size * self.dtype.itemsize
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return (
+            f"ChunkedArray({self.path!r}, shape={self.shape}, dtype={self.dtype}, "
+            f"chunks={self.chunks}, compression={self.compression!r})"
+        )
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None) -> np.ndarray:
+        result = self[...]
+        return result if dtype is None else result.astype(dtype, copy=False)
+
+    def _normalize(self, key: Any) -> Tuple[List[range], Tuple[Any, ...]]:
+        """Per-axis index ranges to read, and the indexing to apply after."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if sum(k is Ellipsis for k in key) > 1:
+            raise IndexError("An index can only have a single ellipsis")
+        if Ellipsis in key:
+            at = key.index(Ellipsis)
+            key = key[:at] + (slice(None),) * (self.ndim - len(key) + 1) + key[at + 1:]
+        if len(key) > self.ndim:
+            raise IndexError(f"Too many indices for a {self.ndim}D array")
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        ranges: List[range] = []
+        post: List[Any] = []
+        for k, n in zip(key, self.shape):
+            if isinstance(k, (int, np.integer)):
+                if not -n <= k < n:
+                    raise IndexError(f"Index {k} is out of bounds for axis with size {n}")
+                k = int(k) % n
+                ranges.append(range(k, k + 1))
+                post.append(0)
+            elif isinstance(k, slice):
+                selected = range(*k.indices(n))
+                if selected.step < 0:
+                    # Read the covered range forwards, then reverse it.
+                    low = selected[-1] if len(selected) else 0
+                    high = selected[0] + 1 if len(selected) else 0
+                    ranges.append(range(low, high))
+                    post.append(slice(None, None, selected.step))
+                else:
+                    stop = selected[-1] + 1 if len(selected) else selected.start
+                    ranges.append(range(selected.start, stop))
+                    post.append(slice(None, None, selected.step))
+            else:
+                raise TypeError(
+                    "ChunkedArray supports integer, slice and ellipsis indexing only"
+                )
+        return ranges, tuple(post)
+
+    def _chunk_ids(self, ranges: List[range]) -> Iterator[Tuple[int, ...]]:
+        axes = [
+            range(r.start // c, (r.stop - 1) // c + 1) if len(r) else range(0)
+            for r, c in zip(ranges, self.chunks)
+        ]
+        return product(*axes)
+
+    def read_chunk(self, index: Tuple[int, ...]) -> np.ndarray:
+        """Decompress the chunk at grid position ``index``."""
+        shape = tuple(
+            min(c, n - i * c) for i, c, n in zip(index, self.chunks, self.shape)
+        )
+        with open(os.path.join(self.path, _chunk_name(index)), "rb") as f:
+            raw = _decompress(f.read(), self.compression)
+        if self.shuffle:
+            return _unshuffle(raw, self.dtype, shape)
+        return np.frombuffer(raw, dtype=self.dtype).reshape(shape)
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        ranges, post = self._normalize(key)
+        out = np.empty(tuple(len(r) for r in ranges), dtype=self.dtype)
+        origin = [r.start for r in ranges]
+
+        def fill(index: Tuple[int, ...]) -> None:
+            chunk = self.read_chunk(index)
+            source, target = [], []
+            for i, c, r, o in zip(index, self.chunks, ranges, origin):
+                start, stop = max(i * c, r.start), min((i + 1) * c, r.stop)
+                source.append(slice(start - i * c, stop - i * c))
+                target.append(slice(start - o, stop - o))
+            out[tuple(target)] = chunk[tuple(source)]
+
+        _map(fill, list(self._chunk_ids(ranges)), self.n_jobs)
+        return out[post]
+
+
+def save_chunked(
+    path: Union[str, os.PathLike],
+    data: np.ndarray,
+    chunks: Optional[Sequence[int]] = None,
+    compression: str = "zlib",
+    level: int = 1,
+    shuffle: bool = True,
+    attrs: Optional[Dict[str, Any]] = None,
+    n_jobs: int = 1,
+) -> ChunkedArray:
+    """
+    Write an array as a directory of independently compressed chunks.
+
+    Parameters
+    ----------
+    path : str
+        Directory to write; created if missing. An existing store there is
+        replaced.
+    data : np.ndarray
+        The array, e.g. a (x, y, z, time) run or (roi, time) series. May be
+        a memmap: each chunk is read from it only when it is compressed.
+    chunks : Optional[Sequence[int]], optional
+        Chunk shape, by default about a million elements with equal sides
+        (see :func:`default_chunks`). Smaller chunks make small reads
+        cheaper at the cost of compression ratio.
+    compression : str, optional
+        ``"zlib"``, ``"lzma"`` or ``"none"``, by default "zlib".
+    level : int, optional
+        Compression level (zlib level or lzma preset), by default 1, which
+        favours speed.
+    shuffle : bool, optional
+        Whether to byte-shuffle chunks before compression, by default True.
+    attrs : Optional[Dict[str, Any]], optional
+        JSON-serializable attributes to store with the array, e.g.
+        ``{"affine": affine.tolist(), "t_r": 2.0}``, by default None.
+    n_jobs : int, optional
+        Number of threads compressing chunks, by default 1. Use -1 for one
+        per CPU.
+
+    Returns
+    -------
+    ChunkedArray
+        The written store, opened for reading.
+
+    Raises
+    ------
+    ValueError
+        If the compression or chunk shape is invalid, or ``path`` exists and
+        is not a chunked store.
+    """
+    if compression not in _COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    path = os.fspath(path)
+    shape = tuple(int(n) for n in data.shape)
+    dtype = np.dtype(data.dtype).newbyteorder("=")
+    chunks = default_chunks(shape) if chunks is None else tuple(int(c) for c in chunks)
+    if len(chunks) != len(shape) or any(c < 1 for c in chunks):
+        raise ValueError(f"Invalid chunk shape {chunks} for an array of shape {shape}")
+
+    if os.path.exists(path):
+        if not is_chunked_store(path):
+            raise ValueError(f"{path} exists and is not a chunked array store")
+        # Unpublish the old store before its chunks are overwritten.
+        os.remove(os.path.join(path, _INDEX_NAME))
+    os.makedirs(path, exist_ok=True)
+
+    grid = [range(-(-n // c)) for n, c in zip(shape, chunks)]
+    indices = list(product(*grid))
+
+    def write(index: Tuple[int, ...]) -> None:
+        region = tuple(slice(i * c, (i + 1) * c) for i, c in zip(index, chunks))
+        chunk = np.ascontiguousarray(data[region], dtype=dtype)
+        raw = _shuffle(chunk) if shuffle else chunk.tobytes()
+        with open(os.path.join(path, _chunk_name(index)), "wb") as f:
+            f.write(_compress(raw, compression, level))
+
+    _map(write, indices, n_jobs)
+
+    written = {_chunk_name(index) for index in indices}
+    for name in os.listdir(path):
+        if name.startswith("c") and name not in written:
+            os.remove(os.path.join(path, name))
+
+    index = {
+        "format": _FORMAT,
+        "version": _VERSION,
+        "shape": list(shape),
+        "dtype": dtype.str,
+        "chunks": list(chunks),
+        "compression": compression,
+        "shuffle": shuffle,
+        "attrs": attrs or {},
+    }
+    tmp_path = os.path.join(path, _INDEX_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, _INDEX_NAME))
+    return ChunkedArray(path, n_jobs=n_jobs)
+
+
+def open_chunked(path: Union[str, os.PathLike], n_jobs: int = 1) -> ChunkedArray:
+    """
+    Open a store written by :func:`save_chunked` for lazy reading.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the store.
+    n_jobs : int, optional
+        Number of threads decompressing chunks, by default 1. Use -1 for
+        one per CPU.
+
+    Returns
+    -------
+    ChunkedArray
+        The lazily loaded array.
+    """
+    if not is_chunked_store(path):
+        raise FileNotFoundError(f"No chunked array store at {os.fspath(path)}")
+    return ChunkedArray(path, n_jobs=n_jobs)
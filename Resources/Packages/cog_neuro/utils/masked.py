@@ -0,0 +1,373 @@
+"""
+Compact storage for the time series of the voxels inside a brain mask.
+
+A 4D run is mostly background: typically only a third of the voxels of the
+bounding box are inside the brain. :class:`MaskedTimeSeries` keeps just the
+in-mask voxels as one contiguous 2D buffer (voxels x time, or time x
+voxels), together with the mask that places them and the image affine.
+Temporal operations work directly on the buffer, time slices are views of
+it, and the data are scattered back into a dense volume only on request.
+"""
+
+import numpy as np
+from typing import Any, Iterator, Optional, Tuple, Union
+
+
+# Volumes gathered or scattered per block when converting to or from 4D.
+_VOLUMES_PER_BLOCK = 64
+
+_LAYOUTS = ("voxels", "time")
+
+
+def _time_blocks(n_timepoints: int, block_size: int) -> Iterator[slice]:
+    for start in range(0, n_timepoints, block_size):
+        yield slice(start, min(start + block_size, n_timepoints))
+
+
+class MaskedTimeSeries:
+    """
+    Time series of the in-mask voxels of a 4D image.
+
+    Voxels are stored in C order of the mask, i.e. in the order of
+    ``volume[mask]``, so row ``i`` of :attr:`series` is the time series of
+    the ``i``-th voxel of ``np.flatnonzero(mask)``.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Buffer with shape (n_voxels, n_timepoints) for the ``"voxels"``
+        layout or (n_timepoints, n_voxels) for the ``"time"`` layout. It is
+        stored as given, without a copy.
+    mask : np.ndarray
+        Boolean volume with ``n_voxels`` true voxels.
+    affine : Optional[np.ndarray], optional
+        Voxel-to-world affine of the image, by default the identity.
+    layout : str, optional
+        ``"voxels"`` (each voxel's time series is contiguous, best for
+        filtering and correlation) or ``"time"`` (each volume is contiguous,
+        best for per-volume access), by default "voxels".
+
+    Raises
+    ------
+    ValueError
+        If the layout is unknown or the buffer does not match the mask.
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        mask: np.ndarray,
+        affine: Optional[np.ndarray] = None,
+        layout: str = "voxels",
+    ):
+        if layout not in _LAYOUTS:
+            raise ValueError(f"Unknown layout: {layout}")
+        data = np.asarray(data)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.ndim != 3:
+            raise ValueError(f"Mask must be a 3D volume, got {mask.ndim}D")
+        if data.ndim != 2:
+            raise ValueError(f"Expected a 2D buffer, got {data.ndim}D")
+        n_voxels = data.shape[0] if layout == "voxels" else data.shape[1]
+        if n_voxels != np.count_nonzero(mask):
+            raise ValueError(
+                f"Buffer has {n_voxels} voxels but the mask has "
+                f"{np.count_nonzero(mask)}"
+            )
+        self.data = data
+        self.mask = mask
+        self.affine = np.eye(4) if affine is None else np.asarray(affine, dtype=np.float64)
+        self.layout = layout
+        self._voxels: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_volume(
+        cls,
+        data: np.ndarray,
+        mask: Optional[np.ndarray] = None,
+        affine: Optional[np.ndarray] = None,
+        layout: str = "voxels",
+        dtype: np.dtype = np.float32,
+        block_size: int = _VOLUMES_PER_BLOCK,
+    ) -> "MaskedTimeSeries":
+        """
+        Gather the in-mask voxels of a 4D array.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Array with shape (x, y, z, time); may be a memmap, which is read
+            ``block_size`` volumes at a time.
+        mask : Optional[np.ndarray], optional
+            Boolean volume, by default every voxel that is non-zero at some
+            time point.
+        affine : Optional[np.ndarray], optional
+            Voxel-to-world affine, by default the identity.
+        layout : str, optional
+            Buffer layout, ``"voxels"`` or ``"time"``, by default "voxels".
+        dtype : np.dtype, optional
+            Buffer dtype, by default float32.
+        block_size : int, optional
+            Volumes read at a time, by default 64.
+
+        Returns
+        -------
+        MaskedTimeSeries
+            The masked time series.
+        """
+        if data.ndim != 4:
+            raise ValueError(f"Expected 4D data, got {data.ndim}D")
+        n_timepoints = data.shape[-1]
+        if mask is None:
+            mask = np.zeros(data.shape[:3], dtype=bool)
+            for block in _time_blocks(n_timepoints, block_size):
+                mask |= np.any(np.asarray(data[..., block]) != 0, axis=-1)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != data.shape[:3]:
+            raise ValueError(
+                f"Mask shape {mask.shape} does not match data shape {data.shape[:3]}"
+            )
+
+        n_voxels = int(np.count_nonzero(mask))
+        if layout == "time":
+            buffer = np.empty((n_timepoints, n_voxels), dtype=dtype)
+        else:
+            buffer = np.empty((n_voxels, n_timepoints), dtype=dtype)
+        result = cls(buffer, mask, affine=affine, layout=layout)
+        series = result.series
+        for block in _time_blocks(n_timepoints, block_size):
+            series[:, block] = np.asarray(data[..., block])[mask]
+        return result
+
+    @classmethod
+    def from_nifti(
+        cls,
+        filepath: str,
+        mask: Optional[np.ndarray] = None,
+        layout: str = "voxels",
+        dtype: np.dtype = np.float32,
+        block_size: int = _VOLUMES_PER_BLOCK,
+    ) -> "MaskedTimeSeries":
+        """
+        Read the in-mask voxels of a 4D NIfTI image.
+
+        Volumes are decoded ``block_size`` at a time, so the dense run is
+        never held in memory. Without a mask, the file is read twice: once
+        to find the non-zero voxels and once to gather them.
+
+        Parameters
+        ----------
+        filepath : str
+            Path to a ``.nii`` or ``.nii.gz`` image.
+        mask : Optional[np.ndarray], optional
+            Boolean volume, by default every voxel that is non-zero at some
+            time point.
+        layout : str, optional
+            Buffer layout, ``"voxels"`` or ``"time"``, by default "voxels".
+        dtype : np.dtype, optional
+            Buffer dtype, by default float32.
+        block_size : int, optional
+            Volumes decoded at a time, by default 64.
+
+        Returns
+        -------
+        MaskedTimeSeries
+            The masked time series, with the image's affine.
+        """
+        from ..imaging.nifti import NiftiImage
+
+        with NiftiImage(filepath) as img:
+            volume_shape = tuple(img.volume_shape)
+            if len(volume_shape) != 3:
+                raise ValueError(f"Expected a 3D or 4D image, got shape {img.shape}")
+            n_timepoints = img.n_volumes
+            if mask is None:
+                mask = np.zeros(volume_shape, dtype=bool)
+                for start in range(0, n_timepoints, block_size):
+                    block = img.get_volumes(start, start + block_size)
+                    mask |= np.any(block != 0, axis=-1)
+            mask = np.asarray(mask, dtype=bool)
+            if mask.shape != volume_shape:
+                raise ValueError(
+                    f"Mask shape {mask.shape} does not match image shape {volume_shape}"
+                )
+
+            n_voxels = int(np.count_nonzero(mask))
+            if layout == "time":
+                buffer = np.empty((n_timepoints, n_voxels), dtype=dtype)
+            else:
+                buffer = np.empty((n_voxels, n_timepoints), dtype=dtype)
+            result = cls(buffer, mask, affine=img.affine, layout=layout)
+            series = result.series
+            for start in range(0, n_timepoints, block_size):
+                block = img.get_volumes(start, start + block_size)
+                series[:, start:start + block.shape[-1]] = block[mask]
+        return result
+
+    @property
+    def series(self) -> np.ndarray:
+        """The buffer as a (voxels, time) array; a view, never a copy."""
+        return self.data if self.layout == "voxels" else self.data.T
+
+    @property
+    def volumes(self) -> np.ndarray:
+        """The buffer as a (time, voxels) array; a view, never a copy."""
+        return self.data.T if self.layout == "voxels" else self.data
+
+    @property
+    def n_voxels(self) -> int:
+        """Number of in-mask voxels."""
+        return self.series.shape[0]
+
+    @property
+    def n_timepoints(self) -> int:
+        """Number of time points."""
+        return self.series.shape[1]
+
+    @property
+    def volume_shape(self) -> Tuple[int, ...]:
+        """Spatial shape of the image."""
+        return self.mask.shape
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the equivalent dense 4D array."""
+        return self.mask.shape + (self.n_timepoints,)
+
+    @property
+    def ndim(self) -> int:
+        """Number of dimensions of the equivalent dense array, always 4."""
+        return 4
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Dtype of the buffer."""
+        return self.data.dtype
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the buffer in bytes."""
+        return self.data.nbytes
+
+    @property
+    def voxel_indices(self) -> np.ndarray:
+        """Flat C-order index in the volume of each stored voxel."""
+        if self._voxels is None:
+            self._voxels = np.flatnonzero(self.mask)
+        return self._voxels
+
+    def __repr__(self) -> str:
+        return (
+            f"MaskedTimeSeries(n_voxels={self.n_voxels}, "
+            f"n_timepoints={self.n_timepoints}, volume_shape={self.volume_shape}, "
+            f"layout={self.layout!r}, dtype={self.dtype})"
+        )
+
+    def __getitem__(self, index: Union[int, slice]) -> "MaskedTimeSeries":
+        """
+        Select time points.
+
+        Slices give a view sharing the buffer; an integer selects a single
+        time point (use :meth:`volume` to get it as a dense volume).
+        """
+        if isinstance(index, (int, np.integer)):
+            n_timepoints = self.n_timepoints
+            if not -n_timepoints <= index < n_timepoints:
+                raise IndexError(f"Time index out of range: {index}")
+            index = slice(index, index + 1 or None)
+        if not isinstance(index, slice):
+            raise TypeError("MaskedTimeSeries only supports slicing along time")
+        if self.layout == "voxels":
+            return self.with_data(self.data[:, index])
+        return self.with_data(self.data[index])
+
+    def with_data(self, data: np.ndarray) -> "MaskedTimeSeries":
+        """Wrap another buffer in the same layout with this mask and affine."""
+        result = MaskedTimeSeries(data, self.mask, affine=self.affine, layout=self.layout)
+        result._voxels = self._voxels
+        return result
+
+    def copy(self, dtype: Optional[np.dtype] = None) -> "MaskedTimeSeries":
+        """A copy with its own buffer, optionally cast to ``dtype``."""
+        return self.with_data(np.array(self.data, dtype=dtype or self.dtype))
+
+    def volume(self, index: int, fill: float = 0.0) -> np.ndarray:
+        """
+        Scatter one time point into a dense volume.
+
+        Parameters
+        ----------
+        index : int
+            Time index; negative values count from the end.
+        fill : float, optional
+            Value of the voxels outside the mask, by default 0.
+
+        Returns
+        -------
+        np.ndarray
+            Volume with shape :attr:`volume_shape`.
+        """
+        result = np.full(self.volume_shape, fill, dtype=self.dtype)
+        result[self.mask] = self.volumes[index]
+        return result
+
+    def to_volume(
+        self,
+        out: Optional[np.ndarray] = None,
+        fill: float = 0.0,
+        block_size: int = _VOLUMES_PER_BLOCK,
+    ) -> np.ndarray:
+        """
+        Scatter the time series back into a dense 4D array.
+
+        Parameters
+        ----------
+        out : Optional[np.ndarray], optional
+            Array or memmap with shape :attr:`shape` to write into, by
+            default a new array of the buffer's dtype.
+        fill : float, optional
+            Value of the voxels outside the mask, by default 0.
+        block_size : int, optional
+            Volumes written at a time, by default 64.
+
+        Returns
+        -------
+        np.ndarray
+            The dense (x, y, z, time) array.
+        """
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        elif out.shape != self.shape:
+            raise ValueError(f"Output has shape {out.shape}, expected {self.shape}")
+        series = self.series
+        for block in _time_blocks(self.n_timepoints, block_size):
+            volumes = np.full(self.volume_shape + (block.stop - block.start,), fill,
+                              dtype=out.dtype)
+            volumes[self.mask] = series[:, block]
+            out[..., block] = volumes
+        return out
+
+    def map_volume(self, values: np.ndarray, fill: Any = 0) -> np.ndarray:
+        """
+        Scatter per-voxel values, e.g. a connectivity map, into a volume.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            Array with ``n_voxels`` entries along its first axis.
+        fill : Any, optional
+            Value of the voxels outside the mask, by default 0.
+
+        Returns
+        -------
+        np.ndarray
+            Array with shape ``volume_shape + values.shape[1:]``.
+        """
+        values = np.asarray(values)
+        if values.shape[:1] != (self.n_voxels,):
+            raise ValueError(
+                f"Expected {self.n_voxels} values, got shape {values.shape}"
+            )
+        result = np.full(self.volume_shape + values.shape[1:], fill, dtype=values.dtype)
+        result[self.mask] = values
+        return result
@@ -0,0 +1,94 @@
+"""
+NumPy arrays backed by ``multiprocessing.shared_memory``.
+
+Worker processes attach to a shared block by name instead of receiving a
+pickled copy of the array, so large inputs and outputs cross process
+boundaries without being serialized.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Any, Optional, Tuple
+
+
+# (block name, shape, dtype string): everything a worker needs to attach.
+SharedArrayDescriptor = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedArray:
+    """
+    A NumPy array stored in a named shared memory block.
+
+    The process that creates the block owns it and must call :meth:`unlink`
+    (or use the instance as a context manager) once all workers are done.
+    Workers attach with :meth:`attach` and only :meth:`close` their handle.
+
+    Parameters
+    ----------
+    shm : shared_memory.SharedMemory
+        The underlying shared memory block.
+    shape : Tuple[int, ...]
+        Shape of the array.
+    dtype : np.dtype
+        Dtype of the array.
+    owner : bool, optional
+        Whether this handle created the block, by default False.
+    """
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+        owner: bool = False,
+    ):
+        self.shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, shape: Tuple[int, ...], dtype: Any = np.float64) -> "SharedArray":
+        """Allocate a new, uninitialized shared array."""
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape, dtype=np.int64)) * dtype.itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        return cls(shm, tuple(shape), dtype, owner=True)
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, dtype: Optional[Any] = None) -> "SharedArray":
+        """Allocate a shared array and copy ``array`` into it."""
+        shared = cls.create(array.shape, dtype or array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, descriptor: SharedArrayDescriptor) -> "SharedArray":
+        """Attach to a shared array created by another process."""
+        name, shape, dtype = descriptor
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, tuple(shape), np.dtype(dtype))
+
+    @property
+    def descriptor(self) -> SharedArrayDescriptor:
+        """Picklable description used by workers to attach."""
+        return (self.shm.name, self.array.shape, self.array.dtype.str)
+
+    def close(self) -> None:
+        """Release this process's mapping of the block."""
+        self.array = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """Close the mapping and free the block (owner only)."""
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self) -> "SharedArray":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
@@ -5,6 +5,20 @@ This module provides functions and classes for visualizing neuroscience data,
 including brain maps, connectivity matrices, and statistical results.
 """
 
-from .brain_maps import plot_brain_map, plot_roi
+from .brain_maps import (
+    BrainMapRenderer,
+    export_brain_maps,
+    find_cut_coords,
+    load_background,
+    plot_brain_map,
+    plot_roi,
+)
 
-__all__ = ["plot_brain_map", "plot_roi"]
+__all__ = [
+    "BrainMapRenderer",
+    "export_brain_maps",
+    "find_cut_coords",
+    "load_background",
+    "plot_brain_map",
+    "plot_roi",
+]
@@ -3,11 +3,332 @@ Brain visualization tools for neuroscience data.
 
 This module provides functions for visualizing brain data, including
 statistical maps, ROIs, and connectivity.
+
+Maps are shown as sagittal, coronal and axial slices through a cut point
+chosen at the peak or centre of mass of the map. Each view is a single RGB
+image composited with array operations (background in grey, the
+thresholded overlay on top), so a figure has three images however many
+layers are shown. Background templates are loaded, resampled to the map's
+grid and normalized once, then kept in a small cache. For batch export,
+:class:`BrainMapRenderer` keeps one figure and its artists and only swaps
+the image data between maps.
 """
 
+import hashlib
+import os
 import numpy as np
 import matplotlib.pyplot as plt
-from typing import Optional, Union, Dict, Any, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib import colors as mcolors
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.figure import Figure
+from typing import Optional, Union, Dict, Any, List, Sequence, Tuple
+
+from ..imaging.motion import trilinear_sample
+from ..imaging.nifti import NiftiImage
+
+
+_VIEWS = ("Sagittal", "Coronal", "Axial")
+
+# Number of resampled background templates kept in memory.
+_BACKGROUND_CACHE_SIZE = 8
+
+# Figure-fraction positions of the three views and the colorbar.
+_VIEW_RECTS = [(0.01 + 0.3 * i, 0.05, 0.29, 0.8) for i in range(3)]
+_COLORBAR_RECT = (0.92, 0.1, 0.015, 0.7)
+
+_background_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+ImageLike = Union[str, np.ndarray]
+
+
+def _load_volume(img: ImageLike) -> np.ndarray:
+    """A 3D volume from an array or a NIfTI path (first volume if 4D)."""
+    if isinstance(img, (str, os.PathLike)):
+        with NiftiImage(os.fspath(img)) as nifti:
+            volume = nifti.get_volume(0, dtype=np.float64)
+    else:
+        volume = np.asarray(img, dtype=np.float64)
+        if volume.ndim == 4:
+            volume = volume[..., 0]
+    if volume.ndim != 3:
+        raise ValueError(f"Expected a 3D volume, got {volume.ndim}D")
+    return volume
+
+
+def _resample(volume: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """Trilinearly resample ``volume`` to ``shape`` over the same field of view."""
+    if volume.shape == tuple(shape):
+        return volume
+    axes = [
+        np.linspace(0, n_in - 1, n_out)
+        for n_in, n_out in zip(volume.shape, shape)
+    ]
+    grid = np.meshgrid(*axes, indexing="ij")
+    coords = np.stack([g.ravel() for g in grid])
+    values, _ = trilinear_sample(np.ascontiguousarray(volume), coords)
+    return values.reshape(shape)
+
+
+def load_background(background_img: ImageLike, shape: Tuple[int, ...]) -> np.ndarray:
+    """
+    Load a background template resampled to ``shape`` and scaled to [0, 1].
+
+    Intensities are clipped to the 2nd-98th percentile of the non-zero
+    voxels. Results are cached by file (path, size and mtime) or array
+    content and target shape, so repeated calls with the same template do
+    the work only once.
+
+    Parameters
+    ----------
+    background_img : Union[str, np.ndarray]
+        A 3D volume or the path to a NIfTI image.
+    shape : Tuple[int, ...]
+        Shape of the map the template is displayed under. The template is
+        assumed to cover the same field of view.
+
+    Returns
+    -------
+    np.ndarray
+        The float32 template with shape ``shape``. The array is cached and
+        must not be modified.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(background_img, (str, os.PathLike)):
+        path = os.path.realpath(os.fspath(background_img))
+        stat = os.stat(path)
+        digest.update(repr((path, stat.st_size, stat.st_mtime_ns)).encode())
+    else:
+        array = np.ascontiguousarray(background_img)
+        digest.update(repr((array.shape, array.dtype.str)).encode())
+        digest.update(array.data)
+    digest.update(repr(tuple(shape)).encode())
+    key = digest.hexdigest()
+
+    background = _background_cache.get(key)
+    if background is None:
+        volume = _resample(_load_volume(background_img), tuple(shape))
+        foreground = volume[volume != 0]
+        low, high = (
+            np.percentile(foreground, [2, 98]) if foreground.size else (0.0, 1.0)
+        )
+        scale = 1.0 / (high - low) if high > low else 1.0
+        background = np.clip((volume - low) * scale, 0, 1).astype(np.float32)
+        background.setflags(write=False)
+        _background_cache[key] = background
+        if len(_background_cache) > _BACKGROUND_CACHE_SIZE:
+            _background_cache.popitem(last=False)
+    else:
+        _background_cache.move_to_end(key)
+    return background
+
+
+def find_cut_coords(data: np.ndarray, method: str = "peak") -> Tuple[int, int, int]:
+    """
+    Choose the voxel to cut the three views through.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        The 3D map.
+    method : str, optional
+        ``"peak"`` for the voxel of largest absolute value, or ``"center"``
+        for the centre of mass of the absolute values, by default "peak".
+
+    Returns
+    -------
+    Tuple[int, int, int]
+        Voxel indices of the cut; the centre of the volume if the map is
+        empty.
+    """
+    if method not in ("peak", "center"):
+        raise ValueError(f"Unknown cut method: {method}")
+    weights = np.abs(np.nan_to_num(np.asarray(data, dtype=np.float64)))
+    total = weights.sum()
+    if total == 0:
+        return tuple(n // 2 for n in weights.shape)
+    if method == "peak":
+        return tuple(int(i) for i in np.unravel_index(np.argmax(weights), weights.shape))
+    coords = []
+    for axis, n in enumerate(weights.shape):
+        other = tuple(a for a in range(weights.ndim) if a != axis)
+        profile = weights.sum(axis=other)
+        coords.append(int(round(float(profile @ np.arange(n) / total))))
+    return tuple(coords)
+
+
+def _views(volume: np.ndarray, coords: Sequence[int]) -> List[np.ndarray]:
+    """Sagittal, coronal and axial slices, oriented with superior up."""
+    x, y, z = coords
+    return [volume[x, :, :].T, volume[:, y, :].T, volume[:, :, z].T]
+
+
+def _composite(
+    background: Optional[np.ndarray],
+    overlay: np.ndarray,
+    cmap: mcolors.Colormap,
+    norm: mcolors.Normalize,
+    threshold: Optional[float],
+    alpha: float,
+) -> np.ndarray:
+    """Blend a colormapped, thresholded overlay over a grey background."""
+    finite = np.isfinite(overlay)
+    if threshold is None:
+        shown = finite & (overlay != 0)
+    else:
+        shown = finite & (np.abs(overlay) >= threshold)
+    rgba = cmap(norm(np.where(finite, overlay, 0)))
+    weight = np.where(shown, alpha * rgba[..., 3], 0.0)[..., np.newaxis]
+    if background is None:
+        base = np.zeros(overlay.shape + (1,))
+    else:
+        base = background[..., np.newaxis]
+    return base * (1 - weight) + rgba[..., :3] * weight
+
+
+class BrainMapRenderer:
+    """
+    Reusable three-view figure for rendering many maps quickly.
+
+    The figure, its axes, images, colorbar and title are created once; each
+    call to :meth:`render` only replaces the image data and limits, which is
+    much cheaper than building a new figure.
+
+    Parameters
+    ----------
+    figsize : Tuple[int, int], optional
+        Size of the figure in inches, by default (12, 4).
+    dpi : int, optional
+        Resolution of saved images, by default 100.
+    colorbar : bool, optional
+        Whether to draw a colorbar, by default True.
+    figure : Optional[Figure], optional
+        Figure to draw in, e.g. one from ``plt.figure``, by default a new
+        figure drawn with the Agg canvas outside pyplot.
+    """
+
+    def __init__(
+        self,
+        figsize: Tuple[int, int] = (12, 4),
+        dpi: int = 100,
+        colorbar: bool = True,
+        figure: Optional[Figure] = None,
+    ):
+        if figure is None:
+            figure = Figure(figsize=figsize, dpi=dpi)
+            FigureCanvasAgg(figure)
+        self.figure = figure
+        self.axes = []
+        self.images = []
+        for rect, view in zip(_VIEW_RECTS, _VIEWS):
+            ax = figure.add_axes(rect)
+            ax.set_xticks([])
+            ax.set_yticks([])
+            ax.set_xlabel(view)
+            ax.set_facecolor("black")
+            self.axes.append(ax)
+            self.images.append(
+                ax.imshow(np.zeros((1, 1, 3)), origin="lower", interpolation="nearest")
+            )
+        self.mappable = ScalarMappable(cmap="hot")
+        self.colorbar = None
+        if colorbar:
+            self.colorbar = figure.colorbar(
+                self.mappable, cax=figure.add_axes(_COLORBAR_RECT)
+            )
+        self.title = figure.suptitle("")
+
+    def render(
+        self,
+        data: ImageLike,
+        background_img: Optional[ImageLike] = None,
+        cmap: Union[str, mcolors.Colormap] = "hot",
+        threshold: Optional[float] = None,
+        cut_coords: Optional[Sequence[int]] = None,
+        cut_method: str = "peak",
+        vmin: Optional[float] = None,
+        vmax: Optional[float] = None,
+        alpha: float = 1.0,
+        title: str = "",
+        filepath: Optional[str] = None,
+    ) -> Figure:
+        """
+        Draw a map, optionally saving the figure to ``filepath``.
+
+        Parameters
+        ----------
+        data : Union[str, np.ndarray]
+            The 3D map, or the path to a NIfTI image.
+        background_img : Optional[Union[str, np.ndarray]], optional
+            Background template (see :func:`load_background`), by default
+            None for a black background.
+        cmap : Union[str, Colormap], optional
+            Colormap of the overlay, by default "hot".
+        threshold : Optional[float], optional
+            Voxels with an absolute value below it are not shown, by default
+            None, which shows every non-zero voxel.
+        cut_coords : Optional[Sequence[int]], optional
+            Voxel indices to cut through, by default chosen with
+            ``cut_method``.
+        cut_method : str, optional
+            ``"peak"`` or ``"center"``, see :func:`find_cut_coords`, by
+            default "peak".
+        vmin, vmax : Optional[float], optional
+            Colormap limits, by default ``-max|data|`` (or 0 for maps
+            without negative values) and ``max|data|``.
+        alpha : float, optional
+            Opacity of the overlay, by default 1.0.
+        title : str, optional
+            Figure title, by default "".
+        filepath : Optional[str], optional
+            Image file to save to, by default None.
+
+        Returns
+        -------
+        Figure
+            The figure.
+        """
+        data = _load_volume(data)
+        if cut_coords is None:
+            cut_coords = find_cut_coords(data, cut_method)
+        cut_coords = tuple(
+            int(np.clip(c, 0, n - 1)) for c, n in zip(cut_coords, data.shape)
+        )
+        background = None
+        if background_img is not None:
+            background = load_background(background_img, data.shape)
+
+        finite = data[np.isfinite(data)]
+        peak = float(np.abs(finite).max()) if finite.size else 0.0
+        if vmax is None:
+            vmax = peak or 1.0
+        if vmin is None:
+            vmin = -vmax if finite.size and finite.min() < 0 else 0.0
+        cmap = plt.get_cmap(cmap) if isinstance(cmap, str) else cmap
+        norm = mcolors.Normalize(vmin=vmin, vmax=vmax, clip=True)
+
+        overlays = _views(data, cut_coords)
+        backgrounds = [None] * 3
+        if background is not None:
+            backgrounds = _views(background, cut_coords)
+        for ax, image, view, overlay, base, c in zip(
+            self.axes, self.images, _VIEWS, overlays, backgrounds, cut_coords
+        ):
+            image.set_data(_composite(base, overlay, cmap, norm, threshold, alpha))
+            height, width = overlay.shape
+            image.set_extent((-0.5, width - 0.5, -0.5, height - 0.5))
+            ax.set_xlim(-0.5, width - 0.5)
+            ax.set_ylim(-0.5, height - 0.5)
+            ax.set_xlabel(f"{view} ({c})")
+
+        self.mappable.set_cmap(cmap)
+        self.mappable.set_norm(norm)
+        self.title.set_text(title)
+        if filepath is not None:
+            self.figure.savefig(filepath, dpi=self.figure.dpi)
+        return self.figure
 
 
 def plot_brain_map(
@@ -27,7 +348,7 @@ def plot_brain_map(
     data : np.ndarray
         The statistical map to plot.
     background_img : Optional[str], optional
-        Path to the background image, by default None.
+        Path to the background image, or a 3D array, by default None.
     cmap : str, optional
         The colormap to use, by default "hot".
     threshold : Optional[float], optional
@@ -37,29 +358,19 @@ def plot_brain_map(
     figsize : Tuple[int, int], optional
         The size of the figure, by default (12, 4).
     **kwargs : Any
-        Additional parameters for the plotting function.
+        Additional parameters for :meth:`BrainMapRenderer.render`, e.g.
+        ``cut_coords``, ``cut_method``, ``vmin``, ``vmax`` or ``alpha``.
 
     Returns
     -------
     plt.Figure
         The matplotlib figure object.
     """
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nilearn.plotting to visualize brain maps.
-    print(f"Plotting brain map with colormap: {cmap}, threshold: {threshold}")
-    
-    fig, axes = plt.subplots(1, 3, figsize=figsize)
-    
-    # Placeholder: plot sagittal, coronal, and axial views
-    for i, view in enumerate(["Sagittal", "Coronal", "Axial"]):
-        axes[i].text(0.5, 0.5, f"{view} View", ha="center", va="center")
-        axes[i].set_xticks([])
-        axes[i].set_yticks([])
-    
-    fig.suptitle(title)
-    fig.tight_layout()
-    
-    return fig
+    renderer = BrainMapRenderer(figure=plt.figure(figsize=figsize))
+    return renderer.render(
+        data, background_img=background_img, cmap=cmap, threshold=threshold,
+        title=title, **kwargs
+    )
 
 
 def plot_roi(
@@ -79,7 +390,7 @@ def plot_roi(
     roi_mask : np.ndarray
         The ROI mask to plot.
     background_img : Optional[str], optional
-        Path to the background image, by default None.
+        Path to the background image, or a 3D array, by default None.
     roi_color : str, optional
         The color of the ROI, by default "red".
     roi_alpha : float, optional
@@ -89,26 +400,107 @@ def plot_roi(
     figsize : Tuple[int, int], optional
         The size of the figure, by default (12, 4).
     **kwargs : Any
-        Additional parameters for the plotting function.
+        Additional parameters for :meth:`BrainMapRenderer.render`, e.g.
+        ``cut_coords``. The views cut through the ROI's centre of mass by
+        default.
 
     Returns
     -------
     plt.Figure
         The matplotlib figure object.
     """
-    # This is a placeholder. In a real implementation, we would use
-    # libraries like nilearn.plotting to visualize ROIs.
-    print(f"Plotting ROI with color: {roi_color}, alpha: {roi_alpha}")
-    
-    fig, axes = plt.subplots(1, 3, figsize=figsize)
-    
-    # Placeholder: plot sagittal, coronal, and axial views
-    for i, view in enumerate(["Sagittal", "Coronal", "Axial"]):
-        axes[i].text(0.5, 0.5, f"{view} View", ha="center", va="center")
-        axes[i].set_xticks([])
-        axes[i].set_yticks([])
-    
-    fig.suptitle(title)
-    fig.tight_layout()
-    
-    return fig 
\ No newline at end of file
+    kwargs.setdefault("cut_method", "center")
+    renderer = BrainMapRenderer(figure=plt.figure(figsize=figsize), colorbar=False)
+    return renderer.render(
+        np.asarray(roi_mask, dtype=bool).astype(np.float64),
+        background_img=background_img,
+        cmap=mcolors.ListedColormap([roi_color]),
+        threshold=0.5,
+        alpha=roi_alpha,
+        title=title,
+        vmin=0.0,
+        vmax=1.0,
+        **kwargs
+    )
+
+
+# Per-process renderer for pool workers, set by _init_worker.
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(options: Dict[str, Any], render_kwargs: Dict[str, Any]) -> None:
+    """Build one renderer per worker process."""
+    _WORKER["renderer"] = BrainMapRenderer(**options)
+    _WORKER["kwargs"] = render_kwargs
+
+
+def _render_one(data: ImageLike, filepath: str, title: str) -> str:
+    """Render one map in a pool worker."""
+    _WORKER["renderer"].render(data, filepath=filepath, title=title, **_WORKER["kwargs"])
+    return filepath
+
+
+def export_brain_maps(
+    maps: Sequence[ImageLike],
+    filepaths: Sequence[str],
+    titles: Optional[Sequence[str]] = None,
+    figsize: Tuple[int, int] = (12, 4),
+    dpi: int = 100,
+    n_jobs: int = 1,
+    **kwargs: Any
+) -> List[str]:
+    """
+    Render many statistical maps to image files.
+
+    One :class:`BrainMapRenderer` is built per process and reused for every
+    map, so only the image data changes between files, and the background
+    template is loaded once per process.
+
+    Parameters
+    ----------
+    maps : Sequence[Union[str, np.ndarray]]
+        3D maps, or paths to NIfTI images (loaded in the worker that renders
+        them, which avoids sending arrays between processes).
+    filepaths : Sequence[str]
+        Output file for each map; the format follows the extension.
+    titles : Optional[Sequence[str]], optional
+        Title of each figure, by default none.
+    figsize : Tuple[int, int], optional
+        Size of each figure in inches, by default (12, 4).
+    dpi : int, optional
+        Resolution of the images, by default 100.
+    n_jobs : int, optional
+        Number of worker processes, by default 1. Use -1 for one per CPU.
+    **kwargs : Any
+        Parameters for :meth:`BrainMapRenderer.render` shared by every map,
+        e.g. ``background_img``, ``threshold`` or ``cmap``.
+
+    Returns
+    -------
+    List[str]
+        The written file paths, in the order of ``maps``.
+    """
+    if len(filepaths) != len(maps):
+        raise ValueError(f"Expected {len(maps)} file paths, got {len(filepaths)}")
+    titles = [""] * len(maps) if titles is None else list(titles)
+    if len(titles) != len(maps):
+        raise ValueError(f"Expected {len(maps)} titles, got {len(titles)}")
+    options = {"figsize": figsize, "dpi": dpi}
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, len(maps)))
+    if n_jobs == 1:
+        renderer = BrainMapRenderer(**options)
+        for data, filepath, title in zip(maps, filepaths, titles):
+            renderer.render(data, filepath=filepath, title=title, **kwargs)
+        return list(filepaths)
+
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_worker, initargs=(options, kwargs)
+    ) as pool:
+        futures = [
+            pool.submit(_render_one, data, filepath, title)
+            for data, filepath, title in zip(maps, filepaths, titles)
+        ]
+        return [future.result() for future in futures]
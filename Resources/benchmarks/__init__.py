@@ -0,0 +1,46 @@
+"""
+Benchmark suite for the cog_neuro package and the akinetopsia simulator.
+
+Run from the ``Resources`` directory with the package on the path::
+
+    PYTHONPATH=Packages python -m benchmarks run --scale small -o results.json
+    PYTHONPATH=Packages python -m benchmarks compare baseline.json results.json
+"""
+
+from .generators import (
+    SCALES,
+    Scale,
+    get_scale,
+    make_atlas,
+    make_roi_timeseries,
+    make_run,
+    make_video_frames,
+)
+from .runner import (
+    Comparison,
+    compare,
+    load_results,
+    missing_benchmarks,
+    run_benchmarks,
+    save_results,
+)
+from .suite import BENCHMARKS, Benchmark, register
+
+__all__ = [
+    "BENCHMARKS",
+    "Benchmark",
+    "Comparison",
+    "SCALES",
+    "Scale",
+    "compare",
+    "get_scale",
+    "load_results",
+    "make_atlas",
+    "make_roi_timeseries",
+    "make_run",
+    "make_video_frames",
+    "missing_benchmarks",
+    "register",
+    "run_benchmarks",
+    "save_results",
+]
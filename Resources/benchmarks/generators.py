@@ -0,0 +1,227 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+Every generator takes an explicit seed and returns the same data for the
+same arguments on every machine, so timings from different runs and
+different hardware are comparable. Data sizes come from named scales:
+``small`` for a quick check, ``production`` for a typical study, and
+``large`` for sizing hardware.
+"""
+
+import numpy as np
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class Scale(NamedTuple):
+    """Data sizes of a benchmark scale."""
+
+    volume_shape: Tuple[int, int, int]
+    n_timepoints: int
+    n_rois: int
+    n_subjects: int
+    frame_shape: Tuple[int, int]
+    n_frames: int
+
+
+SCALES: Dict[str, Scale] = {
+    "small": Scale((32, 32, 16), 60, 48, 4, (240, 320), 20),
+    "production": Scale((64, 64, 36), 200, 200, 16, (720, 1280), 60),
+    "large": Scale((96, 96, 60), 300, 1000, 64, (1080, 1920), 120),
+}
+
+
+def get_scale(scale: str) -> Scale:
+    """Look up a named scale."""
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale {scale!r}; expected one of {sorted(SCALES)}")
+    return SCALES[scale]
+
+
+def _brain_mask(shape: Tuple[int, int, int]) -> np.ndarray:
+    """An ellipsoid filling most of the field of view."""
+    grid = np.ogrid[tuple(slice(0, n) for n in shape)]
+    radius = sum(((g - (n - 1) / 2) / (0.45 * n)) ** 2 for g, n in zip(grid, shape))
+    return radius <= 1
+
+
+def _ar1(rng: np.random.Generator, n_series: int, n_timepoints: int, phi: float = 0.6) -> np.ndarray:
+    """Unit-variance AR(1) time series with shape (series, time)."""
+    noise = rng.standard_normal((n_series, n_timepoints))
+    series = np.empty_like(noise)
+    series[:, 0] = noise[:, 0]
+    scale = np.sqrt(1 - phi ** 2)
+    for t in range(1, n_timepoints):
+        series[:, t] = phi * series[:, t - 1] + scale * noise[:, t]
+    return series
+
+
+def make_run(
+    shape: Tuple[int, int, int],
+    n_timepoints: int,
+    seed: int = 0,
+    n_networks: int = 4,
+    dtype: np.dtype = np.float32,
+) -> np.ndarray:
+    """
+    Synthetic 4D fMRI run.
+
+    A bright ellipsoidal brain carries a few smooth spatial networks, each
+    with its own autocorrelated time course, plus white noise.
+
+    Parameters
+    ----------
+    shape : Tuple[int, int, int]
+        Volume shape.
+    n_timepoints : int
+        Number of volumes.
+    seed : int, optional
+        Random seed, by default 0.
+    n_networks : int, optional
+        Number of spatial networks, by default 4.
+    dtype : np.dtype, optional
+        Output data type, by default float32.
+
+    Returns
+    -------
+    np.ndarray
+        Run with shape ``shape + (n_timepoints,)``.
+    """
+    rng = np.random.default_rng(seed)
+    mask = _brain_mask(shape)
+    data = rng.standard_normal(shape + (n_timepoints,), dtype=np.float32)
+    data *= 10.0
+    data += np.where(mask, 1000.0, 50.0).astype(np.float32)[..., None]
+
+    grid = np.ogrid[tuple(slice(0, n) for n in shape)]
+    courses = _ar1(rng, n_networks, n_timepoints).astype(np.float32)
+    for k in range(n_networks):
+        center = rng.uniform(0.3, 0.7, 3) * shape
+        width = 0.15 * min(shape)
+        blob = np.exp(-sum((g - c) ** 2 for g, c in zip(grid, center)) / (2 * width ** 2))
+        data += (30.0 * blob * mask).astype(np.float32)[..., None] * courses[k]
+    return data.astype(dtype, copy=False)
+
+
+def make_atlas(shape: Tuple[int, int, int], n_rois: int, seed: int = 0) -> np.ndarray:
+    """
+    Synthetic label atlas: the brain ellipsoid split into ``n_rois``
+    Voronoi cells around random centres.
+
+    Parameters
+    ----------
+    shape : Tuple[int, int, int]
+        Volume shape.
+    n_rois : int
+        Number of regions, labelled 1..n_rois.
+    seed : int, optional
+        Random seed, by default 0.
+
+    Returns
+    -------
+    np.ndarray
+        Integer labels with shape ``shape``; 0 outside the brain.
+    """
+    rng = np.random.default_rng(seed)
+    mask = _brain_mask(shape)
+    inside = np.argwhere(mask)
+    centers = inside[rng.choice(len(inside), size=n_rois, replace=False)].astype(np.float64)
+    atlas = np.zeros(shape, dtype=np.int32)
+    # One slab of voxels at a time keeps the distance matrix small.
+    for x in range(shape[0]):
+        coords = np.argwhere(mask[x])
+        if len(coords) == 0:
+            continue
+        points = np.column_stack([np.full(len(coords), x), coords]).astype(np.float64)
+        distances = (
+            (points ** 2).sum(axis=1)[:, None]
+            - 2 * points @ centers.T
+            + (centers ** 2).sum(axis=1)[None, :]
+        )
+        atlas[x][mask[x]] = distances.argmin(axis=1) + 1
+    return atlas
+
+
+def make_roi_timeseries(
+    n_rois: int,
+    n_timepoints: int,
+    n_subjects: Optional[int] = None,
+    seed: int = 0,
+    n_networks: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Synthetic ROI time series with network structure.
+
+    Each ROI belongs to one of ``n_networks`` networks and loads on that
+    network's shared time course, so connectivity matrices have a
+    block structure like real data.
+
+    Parameters
+    ----------
+    n_rois : int
+        Number of ROIs.
+    n_timepoints : int
+        Number of time points.
+    n_subjects : int, optional
+        Number of subjects; None for a single (roi, time) array.
+    seed : int, optional
+        Random seed, by default 0.
+    n_networks : int, optional
+        Number of networks, by default one per 20 ROIs (at least 2).
+
+    Returns
+    -------
+    np.ndarray
+        Time series with shape (roi, time), or (subject, roi, time).
+    """
+    rng = np.random.default_rng(seed)
+    n_networks = n_networks or max(2, n_rois // 20)
+    membership = np.arange(n_rois) % n_networks
+    loading = rng.uniform(0.4, 0.9, n_rois)
+    n = 1 if n_subjects is None else n_subjects
+    shared = _ar1(rng, n * n_networks, n_timepoints).reshape(n, n_networks, n_timepoints)
+    noise = _ar1(rng, n * n_rois, n_timepoints).reshape(n, n_rois, n_timepoints)
+    series = loading[:, None] * shared[:, membership] + np.sqrt(1 - loading ** 2)[:, None] * noise
+    return series[0] if n_subjects is None else series
+
+
+def make_video_frames(
+    n_frames: int, shape: Tuple[int, int], seed: int = 0, speed: float = 2.0
+) -> np.ndarray:
+    """
+    Synthetic grayscale video of a smooth texture drifting across the frame.
+
+    Parameters
+    ----------
+    n_frames : int
+        Number of frames.
+    shape : Tuple[int, int]
+        Frame (height, width).
+    seed : int, optional
+        Random seed, by default 0.
+    speed : float, optional
+        Drift in pixels per frame, by default 2.0.
+
+    Returns
+    -------
+    np.ndarray
+        uint8 frames with shape (frame, height, width).
+    """
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    margin = int(np.ceil(speed * n_frames)) + 1
+    # Smooth the texture with a separable box filter (three passes
+    # approximate a Gaussian).
+    texture = rng.random((height + margin, width + margin))
+    for axis in (0, 1):
+        for _ in range(3):
+            texture = (np.roll(texture, -2, axis) + np.roll(texture, -1, axis) + texture
+                       + np.roll(texture, 1, axis) + np.roll(texture, 2, axis)) / 5
+    texture -= texture.min()
+    texture *= 255 / texture.max()
+    direction = rng.uniform(0, 2 * np.pi)
+    frames = np.empty((n_frames, height, width), dtype=np.uint8)
+    for i in range(n_frames):
+        dy = int(round(i * speed * abs(np.sin(direction))))
+        dx = int(round(i * speed * abs(np.cos(direction))))
+        frames[i] = texture[dy:dy + height, dx:dx + width]
+    return frames
@@ -0,0 +1,358 @@
+"""
+Benchmark runner, JSON results and regression comparison.
+
+Each benchmark is timed ``repeat`` times with garbage collection disabled,
+as :mod:`timeit` does, after one untimed warm-up call; fast benchmarks are
+called in a loop so that every measurement lasts long enough to be stable.
+Peak memory is measured in a separate call under :mod:`tracemalloc`, which
+traces Python and NumPy allocations (but not memory allocated inside
+native libraries such as OpenCV), so tracing does not slow down the timed
+calls. Comparisons use the minimum time, the least noisy estimate of the
+cost of a call.
+"""
+
+import datetime
+import fnmatch
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .generators import get_scale
+from .suite import BENCHMARKS, missing_requirements
+
+
+class Comparison(NamedTuple):
+    """One metric of one benchmark compared against a baseline."""
+
+    name: str
+    scale: str
+    metric: str
+    baseline: float
+    current: float
+    ratio: float
+    regression: bool
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def environment() -> Dict[str, Any]:
+    """Machine and software description stored with the results."""
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def select(patterns: Optional[Sequence[str]] = None) -> List[str]:
+    """Names of the registered benchmarks matching any of the glob patterns."""
+    names = sorted(BENCHMARKS)
+    if not patterns:
+        return names
+    return [name for name in names if any(fnmatch.fnmatchcase(name, p) for p in patterns)]
+
+
+def time_call(function: Callable[[], Any], repeat: int, min_time: float = 0.05) -> List[float]:
+    """
+    Seconds per call, averaged over enough calls for each of the ``repeat``
+    measurements to last at least ``min_time``, after one warm-up call.
+    """
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    number = max(1, int(np.ceil(min_time / elapsed))) if elapsed > 0 else 1
+    times = []
+    enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                function()
+            times.append((time.perf_counter() - start) / number)
+    finally:
+        if enabled:
+            gc.enable()
+    return times
+
+
+def peak_memory(function: Callable[[], Any]) -> int:
+    """Peak bytes allocated during one call, as traced by tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(
+    patterns: Optional[Sequence[str]] = None,
+    scale: str = "small",
+    repeat: int = 3,
+    memory: bool = True,
+    log: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Run the selected benchmarks at one scale.
+
+    Parameters
+    ----------
+    patterns : Sequence[str], optional
+        Glob patterns of benchmark names; all benchmarks by default.
+    scale : str, optional
+        Name of the data scale, by default "small".
+    repeat : int, optional
+        Timed calls per benchmark, by default 3.
+    memory : bool, optional
+        Also measure peak memory, by default True.
+    log : Callable[[str], None], optional
+        Called with a progress line after each benchmark.
+
+    Returns
+    -------
+    Dict[str, Any]
+        JSON-serializable results: ``environment``, ``scale`` and
+        ``results``, a list of one record per benchmark with ``name``,
+        ``times``, ``min``, ``median`` and ``peak_bytes``, or ``skipped``
+        with a reason.
+    """
+    sizes = get_scale(scale)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in select(patterns):
+            benchmark = BENCHMARKS[name]
+            missing = missing_requirements(benchmark)
+            if missing:
+                record = {"name": name, "skipped": f"requires {', '.join(missing)}"}
+            else:
+                function = benchmark.setup(sizes, workdir)
+                times = time_call(function, repeat)
+                record = {
+                    "name": name,
+                    "times": times,
+                    "min": min(times),
+                    "median": float(np.median(times)),
+                    "peak_bytes": peak_memory(function) if memory else None,
+                }
+                del function
+            results.append(record)
+            if log is not None:
+                log(format_record(record))
+    return {
+        "environment": environment(),
+        "scale": {"name": scale, **sizes._asdict()},
+        "results": results,
+    }
+
+
+def format_record(record: Dict[str, Any]) -> str:
+    """One line describing a benchmark result."""
+    if "skipped" in record:
+        return f"{record['name']:<50} skipped ({record['skipped']})"
+    line = f"{record['name']:<50} {record['min'] * 1000:10.1f} ms"
+    if record.get("peak_bytes") is not None:
+        line += f" {record['peak_bytes'] / 2 ** 20:10.1f} MiB"
+    return line
+
+
+def save_results(results: Dict[str, Any], path: str) -> None:
+    """Write results to a JSON file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """Read results written by :func:`save_results`."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    time_threshold: float = 0.2,
+    memory_threshold: float = 0.1,
+) -> List[Comparison]:
+    """
+    Compare results against a baseline.
+
+    A benchmark regresses when its minimum time or peak memory exceeds the
+    baseline by more than the relative threshold. Benchmarks missing or
+    skipped in either result are not compared; :func:`missing_benchmarks`
+    lists those dropped from the current run.
+
+    Parameters
+    ----------
+    baseline : Dict[str, Any]
+        Baseline results.
+    current : Dict[str, Any]
+        New results.
+    time_threshold : float, optional
+        Allowed relative slowdown, by default 0.2 (20%), which is above the
+        run-to-run noise of most benchmarks on a shared machine.
+    memory_threshold : float, optional
+        Allowed relative increase in peak memory, by default 0.1.
+
+    Returns
+    -------
+    List[Comparison]
+        One entry per benchmark and metric, in benchmark order.
+
+    Raises
+    ------
+    ValueError
+        If the results were run at different scales.
+    """
+    scale = current["scale"]["name"]
+    if baseline["scale"]["name"] != scale:
+        raise ValueError(
+            f"Cannot compare scale {scale!r} with baseline scale {baseline['scale']['name']!r}"
+        )
+    reference = {r["name"]: r for r in baseline["results"] if "skipped" not in r}
+    comparisons = []
+    for record in current["results"]:
+        old = reference.get(record["name"])
+        if old is None or "skipped" in record:
+            continue
+        for metric, key, threshold in (
+            ("time", "min", time_threshold),
+            ("memory", "peak_bytes", memory_threshold),
+        ):
+            if old.get(key) is None or record.get(key) is None:
+                continue
+            if old[key] > 0:
+                ratio = record[key] / old[key]
+            else:
+                ratio = float("inf") if record[key] > 0 else 1.0
+            comparisons.append(Comparison(
+                record["name"], scale, metric, old[key], record[key], ratio,
+                ratio > 1 + threshold,
+            ))
+    return comparisons
+
+
+def missing_benchmarks(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    patterns: Optional[Sequence[str]] = None,
+) -> List[str]:
+    """
+    Names of benchmarks measured in the baseline but not in the current run
+    (absent or skipped), restricted to the glob patterns that were run.
+    """
+    measured = {r["name"] for r in current["results"] if "skipped" not in r}
+    return [
+        r["name"] for r in baseline["results"]
+        if "skipped" not in r and r["name"] not in measured
+        and (not patterns or any(fnmatch.fnmatchcase(r["name"], p) for p in patterns))
+    ]
+
+
+def format_comparison(comparisons: Sequence[Comparison], missing: Sequence[str] = ()) -> str:
+    """A table of comparisons, with regressions marked and missing benchmarks listed."""
+    lines = [f"{'benchmark':<50} {'metric':<7} {'baseline':>12} {'current':>12} {'ratio':>7}"]
+    for c in comparisons:
+        if c.metric == "time":
+            old, new = f"{c.baseline * 1000:.1f} ms", f"{c.current * 1000:.1f} ms"
+        else:
+            old, new = f"{c.baseline / 2 ** 20:.1f} MiB", f"{c.current / 2 ** 20:.1f} MiB"
+        flag = "  REGRESSION" if c.regression else ""
+        lines.append(f"{c.name:<50} {c.metric:<7} {old:>12} {new:>12} {c.ratio:7.2f}{flag}")
+    for name in missing:
+        lines.append(f"{name:<50} missing from the current run")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Command line interface; see ``python -m benchmarks --help``."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks", description="Run and compare benchmarks."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list benchmarks")
+
+    run = commands.add_parser("run", help="run benchmarks and write JSON results")
+    run.add_argument("patterns", nargs="*", help="glob patterns of benchmark names")
+    run.add_argument("--scale", default="small", help="small, production or large")
+    run.add_argument("--repeat", type=int, default=3, help="timed calls per benchmark")
+    run.add_argument("--no-memory", action="store_true", help="skip peak memory")
+    run.add_argument("-o", "--output", help="JSON file to write")
+    run.add_argument("--baseline", help="compare against this JSON file")
+    run.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    run.add_argument("--memory-threshold", type=float, default=0.1,
+                     help="allowed relative increase in peak memory")
+    run.add_argument("--allow-missing", action="store_true",
+                     help="do not fail on baseline benchmarks missing from the run")
+
+    cmp = commands.add_parser("compare", help="flag regressions against a baseline")
+    cmp.add_argument("baseline", help="baseline JSON results")
+    cmp.add_argument("current", help="new JSON results")
+    cmp.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    cmp.add_argument("--memory-threshold", type=float, default=0.1,
+                     help="allowed relative increase in peak memory")
+    cmp.add_argument("--allow-missing", action="store_true",
+                     help="do not fail on baseline benchmarks missing from the results")
+
+    args = parser.parse_args(argv)
+    if args.command == "list":
+        for name in select():
+            missing = missing_requirements(BENCHMARKS[name])
+            print(name + (f"  (requires {', '.join(missing)})" if missing else ""))
+        return 0
+
+    if args.command == "run":
+        current = run_benchmarks(
+            args.patterns, scale=args.scale, repeat=args.repeat,
+            memory=not args.no_memory, log=print,
+        )
+        if args.output:
+            save_results(current, args.output)
+        if not args.baseline:
+            return 0
+        baseline = load_results(args.baseline)
+        patterns = args.patterns
+    else:
+        baseline, current = load_results(args.baseline), load_results(args.current)
+        patterns = None
+    comparisons = compare(baseline, current, args.threshold, args.memory_threshold)
+    missing = missing_benchmarks(baseline, current, patterns)
+    print(format_comparison(comparisons, missing))
+    regressions = [c for c in comparisons if c.regression]
+    status = 0
+    if regressions:
+        print(f"{len(regressions)} regression(s)", file=sys.stderr)
+        status = 1
+    if missing and not args.allow_missing:
+        print(f"{len(missing)} benchmark(s) missing", file=sys.stderr)
+        status = 1
+    return status
@@ -0,0 +1,160 @@
+"""
+Benchmarks of the public entry points.
+
+A benchmark is a setup function registered with :func:`register`. It
+receives the :class:`~benchmarks.generators.Scale` and a scratch directory,
+builds its input data outside the timed region, and returns the zero-argument
+callable that is timed. Benchmarks that need optional packages list them in
+``requires`` and are skipped when those are missing.
+"""
+
+import importlib.util
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Tuple
+
+from .generators import (
+    Scale,
+    make_atlas,
+    make_roi_timeseries,
+    make_run,
+    make_video_frames,
+)
+
+
+# The akinetopsia simulator is a standalone script, loaded from its path.
+MARKOV_PATH = Path(__file__).resolve().parents[2] / "Projects" / "Akinetopsia" / "markov.py"
+
+
+class Benchmark(NamedTuple):
+    """A registered benchmark."""
+
+    name: str
+    setup: Callable[[Scale, str], Callable[[], Any]]
+    requires: Tuple[str, ...]
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def register(name: str, requires: Tuple[str, ...] = ()):
+    """Register a setup function as the benchmark ``name``."""
+
+    def decorator(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, tuple(requires))
+        return setup
+
+    return decorator
+
+
+def missing_requirements(benchmark: Benchmark) -> Tuple[str, ...]:
+    """Optional packages needed by ``benchmark`` that are not installed."""
+    return tuple(
+        module for module in benchmark.requires if importlib.util.find_spec(module) is None
+    )
+
+
+_markov = None
+
+
+def load_markov():
+    """Import the akinetopsia simulator script as a module (needs OpenCV)."""
+    global _markov
+    if _markov is None:
+        spec = importlib.util.spec_from_file_location("akinetopsia_markov", MARKOV_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _markov = module
+    return _markov
+
+
+@register("imaging.standard_pipeline")
+def _standard_pipeline(scale: Scale, workdir: str):
+    from cog_neuro.imaging import standard_pipeline
+
+    data = make_run(scale.volume_shape, scale.n_timepoints)
+    return lambda: standard_pipeline(data)
+
+
+@register("imaging.load_dataset")
+def _load_dataset(scale: Scale, workdir: str):
+    from cog_neuro.imaging import load_dataset, save_nifti
+
+    path = os.path.join(workdir, "run.nii")
+    save_nifti(path, make_run(scale.volume_shape, scale.n_timepoints))
+    return lambda: load_dataset(path, mmap=False)
+
+
+@register("analysis.compute_correlation_matrix")
+def _correlation_4d(scale: Scale, workdir: str):
+    from cog_neuro.analysis import compute_correlation_matrix
+
+    data = make_run(scale.volume_shape, scale.n_timepoints)
+    atlas = make_atlas(scale.volume_shape, min(scale.n_rois, 200))
+    return lambda: compute_correlation_matrix(data, atlas=atlas)
+
+
+@register("analysis.compute_correlation_matrix[subjects]")
+def _correlation_subjects(scale: Scale, workdir: str):
+    from cog_neuro.analysis import compute_correlation_matrix
+
+    series = make_roi_timeseries(scale.n_rois, scale.n_timepoints, scale.n_subjects)
+    return lambda: compute_correlation_matrix(series)
+
+
+@register("analysis.plot_matrix")
+def _plot_matrix(scale: Scale, workdir: str):
+    from cog_neuro.analysis import compute_correlation_matrix, plot_matrix
+
+    matrix = compute_correlation_matrix(make_roi_timeseries(scale.n_rois, scale.n_timepoints))
+    path = os.path.join(workdir, "matrix.png")
+    return lambda: plot_matrix(matrix, filepath=path)
+
+
+@register("analysis.graph_metrics")
+def _graph_metrics(scale: Scale, workdir: str):
+    import numpy as np
+    from cog_neuro.analysis import compute_correlation_matrix, graph_metrics
+
+    n_rois = min(scale.n_rois, 200)
+    matrices = compute_correlation_matrix(
+        make_roi_timeseries(n_rois, scale.n_timepoints, scale.n_subjects)
+    )
+    densities = np.linspace(0.05, 0.3, 4)
+    return lambda: graph_metrics(matrices, density=densities)
+
+
+@register("markov.sample_trajectory", requires=("cv2",))
+def _sample_trajectory(scale: Scale, workdir: str):
+    markov = load_markov()
+    n_steps = 1000 * scale.n_frames
+    return lambda: markov.sample_trajectory(markov.DEFAULT_TRANSITION_MATRIX, n_steps, rng=0)
+
+
+def _flow_loop(scale: Scale, flow_scale: float):
+    """The per-frame loop of markov.main without decoding and display."""
+    markov = load_markov()
+    frames = make_video_frames(scale.n_frames, scale.frame_shape)
+
+    def run():
+        engine = markov.FlowEngine(frames.shape[1:], scale=flow_scale)
+        states = markov.frame_states(markov.DEFAULT_TRANSITION_MATRIX, rng=0)
+        image = None
+        for i in range(1, len(frames)):
+            state = next(states)
+            if (i - 1) % markov.DEFAULT_FLOW_INTERVAL == 0:
+                flow = engine.compute(frames[i - 1], frames[i]) if state == 0 else engine.zero_flow
+                image = engine.to_bgr(flow)
+        return image
+
+    return run
+
+
+@register("markov.flow_loop", requires=("cv2",))
+def _flow_loop_full(scale: Scale, workdir: str):
+    return _flow_loop(scale, 1.0)
+
+
+@register("markov.flow_loop[scale=0.25]", requires=("cv2",))
+def _flow_loop_reduced(scale: Scale, workdir: str):
+    return _flow_loop(scale, 0.25)
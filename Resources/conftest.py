@@ -0,0 +1,15 @@
+"""
+pytest configuration for the Resources tree.
+
+Puts this directory and ``Packages`` on ``sys.path`` so that the tests can
+import ``cog_neuro`` and the ``benchmarks`` suite without setting
+``PYTHONPATH``.
+"""
+
+import os
+import sys
+
+_RESOURCES = os.path.dirname(os.path.abspath(__file__))
+for _path in (_RESOURCES, os.path.join(_RESOURCES, "Packages")):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
@@ -0,0 +1,156 @@
+"""
+Unit tests for the akinetopsia simulator script (Projects/Akinetopsia/markov.py).
+"""
+
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+MARKOV_PATH = Path(__file__).resolve().parents[3] / "Projects" / "Akinetopsia" / "markov.py"
+
+
+@pytest.fixture(scope="module")
+def markov():
+    """The script imported as a module, as benchmarks.suite.load_markov does."""
+    spec = importlib.util.spec_from_file_location("akinetopsia_markov", MARKOV_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_state_frequencies_match_stationary_distribution(markov):
+    """Test that long trajectories visit states at the stationary rates."""
+    matrix = [[0.5, 0.3, 0.2],
+              [0.1, 0.8, 0.1],
+              [0.4, 0.0, 0.6]]
+    trajectory = markov.sample_trajectory(matrix, 200_000, rng=0)
+    frequencies = np.bincount(trajectory, minlength=3) / len(trajectory)
+    np.testing.assert_allclose(frequencies, markov.stationary_distribution(matrix), atol=0.01)
+
+    default = markov.sample_trajectory(markov.DEFAULT_TRANSITION_MATRIX, 200_000, rng=1)
+    # pi = (6/7, 1/7) for the default chain.
+    np.testing.assert_allclose(np.mean(default == 1), 1 / 7, atol=0.01)
+
+
+def test_zero_probability_transitions_never_occur(markov):
+    """Test that transitions with probability 0 are never sampled."""
+    matrix = [[0.0, 1.0, 0.0],
+              [0.0, 0.5, 0.5],
+              [0.7, 0.0, 0.3]]
+    trajectory = markov.sample_trajectory(matrix, 50_000, initial_state=0, rng=2)
+    path = np.concatenate([[0], trajectory])
+    counts = np.zeros((3, 3), dtype=int)
+    np.add.at(counts, (path[:-1], path[1:]), 1)
+    assert np.all(counts[np.asarray(matrix) == 0] == 0)
+    assert np.all(counts[np.asarray(matrix) > 0] > 0)
+
+
+def test_iter_trajectory_continues_blocks(markov):
+    """Test that each block starts from the last state of the previous one."""
+    # A deterministic cycle 0 -> 1 -> 2 -> 0 makes continuity observable.
+    cycle = [[0, 1, 0], [0, 0, 1], [1, 0, 0]]
+    blocks = markov.iter_trajectory(cycle, block_size=4, initial_state=2, rng=0)
+    states = np.concatenate([next(blocks) for _ in range(5)])
+    np.testing.assert_array_equal(states, np.arange(20) % 3)
+
+    matrix = markov.DEFAULT_TRANSITION_MATRIX
+    blocks = markov.iter_trajectory(matrix, block_size=7, rng=3)
+    streamed = np.concatenate([next(blocks) for _ in range(3)])
+    rng = np.random.default_rng(3)
+    expected, state = [], 0
+    for _ in range(3):
+        expected.append(markov.sample_trajectory(matrix, 7, state, rng))
+        state = int(expected[-1][-1])
+    np.testing.assert_array_equal(streamed, np.concatenate(expected))
+
+
+def test_iter_trajectory_rejects_empty_blocks(markov):
+    """Test that block sizes below 1 are rejected when the stream is created."""
+    for block_size in (0, -1):
+        with pytest.raises(ValueError):
+            markov.iter_trajectory(markov.DEFAULT_TRANSITION_MATRIX, block_size=block_size)
+
+
+@pytest.mark.parametrize("scale", [1.0, 0.5])
+def test_flow_engine_colours_match_flow_to_rgb(markov, scale):
+    """Test that FlowEngine.to_bgr matches flow_to_rgb to within one level."""
+    rng = np.random.default_rng(0)
+    flow = rng.normal(0, 3, (40, 56, 2)).astype(np.float32)
+    engine = markov.FlowEngine(flow.shape[:2], scale=scale)
+    expected = markov.flow_to_rgb(flow)
+    image = engine.to_bgr(flow)
+    assert image.shape == expected.shape and image.dtype == np.uint8
+    assert np.abs(image.astype(int) - expected).max() <= 1
+
+    # Keyframes of real motion, and the zero flow of the disrupted state.
+    frames = [np.roll(np.tile(np.arange(56, dtype=np.uint8) * 4, (40, 1)), 2 * i, axis=1)
+              for i in range(3)]
+    for prev, curr in zip(frames, frames[1:]):
+        flow = engine.compute(prev, curr).copy()
+        assert np.abs(engine.to_bgr(flow).astype(int) - markov.flow_to_rgb(flow)).max() <= 1
+    out = np.empty_like(expected)
+    assert engine.to_bgr(engine.zero_flow, out=out) is out
+    np.testing.assert_array_equal(out, markov.flow_to_rgb(engine.zero_flow))
+
+
+def _write_clip(path, n_frames, shape=(48, 64)):
+    """A small synthetic clip of a bright square moving to the right."""
+    height, width = shape
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10.0, (width, height))
+    assert writer.isOpened()
+    for i in range(n_frames):
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        frame[16:32, 4 + 2 * i:20 + 2 * i] = 255
+        writer.write(frame)
+    writer.release()
+
+
+def _count_frames(path):
+    """Frames decoded from a video file."""
+    cap = cv2.VideoCapture(str(path))
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    return count
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+def test_process_video_writes_every_frame(markov, tmp_path, threads):
+    """Test that one output frame is written per frame pair of the input."""
+    source, output = tmp_path / "clip.avi", tmp_path / "out.avi"
+    _write_clip(source, 12)
+    result = markov.process_video(str(source), str(output), threads=threads, interval=3,
+                                  seed=0, queue_size=4, fourcc="MJPG")
+    assert result["frames"] == 11
+    assert _count_frames(output) == 11
+
+
+def test_process_videos_shares_cores_between_processes(markov, monkeypatch):
+    """Test that worker processes split the cores when threads is not given."""
+    calls = []
+
+    class Executor:
+        def __init__(self, max_workers):
+            calls.append(("workers", max_workers))
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def map(self, function, jobs):
+            return [job[2]["threads"] for job in jobs]
+
+    monkeypatch.setattr(markov, "ProcessPoolExecutor", Executor)
+    monkeypatch.setattr(markov.os, "cpu_count", lambda: 8)
+    inputs = ["a.mp4", "b.mp4", "c.mp4"]
+    assert markov.process_videos(inputs, inputs, processes=2) == [4, 4, 4]
+    assert markov.process_videos(inputs, inputs, processes=16) == [2, 2, 2]
+    assert markov.process_videos(inputs, inputs, processes=2, threads=3) == [3, 3, 3]
+    assert calls == [("workers", 2), ("workers", 3), ("workers", 2)]
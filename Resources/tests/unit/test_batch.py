@@ -0,0 +1,66 @@
+"""
+Unit tests for the multi-subject batch runner.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.imaging import batch, load_dataset, nifti, preprocess
+
+
+@pytest.fixture
+def subjects(tmp_path):
+    """Two small synthetic runs and one corrupt file."""
+    rng = np.random.default_rng(0)
+    paths = []
+    for name in ("sub-01.nii", "sub-02.nii.gz"):
+        path = str(tmp_path / name)
+        data = rng.standard_normal((8, 8, 6, 12)).astype(np.float32)
+        nifti.save_nifti(path, data, zooms=(3.0, 3.0, 3.0, 2.0))
+        paths.append(path)
+    bad = tmp_path / "sub-03.nii"
+    bad.write_bytes(b"not a nifti file")
+    paths.append(str(bad))
+    return paths
+
+
+def test_run_batch_writes_outputs_and_reports_failures(subjects, tmp_path):
+    """Test that good subjects are written and a bad one is reported."""
+    output_dir = str(tmp_path / "out")
+    options = dict(motion_correction=False, fwhm=4.0, high_pass=0.02)
+
+    results = batch.run_batch(
+        subjects, output_dir=output_dir, n_workers=2, block_size=4, **options
+    )
+
+    assert [r.ok for r in results] == [True, True, False]
+    assert results[2].output is None and results[2].error
+
+    expected = preprocess.standard_pipeline(
+        load_dataset(subjects[0]), dtype=np.float32,
+        voxel_size=(3.0, 3.0, 3.0), t_r=2.0, **options
+    )
+    written = load_dataset(results[0].output)
+    assert written.dtype == np.float32
+    np.testing.assert_allclose(written, expected, atol=1e-5)
+
+
+def test_run_batch_in_memory_with_budget(subjects):
+    """Test shared-memory outputs, per-subject kwargs and a tight memory budget."""
+    results = batch.run_batch(
+        subjects[:2],
+        subject_kwargs=[{"fwhm": 0, "high_pass": 0.1}, {"fwhm": 0, "high_pass": None}],
+        n_workers=2,
+        memory_budget=1,
+        motion_correction=False,
+    )
+
+    assert all(r.ok for r in results)
+    assert isinstance(results[0].output, np.ndarray)
+    np.testing.assert_allclose(results[1].output, load_dataset(subjects[1]))
+    assert not np.allclose(results[0].output, load_dataset(subjects[0]))
+
+
+def test_parse_bytes():
+    """Test memory size parsing for the command line."""
+    assert batch._parse_bytes("512M") == 512 * 2 ** 20
+    assert batch._parse_bytes("1.5g") == int(1.5 * 2 ** 30)
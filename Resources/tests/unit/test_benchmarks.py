@@ -0,0 +1,71 @@
+"""
+Unit tests for the benchmark suite.
+"""
+
+import numpy as np
+import pytest
+from benchmarks import generators, runner
+
+
+def test_generators_are_deterministic():
+    """Test that generators return identical data for the same seed."""
+    run = generators.make_run((12, 10, 8), 20, seed=3)
+    assert run.shape == (12, 10, 8, 20) and run.dtype == np.float32
+    np.testing.assert_array_equal(run, generators.make_run((12, 10, 8), 20, seed=3))
+    assert not np.array_equal(run, generators.make_run((12, 10, 8), 20, seed=4))
+
+    atlas = generators.make_atlas((12, 10, 8), 15)
+    assert set(np.unique(atlas)) == set(range(16))
+
+    series = generators.make_roi_timeseries(30, 100, n_subjects=2)
+    assert series.shape == (2, 30, 100)
+    corr = np.corrcoef(series[0])
+    # Two networks, with ROIs assigned alternately.
+    same = np.equal.outer(np.arange(30) % 2, np.arange(30) % 2)
+    off_diagonal = ~np.eye(30, dtype=bool)
+    assert corr[same & off_diagonal].mean() > corr[~same].mean() + 0.2
+
+    frames = generators.make_video_frames(4, (24, 32), speed=3.0)
+    assert frames.shape == (4, 24, 32) and frames.dtype == np.uint8
+    with pytest.raises(ValueError):
+        generators.get_scale("huge")
+
+
+def test_run_and_compare(tmp_path):
+    """Test a run round-trips through JSON and slowdowns are flagged."""
+    results = runner.run_benchmarks(["analysis.compute_correlation_matrix*"], repeat=2)
+    assert [r["name"] for r in results["results"]] == [
+        "analysis.compute_correlation_matrix",
+        "analysis.compute_correlation_matrix[subjects]",
+    ]
+    assert all(r["min"] > 0 and r["peak_bytes"] > 0 for r in results["results"])
+
+    path = str(tmp_path / "results.json")
+    runner.save_results(results, path)
+    baseline = runner.load_results(path)
+    assert not any(c.regression for c in runner.compare(baseline, baseline))
+
+    slower = runner.load_results(path)
+    slower["results"][0]["min"] *= 1.5
+    flagged = [c for c in runner.compare(baseline, slower) if c.regression]
+    assert [(c.name, c.metric) for c in flagged] == [("analysis.compute_correlation_matrix", "time")]
+    assert runner.main(["compare", path, path]) == 0
+
+
+def test_missing_benchmarks_are_reported(tmp_path, capsys):
+    """Test that benchmarks dropped from the current run are listed."""
+    baseline_path, current_path = str(tmp_path / "baseline.json"), str(tmp_path / "current.json")
+    baseline = runner.run_benchmarks(["analysis.compute_correlation_matrix*"], repeat=1)
+    runner.save_results(baseline, baseline_path)
+    current = runner.load_results(baseline_path)
+    current["results"] = current["results"][:1]
+    dropped = "analysis.compute_correlation_matrix[subjects]"
+    assert runner.missing_benchmarks(baseline, baseline) == []
+    assert runner.missing_benchmarks(baseline, current) == [dropped]
+    assert runner.missing_benchmarks(baseline, current, ["analysis.*"]) == [dropped]
+    assert runner.missing_benchmarks(baseline, current, ["*matrix"]) == []
+
+    runner.save_results(current, current_path)
+    assert runner.main(["compare", baseline_path, current_path]) == 1
+    assert f"{dropped:<50} missing" in capsys.readouterr().out
+    assert runner.main(["compare", baseline_path, current_path, "--allow-missing"]) == 0
@@ -0,0 +1,83 @@
+"""
+Unit tests for brain map rendering.
+"""
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from cog_neuro.imaging import save_nifti
+from cog_neuro.visualization import brain_maps
+
+
+@pytest.fixture
+def stat_map():
+    """A map with a positive blob and a weaker negative one."""
+    grid = np.meshgrid(*(np.arange(n) for n in (20, 24, 18)), indexing="ij")
+    blob = lambda c: np.exp(-sum((g - ci) ** 2 for g, ci in zip(grid, c)) / 8)
+    return 5 * blob((6, 8, 10)) - 3 * blob((14, 16, 5))
+
+
+def test_find_cut_coords(stat_map):
+    """Test peak and centre-of-mass cut selection."""
+    assert brain_maps.find_cut_coords(stat_map, "peak") == (6, 8, 10)
+    mask = np.zeros(stat_map.shape)
+    mask[2:5, 3:10, 4:7] = 1
+    assert brain_maps.find_cut_coords(mask, "center") == (3, 6, 5)
+    assert brain_maps.find_cut_coords(np.zeros((4, 6, 8))) == (2, 3, 4)
+
+
+def test_composite_thresholds_overlay():
+    """Test that sub-threshold voxels show the background only."""
+    background = np.full((2, 2), 0.5)
+    overlay = np.array([[0.0, 1.0], [2.0, -2.0]])
+    cmap = plt.get_cmap("coolwarm")
+    norm = plt.Normalize(-2, 2)
+    rgb = brain_maps._composite(background, overlay, cmap, norm, 1.5, 0.5)
+
+    assert rgb.shape == (2, 2, 3)
+    np.testing.assert_allclose(rgb[0], 0.5)
+    np.testing.assert_allclose(rgb[1, 0], 0.25 + 0.5 * np.array(cmap(1.0)[:3]))
+
+
+def test_background_is_cached(stat_map, tmp_path):
+    """Test that the resampled template is reused between calls."""
+    path = str(tmp_path / "template.nii")
+    template = np.random.default_rng(0).random((10, 12, 9)) + 1
+    save_nifti(path, template)
+
+    first = brain_maps.load_background(path, stat_map.shape)
+    assert first.shape == stat_map.shape
+    assert 0 <= first.min() and first.max() <= 1
+    assert brain_maps.load_background(path, stat_map.shape) is first
+
+
+def test_plot_brain_map_and_roi(stat_map):
+    """Test that the three views show the thresholded map."""
+    fig = brain_maps.plot_brain_map(stat_map, threshold=2.0, background_img=stat_map)
+    images = [ax.images[0].get_array() for ax in fig.axes[:3]]
+    assert [image.shape[:2] for image in images] == [(18, 24), (18, 20), (24, 20)]
+    assert fig.axes[0].get_xlabel() == "Sagittal (6)"
+    plt.close(fig)
+
+    roi = np.zeros(stat_map.shape, dtype=bool)
+    roi[5:8, 5:8, 5:8] = True
+    fig = brain_maps.plot_roi(roi)
+    axial = fig.axes[2].images[0].get_array()
+    np.testing.assert_allclose(axial[6, 6], [0.7, 0, 0])
+    np.testing.assert_allclose(axial[0, 0], 0)
+    plt.close(fig)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_export_brain_maps(stat_map, tmp_path, n_jobs):
+    """Test batch export from arrays and paths."""
+    path = str(tmp_path / "map.nii.gz")
+    save_nifti(path, stat_map)
+    outputs = [str(tmp_path / f"map{i}.png") for i in range(3)]
+
+    written = brain_maps.export_brain_maps(
+        [stat_map, path, -stat_map], outputs, titles=["a", "b", "c"],
+        threshold=1.0, n_jobs=n_jobs,
+    )
+    assert written == outputs
+    assert all((tmp_path / f"map{i}.png").stat().st_size > 0 for i in range(3))
@@ -0,0 +1,92 @@
+"""
+Unit tests for the preprocessing stage cache.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.imaging import cache, preprocess
+
+
+@pytest.fixture
+def data():
+    return np.random.default_rng(0).standard_normal((8, 8, 6, 20))
+
+
+def test_cached_pipeline_matches_uncached(data, tmp_path):
+    """Test that cached results match and hits are served as memmaps."""
+    options = dict(motion_correction=False, fwhm=4.0, high_pass=0.05)
+    expected = preprocess.standard_pipeline(data, **options)
+
+    first = preprocess.standard_pipeline(data, cache=str(tmp_path), **options)
+    second = preprocess.standard_pipeline(data, cache=str(tmp_path), **options)
+
+    np.testing.assert_allclose(first, expected)
+    np.testing.assert_allclose(second, expected)
+    assert isinstance(second, np.memmap)
+    assert not second.flags.writeable
+
+
+def test_changed_filter_reuses_upstream_stages(data, tmp_path, monkeypatch):
+    """Test that only stages downstream of a parameter change are rerun."""
+    stage_cache = cache.StageCache(str(tmp_path))
+    options = dict(motion_correction=False, fwhm=4.0)
+    preprocess.standard_pipeline(data, cache=stage_cache, high_pass=0.05, **options)
+
+    calls = []
+    smooth_volumes = preprocess.smooth_volumes
+
+    def counting(*args, **kwargs):
+        calls.append(1)
+        return smooth_volumes(*args, **kwargs)
+
+    monkeypatch.setattr(preprocess, "smooth_volumes", counting)
+    result = preprocess.standard_pipeline(
+        data, cache=stage_cache, high_pass=0.1, **options
+    )
+
+    assert calls == []
+    expected = preprocess.standard_pipeline(data, high_pass=0.1, **options)
+    np.testing.assert_allclose(result, expected)
+
+
+def test_chunked_pipeline_uses_cache(data, tmp_path):
+    """Test that the chunked pipeline caches and reuses its outputs."""
+    options = dict(motion_correction=False, fwhm=4.0, high_pass=0.05, block_size=6)
+    expected = preprocess.standard_pipeline(data, **options)
+
+    stage_cache = cache.StageCache(str(tmp_path))
+    preprocess.standard_pipeline(data, cache=stage_cache, **options)
+    assert len(list(stage_cache._entries())) == 2
+
+    out = np.zeros_like(data)
+    preprocess.standard_pipeline(data, cache=stage_cache, out=out, **options)
+    np.testing.assert_allclose(out, expected)
+
+
+def test_data_key_tracks_contents_and_files(tmp_path):
+    """Test that data keys change with array contents and file mtimes."""
+    array = np.arange(24.0).reshape(2, 3, 4)
+    assert cache.data_key(array) == cache.data_key(np.asfortranarray(array))
+    assert cache.data_key(array) != cache.data_key(array + 1)
+
+    path = tmp_path / "data.npy"
+    np.save(path, array)
+    key = cache.data_key(np.load(path, mmap_mode="r"))
+    assert key == cache.data_key(np.load(path, mmap_mode="r"))
+    np.save(path, array + 1)
+    assert key != cache.data_key(np.load(path, mmap_mode="r"))
+
+
+def test_eviction_respects_size_cap(tmp_path):
+    """Test that least-recently-used entries are evicted over the cap."""
+    entry = np.zeros(1000)
+    stage_cache = cache.StageCache(str(tmp_path), max_bytes=2 * entry.nbytes + 500)
+
+    stage_cache.put("a", entry)
+    stage_cache.put("b", entry)
+    assert stage_cache.get("a") is not None
+    stage_cache.put("c", entry)
+
+    assert "a" in stage_cache and "c" in stage_cache
+    assert "b" not in stage_cache
+    assert stage_cache.size <= stage_cache.max_bytes
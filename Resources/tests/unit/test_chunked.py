@@ -0,0 +1,95 @@
+"""
+Unit tests for the chunked, compressed array store.
+"""
+
+import json
+import os
+import numpy as np
+import pytest
+from cog_neuro.analysis import extract_roi_timeseries
+from cog_neuro.imaging import load_dataset
+from cog_neuro.utils import ChunkedArray, open_chunked, save_chunked
+
+
+@pytest.fixture
+def run():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((11, 9, 7, 30)).astype(np.float32)
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma", "none"])
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_round_trip(run, tmp_path, compression, n_jobs):
+    """Test that every chunk, including partial edge chunks, round-trips."""
+    path = tmp_path / "run.store"
+    store = save_chunked(
+        path, run, chunks=(4, 4, 4, 8), compression=compression, n_jobs=n_jobs,
+        attrs={"t_r": 2.0},
+    )
+
+    assert isinstance(store, ChunkedArray)
+    assert store.shape == run.shape and store.dtype == run.dtype
+    assert store.attrs == {"t_r": 2.0}
+    np.testing.assert_array_equal(np.asarray(store), run)
+    assert len(os.listdir(path)) == 3 * 3 * 2 * 4 + 1
+
+
+def test_partial_reads(run, tmp_path):
+    """Test basic indexing, reading only the overlapping chunks."""
+    store = save_chunked(tmp_path / "run.store", run, chunks=(4, 4, 4, 8))
+    read = []
+    original = store.read_chunk
+    store.read_chunk = lambda index: read.append(index) or original(index)
+
+    np.testing.assert_array_equal(store[..., 9:15], run[..., 9:15])
+    assert {index[3] for index in read} == {1}
+
+    for key in [
+        (slice(2, 9), 3, slice(None), -1),
+        (slice(None, None, -3), slice(1, 8, 2)),
+        (5,),
+        (slice(4, 4),),
+    ]:
+        np.testing.assert_array_equal(store[key], run[key])
+    with pytest.raises(IndexError):
+        store[11]
+
+
+def test_rewrite_replaces_store(run, tmp_path):
+    """Test that writing over a store leaves no stale chunks."""
+    path = tmp_path / "run.store"
+    save_chunked(path, run, chunks=(2, 2, 2, 2))
+    save_chunked(path, run[:4], chunks=(4, 9, 7, 30), compression="lzma")
+
+    store = open_chunked(path)
+    np.testing.assert_array_equal(store[...], run[:4])
+    assert sorted(os.listdir(path)) == ["c0.0.0.0", "index.json"]
+    with open(path / "index.json") as f:
+        assert json.load(f)["compression"] == "lzma"
+
+    (tmp_path / "other").mkdir()
+    with pytest.raises(ValueError):
+        save_chunked(tmp_path / "other", run)
+
+
+def test_load_dataset_and_roi_extraction(run, tmp_path):
+    """Test that stores open lazily and ROI extraction reads only their box."""
+    path = str(tmp_path / "run.store")
+    save_chunked(path, run, chunks=(4, 4, 4, 10))
+    atlas = np.zeros(run.shape[:3], dtype=int)
+    atlas[1:3, 1:3, 1:3] = 1
+    atlas[2:4, 5:7, 1:3] = 2
+
+    store = load_dataset(path)
+    assert isinstance(store, ChunkedArray)
+    read = []
+    original = store.read_chunk
+    store.read_chunk = lambda index: read.append(index) or original(index)
+
+    roi_data, labels = extract_roi_timeseries(store, atlas)
+    expected, _ = extract_roi_timeseries(run, atlas)
+    np.testing.assert_allclose(roi_data, expected, rtol=1e-6)
+    assert {index[:3] for index in read} == {(0, 0, 0), (0, 1, 0)}
+
+    loaded = load_dataset(path, dtype=np.float64)
+    assert isinstance(loaded, np.ndarray) and loaded.dtype == np.float64
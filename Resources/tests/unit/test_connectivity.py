@@ -0,0 +1,195 @@
+"""
+Unit tests for functional connectivity analysis.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.analysis import functional_connectivity as fc
+from cog_neuro.imaging import nifti
+
+
+@pytest.fixture
+def atlas_data():
+    """A random 4D run and a label volume with gaps in its label values."""
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((10, 9, 8, 30))
+    labels = rng.choice([0, 1, 2, 5, 9, 12], size=data.shape[:3])
+    return data, labels
+
+
+def test_extract_roi_timeseries_matches_masking(atlas_data):
+    """Test that vectorized extraction matches per-ROI masking."""
+    data, labels = atlas_data
+
+    roi_data, roi_labels = fc.extract_roi_timeseries(data, labels, block_size=7)
+
+    np.testing.assert_array_equal(roi_labels, [1, 2, 5, 9, 12])
+    expected = np.array([data[labels == value].mean(axis=0) for value in roi_labels])
+    np.testing.assert_allclose(roi_data, expected)
+
+    fortran, _ = fc.extract_roi_timeseries(np.asfortranarray(data), labels)
+    np.testing.assert_allclose(fortran, expected)
+
+
+def test_compute_correlation_matrix_with_atlas_file(atlas_data, tmp_path):
+    """Test that an atlas can be given as a NIfTI path."""
+    data, labels = atlas_data
+    path = str(tmp_path / "atlas.nii")
+    nifti.save_nifti(path, labels.astype(np.int16))
+
+    matrix = fc.compute_correlation_matrix(data, atlas=path)
+
+    roi_data, _ = fc.extract_roi_timeseries(data, labels)
+    np.testing.assert_allclose(matrix, np.corrcoef(roi_data))
+    assert matrix.shape == (5, 5)
+
+
+def test_compute_correlation_matrix_rejects_bad_atlas(atlas_data):
+    """Test that unknown atlases and mismatched shapes are rejected."""
+    data, labels = atlas_data
+    with pytest.raises(ValueError):
+        fc.compute_correlation_matrix(data, atlas="harvard_oxford")
+    with pytest.raises(ValueError):
+        fc.compute_correlation_matrix(data, atlas=labels[:-1])
+
+
+def test_atlas_index_is_cached(atlas_data):
+    """Test that label indices are reused for identical atlases."""
+    _, labels = atlas_data
+    assert fc.atlas_index(labels) is fc.atlas_index(labels.copy())
+
+
+def test_streaming_connectivity_matches_corrcoef():
+    """Test that block and single-sample updates match np.corrcoef."""
+    rng = np.random.default_rng(1)
+    roi_data = rng.standard_normal((6, 120)) + 1e4
+
+    acc = fc.StreamingConnectivity()
+    for start in range(0, 100, 17):
+        acc.update(roi_data[:, start:min(start + 17, 100)])
+    for t in range(100, 120):
+        acc.update(roi_data[:, t])
+
+    assert acc.n_samples == 120
+    np.testing.assert_allclose(acc.correlation(), np.corrcoef(roi_data), atol=1e-10)
+    np.testing.assert_allclose(acc.covariance(), np.cov(roi_data), rtol=1e-8)
+
+
+def test_streaming_connectivity_merge(atlas_data):
+    """Test that merged per-run accumulators match the concatenated runs."""
+    data, labels = atlas_data
+    runs = [data[..., :12], data[..., 12:]]
+
+    merged = fc.StreamingConnectivity(atlas=labels)
+    for run in runs:
+        merged.merge(fc.StreamingConnectivity(atlas=labels).update(run))
+
+    roi_data, _ = fc.extract_roi_timeseries(data, labels)
+    np.testing.assert_allclose(merged.correlation(), np.corrcoef(roi_data), atol=1e-10)
+
+
+def test_batch_correlation_matches_corrcoef():
+    """Test batched correlations for stacked and iterated subjects."""
+    rng = np.random.default_rng(2)
+    subjects = rng.standard_normal((7, 5, 40))
+    expected = np.array([np.corrcoef(s) for s in subjects])
+
+    full = fc.batch_correlation(subjects, chunk_size=3, packed=False, dtype=np.float64)
+    np.testing.assert_allclose(full, expected, atol=1e-12)
+
+    packed = fc.batch_correlation(iter(subjects), chunk_size=4)
+    assert packed.shape == (7, 10) and packed.dtype == np.float32
+    np.testing.assert_allclose(fc.unpack_upper(packed), expected, atol=1e-6)
+    np.testing.assert_allclose(fc.compute_correlation_matrix(subjects), expected)
+
+    ragged = [subjects[0], subjects[1, :, :30]]
+    np.testing.assert_allclose(
+        fc.batch_correlation(ragged, dtype=np.float64)[1],
+        fc.pack_upper(np.corrcoef(subjects[1, :, :30])),
+    )
+
+
+def test_group_connectivity_streams_fisher_z_statistics():
+    """Test streaming group statistics against a direct computation."""
+    rng = np.random.default_rng(3)
+    subjects = rng.standard_normal((10, 4, 25))
+    z = fc.fisher_z(fc.batch_correlation(subjects, dtype=np.float64))
+
+    group = fc.GroupConnectivity()
+    for chunk in fc.iter_batch_correlation(subjects[:6], chunk_size=4):
+        group.update(chunk)
+    group.merge(fc.GroupConnectivity().update(fc.batch_correlation(subjects[6:])))
+
+    assert group.n_subjects == 10
+    np.testing.assert_allclose(group.mean, z.mean(axis=0), atol=1e-6)
+    np.testing.assert_allclose(group.variance(), z.var(axis=0, ddof=1), atol=1e-6)
+    np.testing.assert_allclose(group.mean_correlation(), np.tanh(z.mean(axis=0)), atol=1e-6)
+
+
+@pytest.mark.parametrize("step", [1, 3])
+def test_sliding_window_correlation_matches_corrcoef(step):
+    """Test running window sums against per-window np.corrcoef."""
+    rng = np.random.default_rng(4)
+    roi_data = rng.standard_normal((5, 100)) + 50.0
+
+    result = fc.sliding_window_correlation(roi_data, window=20, step=step)
+
+    starts = range(0, 100 - 20 + 1, step)
+    expected = np.array([fc.pack_upper(np.corrcoef(roi_data[:, s:s + 20])) for s in starts])
+    assert result.dtype == np.float32 and result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, atol=1e-5)
+
+
+def test_sliding_window_correlation_taper_and_out(tmp_path):
+    """Test tapered windows and writing into a memmap."""
+    rng = np.random.default_rng(5)
+    roi_data = rng.standard_normal((4, 60))
+    n = fc.n_windows(60, 15, 2)
+    out = np.lib.format.open_memmap(
+        str(tmp_path / "dfc.npy"), mode="w+", dtype=np.float32, shape=(n, 6)
+    )
+
+    fc.sliding_window_correlation(roi_data, 15, step=2, taper="hamming", out=out)
+
+    weights = np.hamming(15)
+    window = roi_data[:, 4:19]
+    cov = np.cov(window, aweights=weights)
+    expected = fc.pack_upper(cov / np.sqrt(np.outer(np.diag(cov), np.diag(cov))))
+    np.testing.assert_allclose(out[2], expected, atol=1e-6)
+
+    flat = fc.sliding_window_correlation(roi_data, 15, step=2, taper=np.ones(15))
+    np.testing.assert_allclose(flat, fc.sliding_window_correlation(roi_data, 15, 2), atol=1e-6)
+
+
+def test_pool_matrix_handles_edges_and_nan():
+    """Test mean and signed max pooling with partial blocks and NaN cells."""
+    matrix = np.arange(25, dtype=float).reshape(5, 5) - 12
+    matrix[0, 0] = np.nan
+
+    mean = fc._pool_matrix(matrix, 2, "mean")
+    assert mean.shape == (3, 3)
+    assert mean[0, 0] == pytest.approx(np.nanmean(matrix[:2, :2]))
+    assert mean[2, 2] == matrix[4, 4]
+    peak = fc._pool_matrix(matrix, 2, "max")
+    assert peak[0, 0] == -11
+    assert peak[2, 1] == 11
+
+
+def test_plot_matrix_level_of_detail(tmp_path):
+    """Test that large matrices skip per-cell artists and render to PNG."""
+    rng = np.random.default_rng(0)
+    matrix = np.corrcoef(rng.standard_normal((1000, 50)))
+    networks = ["visual"] * 300 + ["motor"] * 200 + ["default"] * 500
+    path = tmp_path / "fc.png"
+
+    fig = fc.plot_matrix(matrix, networks=networks, filepath=str(path), figsize=(4, 4))
+    ax = fig.axes[0]
+    assert path.stat().st_size > 0
+    assert ax.images[0].get_array().shape == (334, 334)
+    assert [t.get_text() for t in ax.get_xticklabels()] == ["visual", "motor", "default"]
+    assert len(ax.get_xticks(minor=True)) == 0
+
+    small = fc.plot_matrix(matrix[:10, :10], roi_labels=[str(i) for i in range(10)])
+    assert len(small.axes[0].get_xticks(minor=True)) == 11
+    with pytest.raises(ValueError):
+        fc.plot_matrix(matrix, pool="median")
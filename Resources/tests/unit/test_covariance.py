@@ -0,0 +1,97 @@
+"""
+Unit tests for covariance-based connectivity measures.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.analysis import covariance
+from cog_neuro.analysis.functional_connectivity import compute_correlation_matrix
+
+
+@pytest.fixture
+def subjects():
+    rng = np.random.default_rng(0)
+    mixing = rng.standard_normal((6, 6))
+    return np.einsum("ij,sjt->sit", mixing, rng.standard_normal((5, 6, 30)))
+
+
+def _ledoit_wolf_reference(x):
+    """Single-subject Ledoit-Wolf, written out as in the original paper."""
+    x = x - x.mean(axis=1, keepdims=True)
+    p, n = x.shape
+    emp = x @ x.T / n
+    mu = np.trace(emp) / p
+    target = mu * np.eye(p)
+    delta = np.sum((emp - target) ** 2) / p
+    beta = sum(np.sum((np.outer(x[:, t], x[:, t]) - emp) ** 2) for t in range(n)) / (n ** 2 * p)
+    shrinkage = min(beta, delta) / delta
+    return (1 - shrinkage) * emp + shrinkage * target, shrinkage
+
+
+def test_ledoit_wolf_matches_reference(subjects):
+    """Test batched shrinkage against a per-subject implementation."""
+    covariances, shrinkages = covariance.ledoit_wolf(subjects)
+
+    for subject, cov, shrinkage in zip(subjects, covariances, shrinkages):
+        expected_cov, expected_shrinkage = _ledoit_wolf_reference(subject)
+        np.testing.assert_allclose(cov, expected_cov, rtol=1e-10)
+        assert shrinkage == pytest.approx(expected_shrinkage)
+        assert 0 <= shrinkage <= 1
+
+
+def test_partial_correlation(subjects):
+    """Test partial correlations against an explicit inversion."""
+    batch = compute_correlation_matrix(subjects, method="partial")
+
+    cov, _ = covariance.ledoit_wolf(subjects[1])
+    precision = np.linalg.inv(cov)
+    d = np.sqrt(np.diag(precision))
+    expected = -precision / np.outer(d, d)
+    np.fill_diagonal(expected, 1.0)
+    np.testing.assert_allclose(batch[1], expected, atol=1e-12)
+    np.testing.assert_allclose(
+        compute_correlation_matrix(subjects[1], method="partial"), expected, atol=1e-12
+    )
+
+
+def test_rank_data_averages_ties():
+    """Test ranks with ties across several series at once."""
+    data = np.array([[3.0, 1.0, 3.0, 2.0], [0.0, 0.0, 0.0, 5.0]])
+    np.testing.assert_array_equal(
+        covariance.rank_data(data), [[3.5, 1.0, 3.5, 2.0], [2.0, 2.0, 2.0, 4.0]]
+    )
+
+
+def test_spearman_matches_pearson_on_ranks(subjects):
+    """Test Spearman correlations for one subject and a batch."""
+    # Without ties, ranks are the inverse permutation of the sort order.
+    ranks = subjects[0].argsort(axis=-1).argsort(axis=-1)
+    single = compute_correlation_matrix(subjects[0], method="spearman")
+    np.testing.assert_allclose(single, np.corrcoef(ranks))
+
+    rounded = np.round(subjects)  # introduce ties
+
+    batch = compute_correlation_matrix(rounded, method="spearman")
+    expected = [np.corrcoef(covariance.rank_data(s)) for s in rounded]
+    np.testing.assert_allclose(batch, expected, atol=1e-12)
+
+
+def test_tangent_space(subjects):
+    """Test the tangent map at the reference and its default reference."""
+    vectors, reference = covariance.tangent_space(subjects)
+    assert vectors.shape == (5, 6, 6)
+    np.testing.assert_allclose(vectors, vectors.transpose(0, 2, 1), atol=1e-10)
+
+    # The log-Euclidean mean is positive definite and symmetric.
+    assert np.all(np.linalg.eigvalsh(reference) > 0)
+
+    # A subject's own covariance as reference maps it to zero.
+    cov, _ = covariance.ledoit_wolf(subjects[2])
+    at_self = compute_correlation_matrix(subjects, method="tangent", reference=cov)
+    np.testing.assert_allclose(at_self[2], 0, atol=1e-10)
+
+
+def test_unknown_method_is_rejected(subjects):
+    """Test that unsupported methods raise."""
+    with pytest.raises(ValueError):
+        compute_correlation_matrix(subjects[0], method="kendall")
@@ -0,0 +1,160 @@
+"""
+Unit tests for batched graph-theory metrics.
+"""
+
+import itertools
+import tracemalloc
+import numpy as np
+import pytest
+from cog_neuro.analysis import graph
+
+
+@pytest.fixture
+def matrices():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((4, 12, 40))
+    x[:, 6:] += 1.5 * rng.standard_normal((4, 1, 40))
+    x[:, :6] += 1.5 * rng.standard_normal((4, 1, 40))
+    return np.stack([np.corrcoef(s) for s in x])
+
+
+def _distances_reference(a, weighted):
+    """Single-graph Floyd-Warshall with Python loops."""
+    n = len(a)
+    d = np.full((n, n), np.inf)
+    for i, j in itertools.product(range(n), repeat=2):
+        if i == j:
+            d[i, j] = 0
+        elif a[i, j] > 0:
+            d[i, j] = 1 / a[i, j] if weighted else 1
+    for k, i, j in itertools.product(range(n), repeat=3):
+        d[i, j] = min(d[i, j], d[i, k] + d[k, j])
+    return d
+
+
+def _efficiency_reference(a, weighted=False):
+    n = len(a)
+    if n < 2:
+        return 0.0
+    d = _distances_reference(a, weighted)
+    return sum(1 / d[i, j] for i in range(n) for j in range(n) if i != j) / (n * (n - 1))
+
+
+def test_threshold_matrices(matrices):
+    """Test proportional and absolute thresholds over several levels."""
+    n_edges = 12 * 11 // 2
+    graphs = graph.threshold_matrices(matrices, density=[0.1, 0.25, 1.0], binarize=True)
+    assert graphs.shape == (4, 3, 12, 12)
+    counts = graph.pack_upper(graphs).sum(axis=-1)
+    expected = np.round(np.array([0.1, 0.25, 1.0]) * n_edges)
+    np.testing.assert_array_equal(counts, np.broadcast_to(expected, (4, 3)))
+    np.testing.assert_array_equal(graphs, graphs.swapaxes(-1, -2))
+
+    single = graph.threshold_matrices(matrices[0], density=0.1)
+    kept = graph.pack_upper(matrices[0])[graph.pack_upper(single) != 0]
+    assert kept.min() >= np.sort(graph.pack_upper(matrices[0]))[-len(kept)]
+
+    weighted = graph.threshold_matrices(matrices, threshold=[0.3], absolute=True)
+    expected = np.where(np.abs(matrices[0]) >= 0.3, matrices[0], 0)
+    np.fill_diagonal(expected, 0)
+    np.testing.assert_allclose(weighted[0, 0], expected)
+
+    with pytest.raises(ValueError):
+        graph.threshold_matrices(matrices, density=0.1, threshold=0.3)
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_metrics_match_reference(matrices, weighted):
+    """Test node and global metrics against single-graph loops."""
+    graphs = graph.threshold_matrices(matrices, density=[0.15, 0.3], binarize=not weighted)
+    clustering = graph.clustering_coefficient(graphs, weighted=weighted)
+    efficiency = graph.global_efficiency(graphs, weighted=weighted)
+    local = graph.local_efficiency(graphs)
+
+    for s, level in itertools.product(range(4), range(2)):
+        a = graphs[s, level]
+        b = a != 0
+        top = a.max()
+        for i in range(12):
+            nb = np.flatnonzero(b[i])
+            k = len(nb)
+            if weighted:
+                w = np.cbrt(a / top)
+                tri = sum(w[i, j] * w[j, h] * w[h, i] for j in nb for h in nb)
+            else:
+                tri = sum(b[j, h] for j in nb for h in nb)
+            expected = tri / (k * (k - 1)) if k > 1 else 0
+            assert clustering[s, level, i] == pytest.approx(expected)
+            assert local[s, level, i] == pytest.approx(
+                _efficiency_reference(b[np.ix_(nb, nb)].astype(float))
+            )
+        assert efficiency[s, level] == pytest.approx(_efficiency_reference(a, weighted))
+
+    np.testing.assert_array_equal(graph.degree(graphs), (graphs != 0).sum(axis=-1))
+
+
+def test_modularity_finds_modules():
+    """Test that two disconnected cliques are separated with Q = 0.5."""
+    a = np.zeros((10, 10))
+    a[:5, :5] = a[5:, 5:] = 1
+    np.fill_diagonal(a, 0)
+    perm = np.random.default_rng(1).permutation(10)
+    stack = np.stack([a, a[np.ix_(perm, perm)]])
+
+    q, communities = graph.modularity(stack)
+    np.testing.assert_allclose(q, 0.5)
+    assert len(set(communities[0, :5])) == 1 and communities[0, 0] != communities[0, 5]
+    first = perm < 5
+    assert len(set(communities[1, first])) == len(set(communities[1, ~first])) == 1
+    assert communities[1, first][0] != communities[1, ~first][0]
+
+    q_given, _ = graph.modularity(a, communities=np.repeat([3, 7], 5))
+    assert q_given == pytest.approx(0.5)
+    q_single, _ = graph.modularity(a, communities=np.zeros(10, dtype=int))
+    assert q_single == pytest.approx(0.0)
+
+
+def test_graph_metrics(matrices):
+    """Test the combined metrics over subjects and densities."""
+    result = graph.graph_metrics(matrices, density=[0.2, 0.4])
+    assert result.degree.shape == (4, 2, 12)
+    assert result.global_efficiency.shape == result.modularity.shape == (4, 2)
+    np.testing.assert_array_equal(result.degree, result.strength)
+    assert np.all(result.modularity > 0)
+
+
+def test_graph_metrics_signed_weights(matrices):
+    """Test that negative weights kept by a dense threshold are dropped."""
+    result = graph.graph_metrics(matrices, density=0.9, weighted=True)
+    graphs = np.maximum(graph.threshold_matrices(matrices, density=0.9), 0)
+    assert np.all(result.strength >= 0) and np.all(result.clustering >= 0)
+    assert np.all(result.modularity <= 1)
+    np.testing.assert_allclose(result.strength, graph.strength(graphs))
+    np.testing.assert_allclose(
+        result.clustering, graph.clustering_coefficient(graphs, weighted=True)
+    )
+    np.testing.assert_allclose(result.modularity, graph.modularity(graphs)[0])
+
+
+def _peak_memory(function, *args, **kwargs):
+    """Peak bytes traced by tracemalloc during one call."""
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_graph_metrics_memory_is_bounded():
+    """Test that memory does not grow with the thresholded stack."""
+    rng = np.random.default_rng(2)
+    x = rng.standard_normal((32, 60, 50))
+    # Repeat the same matrices so that every chunk costs the same.
+    matrices = np.tile(np.einsum("sit,sjt->sij", x, x) / 50, (12, 1, 1))
+    densities = [0.03, 0.05]
+    small = _peak_memory(graph.graph_metrics, matrices[:64], density=densities)
+    large = _peak_memory(graph.graph_metrics, matrices, density=densities)
+    # The thresholded graphs of the extra matrices, if held all at once.
+    extra_stack = matrices[64:].nbytes * len(densities)
+    assert large - small < extra_stack / 4
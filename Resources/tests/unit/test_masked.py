@@ -0,0 +1,107 @@
+"""
+Unit tests for masked voxel time series.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.analysis import (
+    extract_roi_timeseries,
+    seed_to_voxel,
+    voxelwise_connectivity,
+)
+from cog_neuro.imaging import save_nifti, standard_pipeline
+from cog_neuro.utils import MaskedTimeSeries
+
+
+@pytest.fixture
+def run():
+    """A 4D run that is zero outside an ellipsoidal brain mask."""
+    rng = np.random.default_rng(0)
+    x, y, z = np.meshgrid(*(np.linspace(-1, 1, n) for n in (9, 8, 7)), indexing="ij")
+    mask = x ** 2 + y ** 2 + z ** 2 < 0.8
+    data = rng.standard_normal(mask.shape + (30,)) + 100
+    data[~mask] = 0
+    return data, mask
+
+
+@pytest.mark.parametrize("layout", ["voxels", "time"])
+def test_round_trip(run, layout):
+    """Test that gathering and scattering reproduce the dense run."""
+    data, mask = run
+    masked = MaskedTimeSeries.from_volume(data, layout=layout, block_size=7)
+
+    np.testing.assert_array_equal(masked.mask, mask)
+    assert masked.dtype == np.float32
+    assert masked.shape == data.shape
+    assert masked.series.shape == (mask.sum(), 30)
+    np.testing.assert_allclose(masked.to_volume(block_size=4), data, rtol=1e-6)
+    np.testing.assert_allclose(masked.volume(-1), data[..., -1], rtol=1e-6)
+
+
+def test_time_slices_are_views(run):
+    """Test that time slicing shares the buffer."""
+    data, _ = run
+    masked = MaskedTimeSeries.from_volume(data)
+    part = masked[5:10]
+
+    assert part.n_timepoints == 5
+    assert np.shares_memory(part.data, masked.data)
+    np.testing.assert_allclose(part.to_volume(), data[..., 5:10], rtol=1e-6)
+    assert masked[3].n_timepoints == 1
+    with pytest.raises(IndexError):
+        masked[30]
+
+
+def test_from_nifti(run, tmp_path):
+    """Test reading the in-mask voxels of an image block by block."""
+    data, mask = run
+    path = str(tmp_path / "run.nii.gz")
+    affine = np.diag([2.0, 2.0, 2.0, 1.0])
+    save_nifti(path, data, affine=affine)
+
+    masked = MaskedTimeSeries.from_nifti(path, layout="time", block_size=8)
+    np.testing.assert_array_equal(masked.mask, mask)
+    np.testing.assert_array_equal(masked.affine, affine)
+    np.testing.assert_allclose(masked.to_volume(), data, rtol=1e-6)
+
+
+@pytest.mark.parametrize("layout", ["voxels", "time"])
+def test_pipeline_matches_dense(run, layout):
+    """Test that preprocessing the masked voxels matches the dense run."""
+    data, mask = run
+    masked = MaskedTimeSeries.from_volume(data, layout=layout)
+    confounds = np.random.default_rng(1).standard_normal((30, 2))
+    options = dict(
+        motion_correction=False, confound_regression=True, confounds=confounds,
+        high_pass=0.05,
+    )
+
+    result = standard_pipeline(masked, block_size=8, **options)
+    expected = standard_pipeline(data.astype(np.float32), **options)
+
+    assert isinstance(result, MaskedTimeSeries)
+    assert result.layout == layout
+    np.testing.assert_allclose(result.to_volume()[mask], expected[mask], atol=1e-3)
+
+
+def test_connectivity_accepts_masked(run):
+    """Test that connectivity functions use the masked voxels directly."""
+    data, mask = run
+    masked = MaskedTimeSeries.from_volume(data)
+    atlas = np.zeros(mask.shape, dtype=int)
+    atlas[:4], atlas[4:] = 1, 2
+
+    roi_data, labels = extract_roi_timeseries(masked, atlas)
+    np.testing.assert_array_equal(labels, [1, 2])
+    expected = [data[(atlas == label) & mask].mean(axis=0) for label in labels]
+    np.testing.assert_allclose(roi_data, expected, rtol=1e-6)
+
+    seed = np.zeros(mask.shape, dtype=bool)
+    seed[4, 4, 3] = True
+    np.testing.assert_allclose(
+        seed_to_voxel(masked, seed), seed_to_voxel(data, seed, mask=mask), atol=1e-5
+    )
+
+    maps = voxelwise_connectivity(masked, reduction="degree", threshold=0.2)
+    dense = voxelwise_connectivity(data, mask=mask, reduction="degree", threshold=0.2)
+    np.testing.assert_array_equal(maps.degree, dense.degree)
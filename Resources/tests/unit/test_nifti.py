@@ -0,0 +1,99 @@
+"""
+Unit tests for the NIfTI reader and writer.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.imaging import nifti, preprocess
+
+
+@pytest.fixture
+def run_data():
+    """Small synthetic 4D run."""
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((6, 5, 4, 7)).astype(np.float32)
+
+
+def test_load_dataset_memmaps_uncompressed(tmp_path, run_data):
+    """Test that uncompressed images are returned as a memmap with the right contents."""
+    path = str(tmp_path / "run.nii")
+    nifti.save_nifti(path, run_data, zooms=(2.0, 2.0, 2.5, 0.8))
+
+    data = preprocess.load_dataset(path)
+
+    assert isinstance(data, np.memmap)
+    assert data.shape == run_data.shape
+    np.testing.assert_array_equal(data, run_data)
+    np.testing.assert_array_equal(data[..., 3], run_data[..., 3])
+
+
+def test_load_dataset_gzip(tmp_path, run_data):
+    """Test that gzipped images are decoded into an in-memory array."""
+    path = str(tmp_path / "run.nii.gz")
+    nifti.save_nifti(path, run_data)
+
+    data = preprocess.load_dataset(path, dtype=np.float64)
+
+    assert not isinstance(data, np.memmap)
+    assert data.dtype == np.float64
+    np.testing.assert_allclose(data, run_data)
+
+
+def test_load_dataset_unsupported_format(tmp_path):
+    """Test that non-NIfTI files raise ValueError."""
+    path = tmp_path / "run.txt"
+    path.write_text("not an image")
+    with pytest.raises(ValueError):
+        preprocess.load_dataset(str(path))
+
+
+def test_nifti_image_streams_volumes(tmp_path, run_data):
+    """Test volume access and block iteration on a gzipped image."""
+    path = str(tmp_path / "run.nii.gz")
+    nifti.save_nifti(path, run_data, zooms=(2.0, 2.0, 2.5, 0.8))
+
+    with nifti.NiftiImage(path) as img:
+        assert img.compressed
+        assert img.shape == run_data.shape
+        assert img.zooms == pytest.approx((2.0, 2.0, 2.5, 0.8))
+        np.testing.assert_array_equal(img.get_volume(5), run_data[..., 5])
+        # Seeking backwards restarts the stream.
+        np.testing.assert_array_equal(img.get_volume(1), run_data[..., 1])
+        np.testing.assert_array_equal(img.get_volumes(2, 4), run_data[..., 2:4])
+        blocks = list(img.iter_volumes(block_size=3))
+
+    assert [block.shape[-1] for block in blocks] == [3, 3, 1]
+    np.testing.assert_array_equal(np.concatenate(blocks, axis=-1), run_data)
+
+
+def test_nifti_scaling_is_applied(tmp_path, run_data):
+    """Test that scl_slope and scl_inter are applied on read."""
+    path = str(tmp_path / "scaled.nii")
+    stored = np.round(run_data * 100).astype(np.int16)
+    nifti.save_nifti(path, stored)
+
+    # Patch the slope and intercept in the header.
+    with open(path, "r+b") as f:
+        f.seek(112)
+        f.write(np.array([0.5, 10.0], dtype="<f4").tobytes())
+
+    with nifti.NiftiImage(path) as img:
+        assert img.scaled
+        np.testing.assert_allclose(img.get_volume(0), stored[..., 0] * 0.5 + 10.0)
+
+    data = preprocess.load_dataset(path)
+    assert not isinstance(data, np.memmap)
+    np.testing.assert_allclose(data, stored * 0.5 + 10.0)
+
+
+def test_read_header_nifti2(tmp_path):
+    """Test that NIfTI-2 headers are written and parsed for large dimensions."""
+    path = str(tmp_path / "wide.nii")
+    data = np.zeros((40000, 1, 1), dtype=np.uint8)
+    nifti.save_nifti(path, data)
+
+    header = nifti.read_header(path)
+
+    assert header["version"] == 2
+    assert header["shape"] == (40000, 1, 1)
+    assert header["dtype"] == np.uint8
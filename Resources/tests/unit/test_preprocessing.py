@@ -62,4 +62,215 @@ def test_temporal_filtering():
     filtered_data = preprocess._apply_temporal_filtering(
         data, high_pass=0.01, low_pass=0.1
     )
-    assert filtered_data.shape == data.shape 
\ No newline at end of file
+    assert filtered_data.shape == data.shape 
+
+
+def test_standard_pipeline_chunked_matches_in_memory():
+    """Test that chunked mode gives the same result as the in-memory pipeline."""
+    data = np.random.randn(12, 10, 8, 20)
+
+    expected = preprocess.standard_pipeline(data)
+    chunked = preprocess.standard_pipeline(data, block_size=3)
+
+    assert chunked.shape == data.shape
+    np.testing.assert_allclose(chunked, expected, rtol=1e-10, atol=1e-10)
+
+
+def test_standard_pipeline_chunked_out_buffer(tmp_path):
+    """Test that chunked mode writes into a caller-provided float32 memmap."""
+    data = np.random.randn(12, 10, 8, 20)
+    out = np.lib.format.open_memmap(
+        str(tmp_path / "out.npy"), mode="w+", dtype=np.float32, shape=data.shape
+    )
+
+    result = preprocess.standard_pipeline(
+        data, block_size=4, out=out, dtype=np.float32
+    )
+
+    assert result is out
+    expected = preprocess.standard_pipeline(data, dtype=np.float32)
+    np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-5)
+
+    with pytest.raises(ValueError):
+        preprocess.standard_pipeline(data, out=np.empty((2, 2, 2, 2)))
+
+
+def test_spatial_smoothing_engines_agree():
+    """Test that the separable and FFT engines give the same result."""
+    data = np.zeros((16, 16, 12, 3))
+    data[8, 8, 6, :] = 1.0
+    data[..., 2] = np.random.randn(16, 16, 12)
+
+    separable = preprocess._apply_spatial_smoothing(
+        data, fwhm=6.0, voxel_size=(2.0, 2.0, 3.0), smoothing_method="separable"
+    )
+    fft = preprocess._apply_spatial_smoothing(
+        data, fwhm=6.0, voxel_size=(2.0, 2.0, 3.0), smoothing_method="fft", n_jobs=2
+    )
+
+    np.testing.assert_allclose(separable, fft, atol=1e-10)
+    # An impulse away from the borders keeps its mass and spreads symmetrically.
+    assert separable[..., 0].sum() == pytest.approx(1.0)
+    assert separable[7, 8, 6, 0] == pytest.approx(separable[9, 8, 6, 0])
+    assert separable[8, 8, 6, 0] < 1.0
+
+
+def test_temporal_filtering_removes_out_of_band_signal():
+    """Test that the FFT and cosine filters remove drifts and keep the mean."""
+    t_r, n_timepoints = 2.0, 200
+    t = np.arange(n_timepoints) * t_r
+    signal = np.sin(2 * np.pi * 0.05 * t)
+    drift = 3.0 * np.cos(2 * np.pi * 0.002 * t)
+    data = np.zeros((4, 3, 2, n_timepoints))
+    data[:] = 10.0 + signal + drift
+
+    for filter_method in ("fft", "cosine"):
+        filtered = preprocess._apply_temporal_filtering(
+            data, high_pass=0.01, t_r=t_r, filter_method=filter_method
+        )
+        np.testing.assert_allclose(
+            filtered.mean(axis=-1), data.mean(axis=-1), atol=1e-8
+        )
+        residual = (filtered[1, 1, 1] - filtered[1, 1, 1].mean()) - signal
+        # Ignore edge effects in the first and last 40 s.
+        assert np.abs(residual[20:-20]).max() < 0.15
+
+    band = preprocess._apply_temporal_filtering(
+        data, high_pass=0.01, low_pass=0.03, t_r=t_r
+    )
+    assert np.abs(band[0, 0, 0, 20:-20] - band[0, 0, 0].mean()).max() < 0.2
+
+
+def test_temporal_filtering_mask():
+    """Test that only in-mask voxels are filtered."""
+    data = np.random.randn(5, 4, 3, 60).astype(np.float32)
+    mask = np.zeros(data.shape[:3], dtype=bool)
+    mask[1:4, 1:3, 1] = True
+
+    filtered = preprocess._apply_temporal_filtering(
+        data, high_pass=0.02, low_pass=0.1, t_r=1.0, mask=mask
+    )
+    full = preprocess._apply_temporal_filtering(
+        data, high_pass=0.02, low_pass=0.1, t_r=1.0
+    )
+
+    assert filtered.dtype == np.float32
+    np.testing.assert_array_equal(filtered[~mask], data[~mask])
+    np.testing.assert_allclose(filtered[mask], full[mask], atol=1e-5)
+
+    chunked = preprocess.standard_pipeline(
+        data, motion_correction=False, spatial_smoothing=False,
+        block_size=2, high_pass=0.02, low_pass=0.1, t_r=1.0, mask=mask,
+    )
+    np.testing.assert_allclose(chunked, filtered, atol=1e-6)
+
+
+def _blob_volume(shape, voxel_size, params=None):
+    """Smooth synthetic volume, optionally moved by rigid-body ``params``."""
+    from cog_neuro.imaging import motion
+
+    grid = np.stack(np.meshgrid(*[np.arange(n) for n in shape], indexing="ij"))
+    center = (np.asarray(shape) - 1) / 2.0
+    mm = (grid.reshape(3, -1) - center[:, None]) * np.asarray(voxel_size)[:, None]
+    if params is not None:
+        rotation = motion.rotation_matrix(*params[3:])
+        mm = rotation.T @ (mm - np.asarray(params[:3])[:, None])
+    volume = np.zeros(mm.shape[1])
+    for blob, width in [((10, 5, 0), 8), ((-12, -6, 8), 10), ((0, 15, -10), 7)]:
+        volume += np.exp(-((mm - np.array(blob)[:, None]) ** 2).sum(0) / (2 * width ** 2))
+    return volume.reshape(shape)
+
+
+def test_motion_correction_recovers_rigid_motion():
+    """Test that rigid realignment recovers known motion, serially and in parallel."""
+    shape, voxel_size = (32, 32, 20), (3.0, 3.0, 3.5)
+    true_params = np.array([1.5, -2.0, 0.8, 0.03, -0.02, 0.05])
+    data = np.stack([
+        _blob_volume(shape, voxel_size),
+        _blob_volume(shape, voxel_size, true_params),
+        _blob_volume(shape, voxel_size, -true_params),
+    ], axis=-1)
+
+    corrected, params = preprocess._apply_motion_correction(
+        data, voxel_size=voxel_size, return_params=True
+    )
+
+    assert params.shape == (3, 6)
+    np.testing.assert_allclose(params[0], 0.0, atol=1e-6)
+    np.testing.assert_allclose(params[1, :3], true_params[:3], atol=0.1)
+    np.testing.assert_allclose(params[1, 3:], true_params[3:], atol=0.005)
+    inner = (slice(4, -4),) * 3
+    before = np.abs(data[inner + (1,)] - data[inner + (0,)]).max()
+    after = np.abs(corrected[inner + (1,)] - data[inner + (0,)]).max()
+    assert after < 0.5 * before
+
+    parallel, parallel_params = preprocess._apply_motion_correction(
+        data, voxel_size=voxel_size, n_jobs=2, return_params=True
+    )
+    np.testing.assert_allclose(parallel, corrected)
+    np.testing.assert_allclose(parallel_params, params)
+
+    with pytest.raises(ValueError):
+        preprocess._apply_motion_correction(data, method="affine")
+
+
+def test_confound_regression_matches_least_squares():
+    """Test QR residualization against per-voxel least squares, in float32."""
+    from cog_neuro.imaging import confounds
+
+    rng = np.random.default_rng(0)
+    design = rng.standard_normal((40, 3))
+    design = np.hstack([design, design[:, :1]])  # rank deficient
+    data = (rng.standard_normal((4, 5, 3, 40)) + 10).astype(np.float32)
+
+    centered = design - design.mean(axis=0)
+    series = data.reshape(-1, 40).astype(np.float64)
+    beta, *_ = np.linalg.lstsq(centered, series.T, rcond=None)
+    expected = (series - (centered @ beta).T).reshape(data.shape)
+
+    out = data.copy()
+    result = confounds.regress_confounds(out, design, out=out)
+
+    assert result is out and out.dtype == np.float32
+    np.testing.assert_allclose(out, expected, atol=1e-4)
+    np.testing.assert_allclose(out.mean(axis=-1), data.mean(axis=-1), atol=1e-4)
+    assert confounds.confound_regressor(design) is confounds.confound_regressor(design.copy())
+    assert confounds.confound_regressor(design).rank == 3
+
+
+def test_standard_pipeline_regresses_motion_parameters(tmp_path):
+    """Test that motion estimates feed the confound stage in every mode."""
+    from cog_neuro.imaging import StageCache, confounds
+
+    shape, voxel_size = (16, 16, 10), (3.0, 3.0, 3.5)
+    rng = np.random.default_rng(1)
+    moves = rng.normal(scale=[0.5] * 3 + [0.01] * 3, size=(6, 6))
+    data = np.stack(
+        [_blob_volume(shape, voxel_size, p) for p in moves], axis=-1
+    ) + 0.01 * rng.standard_normal(shape + (6,))
+    options = dict(
+        spatial_smoothing=False, temporal_filtering=False, confound_regression=True,
+        voxel_size=voxel_size, pyramid_levels=2, motion_derivatives=False,
+    )
+
+    result = preprocess.standard_pipeline(data, **options)
+
+    corrected, params = preprocess._apply_motion_correction(
+        data, voxel_size=voxel_size, pyramid_levels=2, return_params=True
+    )
+    expected = confounds.regress_confounds(corrected, confounds.motion_confounds(params, False))
+    np.testing.assert_allclose(result, expected, atol=1e-8)
+
+    chunked = preprocess.standard_pipeline(data, block_size=4, **options)
+    np.testing.assert_allclose(chunked, expected, atol=1e-8)
+
+    cache = StageCache(str(tmp_path))
+    preprocess.standard_pipeline(data, cache=cache, **options)
+    cached = preprocess.standard_pipeline(data, cache=cache, **dict(options, preserve_mean=False))
+    np.testing.assert_allclose(
+        cached,
+        confounds.regress_confounds(
+            corrected, confounds.motion_confounds(params, False), preserve_mean=False
+        ),
+        atol=1e-8,
+    )
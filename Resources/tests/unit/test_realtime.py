@@ -0,0 +1,92 @@
+"""
+Unit tests for real-time, volume-by-volume preprocessing.
+"""
+
+import numpy as np
+import pytest
+from cog_neuro.imaging import OnlinePipeline, replay, save_nifti
+from cog_neuro.imaging.motion import resample_volume
+
+
+def _blob(shape=(20, 20, 16)):
+    """A smooth volume with enough structure to register."""
+    grid = np.meshgrid(*(np.arange(n) - (n - 1) / 2 for n in shape), indexing="ij")
+    radius = sum((g / s) ** 2 for g, s in zip(grid, (6.0, 4.0, 3.0)))
+    return 100 * np.exp(-radius) + 10 * np.exp(-((grid[0] - 3) ** 2 + grid[1] ** 2) / 8)
+
+
+def test_high_pass_removes_drift():
+    """Test that the causal filter removes a slow drift but keeps fast signal."""
+    t_r, n = 1.0, 200
+    t = np.arange(n) * t_r
+    fast = np.sin(2 * np.pi * 0.1 * t)
+    drift = 0.05 * t
+    pipeline = OnlinePipeline(
+        t_r=t_r, motion_correction=False, fwhm=None, high_pass=0.02
+    )
+    base = np.full((3, 3, 3), 50.0)
+    outputs = np.array([
+        pipeline.process(base + f + d).volume[1, 1, 1] for f, d in zip(fast, drift)
+    ])
+
+    settled = slice(100, None)
+    residual = outputs[settled] - fast[settled]
+    # The remaining drift is a constant lag, not a trend.
+    assert abs(np.polyfit(t[settled], residual, 1)[0]) < 0.005
+    assert np.corrcoef(outputs[settled], fast[settled])[0, 1] > 0.95
+    assert outputs[0] == pytest.approx(50.0)
+
+
+def test_masked_filter_leaves_outside_voxels():
+    """Test that only in-mask voxels are filtered."""
+    mask = np.zeros((4, 4, 4), dtype=bool)
+    mask[1:3, 1:3, 1:3] = True
+    pipeline = OnlinePipeline(motion_correction=False, fwhm=None, mask=mask)
+    for value in (1.0, 5.0):
+        volume = np.full(mask.shape, value)
+        result = pipeline.process(volume)
+    assert np.all(result.volume[~mask] == 5.0)
+    assert np.all(result.volume[mask] < 5.0)
+    assert np.all(volume == 5.0)
+
+
+def test_realignment_and_roi_signals():
+    """Test that moved volumes are realigned and ROI means are returned."""
+    reference = _blob()
+    atlas = np.zeros(reference.shape, dtype=int)
+    atlas[:10], atlas[10:] = 1, 2
+    pipeline = OnlinePipeline(
+        reference=reference, fwhm=None, high_pass=None, atlas=atlas,
+        latency_budget=0.0,
+    )
+
+    shifts = [(0, 0, 0, 0, 0, 0), (0.8, -0.5, 0.3, 0, 0, 0), (1.0, -0.4, 0.2, 0.02, 0, 0)]
+    for shift in shifts:
+        moved = resample_volume(reference, -np.asarray(shift), (1.0, 1.0, 1.0))
+        result = pipeline.process(moved)
+
+    np.testing.assert_allclose(result.motion_params[:3], shifts[-1][:3], atol=0.15)
+    expected = [result.volume[atlas == label].mean() for label in (1, 2)]
+    np.testing.assert_allclose(result.roi_signals, expected, rtol=1e-5)
+    assert pipeline.roi_timeseries.shape == (2, 3)
+    assert result.index == 2
+    assert set(result.timings) == {"motion_correction", "roi_signals"}
+
+    latency = pipeline.latency()
+    assert latency["n_volumes"] == 3
+    assert latency["over_budget"] == 3
+    assert latency["max"] >= latency["median"]
+
+
+def test_replay(tmp_path):
+    """Test that a recorded run is replayed volume by volume."""
+    rng = np.random.default_rng(0)
+    data = _blob()[..., np.newaxis] + rng.standard_normal(_blob().shape + (6,))
+    path = str(tmp_path / "run.nii.gz")
+    save_nifti(path, data, zooms=(2.0, 2.0, 2.0, 0.8))
+
+    results = list(replay(path, fwhm=4.0, motion_correction=False))
+    assert [r.index for r in results] == list(range(6))
+    assert results[0].volume.shape == data.shape[:3]
+    assert results[0].volume.dtype == np.float32
+    assert all(r.elapsed < 0.8 for r in results)
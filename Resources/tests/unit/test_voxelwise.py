@@ -0,0 +1,111 @@
+"""
+Unit tests for voxel-wise and seed-to-voxel connectivity.
+"""
+
+import tracemalloc
+import numpy as np
+import pytest
+from cog_neuro.analysis import voxelwise
+
+
+@pytest.fixture
+def data():
+    """A small run whose voxels share a few latent signals."""
+    rng = np.random.default_rng(0)
+    latent = rng.standard_normal((3, 40))
+    weights = rng.standard_normal((5 * 4 * 3, 3))
+    series = weights @ latent + 0.5 * rng.standard_normal((60, 40))
+    return series.reshape(5, 4, 3, 40)
+
+
+def _dense(data):
+    corr = np.corrcoef(data.reshape(-1, data.shape[-1]))
+    np.fill_diagonal(corr, np.nan)
+    return corr
+
+
+@pytest.mark.parametrize("n_jobs", [1, 3])
+def test_threshold_matches_dense(data, n_jobs):
+    """Test that thresholded tiles reproduce the dense matrix."""
+    result = voxelwise.voxelwise_connectivity(
+        data, threshold=0.4, tile_size=7, n_jobs=n_jobs
+    )
+
+    dense = _dense(data)
+    expected = np.where(dense >= 0.4, dense, 0)
+    np.testing.assert_allclose(result.to_dense(), expected, atol=1e-5)
+    assert np.all(np.diff(result.indptr) == (dense >= 0.4).sum(axis=1))
+
+
+def test_top_k_matches_dense(data):
+    """Test that each row keeps its k strongest neighbours in order."""
+    result = voxelwise.voxelwise_connectivity(
+        data, reduction="topk", k=4, absolute=True, tile_size=9, n_jobs=2
+    )
+
+    dense = np.abs(_dense(data))
+    dense[np.isnan(dense)] = -1
+    expected = np.sort(dense, axis=1)[:, ::-1][:, :4]
+    found = np.abs(result.data.reshape(-1, 4))
+    np.testing.assert_allclose(found, expected, atol=1e-5)
+
+
+def test_degree_maps_with_mask(data):
+    """Test degree and strength maps against the dense matrix."""
+    mask = np.zeros(data.shape[:-1], dtype=bool)
+    mask[1:4] = True
+
+    maps = voxelwise.voxelwise_connectivity(
+        data, mask=mask, reduction="degree", threshold=0.3, tile_size=5
+    )
+
+    dense = _dense(data[mask][:, None, None, :])
+    selected = dense >= 0.3
+    assert maps.degree.shape == mask.shape
+    np.testing.assert_array_equal(maps.degree[mask], selected.sum(axis=1))
+    np.testing.assert_allclose(
+        maps.strength[mask], np.where(selected, dense, 0).sum(axis=1), atol=1e-4
+    )
+    assert not maps.degree[~mask].any()
+
+
+def test_standardize_memory_is_bounded():
+    """Test that standardizing needs little more than its output and a block."""
+    rng = np.random.default_rng(0)
+    run = rng.standard_normal((20, 20, 25, 100)).astype(np.float32)
+    run[0, 0, 0] = 1.0
+    block_size = 512
+    block_bytes = block_size * run.shape[-1] * 8
+
+    tracemalloc.start()
+    try:
+        z, voxels = voxelwise.standardize(run, block_size=block_size)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert z.shape == (run[..., 0].size - 1, 100) and voxels[0] == 1
+    assert peak < z.nbytes + 3 * block_bytes
+    expected = run.reshape(-1, 100)[1:].astype(np.float64)
+    expected -= expected.mean(axis=1, keepdims=True)
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    np.testing.assert_allclose(z, expected, atol=1e-6)
+
+
+def test_seed_to_voxel(data):
+    """Test seed maps from a time series and from a seed region."""
+    series = data.reshape(-1, data.shape[-1])
+    seed = series[7]
+
+    result = voxelwise.seed_to_voxel(np.asfortranarray(data), seed, tile_size=11)
+
+    expected = np.corrcoef(seed, series)[0, 1:].reshape(data.shape[:-1])
+    np.testing.assert_allclose(result, expected, atol=1e-6)
+
+    region = np.zeros(data.shape[:-1], dtype=bool)
+    region[0, 0, :2] = True
+    mean_seed = data[region].mean(axis=0)
+    np.testing.assert_allclose(
+        voxelwise.seed_to_voxel(data, region),
+        voxelwise.seed_to_voxel(data, mean_seed),
+    )